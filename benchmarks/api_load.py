@@ -0,0 +1,100 @@
+"""
+Measure submit and status latency under concurrent clients
+
+By default the app runs in-process with TDS simulated by a fixed delay and
+Redis by fakeredis. Client, server and fake Redis then share one interpreter,
+so the numbers show how the API queues requests rather than absolute latency.
+Set API_URL to load a deployed service instead.
+
+    python benchmarks/api_load.py [clients] [requests_per_client] [tds_delay_s]
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from uuid import uuid4
+
+import httpx
+import numpy as np
+from fakeredis import FakeServer, FakeStrictRedis
+from fakeredis.aioredis import FakeRedis
+
+root = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "service"))
+
+import utils.rq_helpers as rq_helpers  # noqa: E402
+from api import app, get_redis, get_async_redis  # noqa: E402
+
+
+def percentiles(latencies):
+    p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+    return f"p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  (n={len(latencies)})"
+
+
+async def submit(client, request, latencies, ids, count):
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await client.post("/simulate", json=request)
+        latencies.append(time.perf_counter() - start)
+        ids.append(response.json()["simulation_id"])
+
+
+async def poll(client, ids, latencies, count):
+    for _ in range(count):
+        simulation_id = ids[-1] if ids else "missing"
+        start = time.perf_counter()
+        await client.get(f"/status/{simulation_id}")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.001)
+
+
+async def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    tds_delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    if "API_URL" in os.environ:
+        client_options = {"base_url": os.environ["API_URL"]}
+    else:
+
+        def create_tds_job(payload):
+            time.sleep(tds_delay)
+            return {"id": str(uuid4())}
+
+        rq_helpers.create_tds_job = create_tds_job
+        server = FakeServer()
+        app.dependency_overrides[get_redis] = lambda: FakeStrictRedis(server=server)
+        app.dependency_overrides[get_async_redis] = lambda: FakeRedis(server=server)
+        client_options = {
+            "base_url": "http://api",
+            "transport": httpx.ASGITransport(app=app),
+        }
+
+    with open(os.path.join(root, "tests/examples/simulate/input/request.json")) as f:
+        request = json.load(f)
+
+    submit_latencies, status_latencies, ids = [], [], []
+    async with httpx.AsyncClient(timeout=60, **client_options) as client:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[
+                submit(client, request, submit_latencies, ids, per_client)
+                for _ in range(clients)
+            ],
+            *[
+                poll(client, ids, status_latencies, per_client * 4)
+                for _ in range(clients)
+            ],
+        )
+        elapsed = time.perf_counter() - start
+
+    print(f"{clients} clients, simulated TDS delay {tds_delay * 1000:.0f} ms")
+    print(f"submit: {percentiles(submit_latencies)}")
+    print(f"status: {percentiles(status_latencies)}")
+    print(f"total:  {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
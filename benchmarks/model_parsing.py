@@ -0,0 +1,108 @@
+"""
+Compare decoding an AMR with floats against decoding it and walking it with the
+recursive shim_float it replaced
+
+    python benchmarks/model_parsing.py [num_strata]
+"""
+import json
+import numbers
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "service"))
+
+from utils.tds import loads_float, shim_float  # noqa: E402
+
+
+def recursive_shim_float(obj):
+    if type(obj) == dict:
+        for k, v in obj.items():
+            obj[k] = recursive_shim_float(v)
+    elif type(obj) == list:
+        for idx, v in enumerate(obj):
+            obj[idx] = recursive_shim_float(v)
+
+    if isinstance(obj, numbers.Number):
+        return float(obj)
+    else:
+        return obj
+
+
+def make_model(num_strata):
+    """SIR model stratified into `num_strata` groups that all infect each other"""
+    strata = [f"g{idx}" for idx in range(num_strata)]
+    states, transitions, parameters, initials, rates = [], [], [], [], []
+    for stratum in strata:
+        for name in "SIR":
+            states.append(
+                {
+                    "id": f"{name}_{stratum}",
+                    "name": name,
+                    "grounding": {
+                        "identifiers": {"ido": "0000514"},
+                        "modifiers": {"group": stratum},
+                    },
+                    "units": {"expression": "person", "expression_mathml": "<ci/>"},
+                }
+            )
+            initials.append(
+                {"target": f"{name}_{stratum}", "expression": 1000, "exponent": 1}
+            )
+        for source in strata:
+            tid = f"inf_{source}_{stratum}"
+            transitions.append(
+                {
+                    "id": tid,
+                    "input": [f"I_{source}", f"S_{stratum}"],
+                    "output": [f"I_{source}", f"I_{stratum}"],
+                    "properties": {"name": tid},
+                }
+            )
+            rates.append(
+                {
+                    "target": tid,
+                    "expression": f"S_{stratum}*I_{source}*beta_{source}_{stratum}",
+                    "expression_mathml": "<apply><times/><ci/><ci/></apply>",
+                }
+            )
+            parameters.append(
+                {
+                    "id": f"beta_{source}_{stratum}",
+                    "value": 1,
+                    "distribution": {
+                        "type": "Uniform1",
+                        "parameters": {"minimum": 0, "maximum": 2},
+                    },
+                }
+            )
+    return {
+        "header": {"name": "Stratified SIR", "schema_name": "petrinet"},
+        "model": {"states": states, "transitions": transitions},
+        "semantics": {
+            "ode": {
+                "rates": rates,
+                "initials": initials,
+                "parameters": parameters,
+                "observables": [],
+                "time": {"id": "t"},
+            }
+        },
+    }
+
+
+def main():
+    num_strata = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    content = json.dumps(make_model(num_strata)).encode()
+    print(f"{num_strata} strata, {len(content) / 1e6:.1f} MB")
+    for name, parse in [
+        ("recursive", lambda: recursive_shim_float(json.loads(content))),
+        ("iterative", lambda: shim_float(json.loads(content))),
+        ("decoder", lambda: loads_float(content)),
+    ]:
+        runs = timeit.repeat(parse, number=1, repeat=5)
+        print(f"{name:>10}: {min(runs) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compare the vectorized result summary against the pandas groupby it replaced
+
+    python benchmarks/result_summary.py [num_samples] [num_timepoints]
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "service"))
+
+from utils.tds import _grouped_result_summary, get_result_summary  # noqa: E402
+
+
+def make_result(num_samples, num_timepoints, num_columns=30):
+    rng = np.random.default_rng(0)
+    timepoint_id, sample_id = np.meshgrid(
+        np.arange(num_timepoints), np.arange(num_samples)
+    )
+    data = {
+        "timepoint_id": timepoint_id.ravel(),
+        "sample_id": sample_id.ravel(),
+        "timepoint_unknown": timepoint_id.ravel().astype(float),
+    }
+    for idx in range(num_columns):
+        data[f"column_{idx}_state"] = rng.random(timepoint_id.size)
+    return pd.DataFrame(data)
+
+
+def main():
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_timepoints = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+    data_result = make_result(num_samples, num_timepoints)
+    quantiles = (0.05, 0.25, 0.75, 0.95)
+    print(f"{len(data_result)} rows x {len(data_result.columns)} columns")
+    for name, summarize in [
+        ("groupby", _grouped_result_summary),
+        ("vectorized", get_result_summary),
+    ]:
+        for label, args in [("default", ()), ("with quantiles", (quantiles,))]:
+            runs = timeit.repeat(
+                lambda: summarize(data_result, *args), number=1, repeat=5
+            )
+            print(f"{name:>10} {label:>15}: {min(runs) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
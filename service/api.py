@@ -1,9 +1,16 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
 import os
-from fastapi import FastAPI, Depends
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Optional
+from fastapi import FastAPI, Depends, Header, Request, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from rq.job import Job
 
 from service.models import (
     Status,
@@ -13,10 +20,28 @@ from service.models import (
     EnsembleSimulate,
     EnsembleCalibrate,
     Optimize,
+    SimulateBatch,
+    BatchJobResponse,
     StatusSimulationIdGetResponse,
+    ScenariosSimulationIdGetResponse,
+    StatusQuery,
+    StatusGetResponse,
 )
 
-from utils.rq_helpers import get_redis, create_job, fetch_job_status, kill_job
+from settings import settings
+from utils.rq_helpers import (
+    get_redis,
+    get_async_redis,
+    get_stream_redis,
+    create_job,
+    create_batch_job,
+    fetch_job_statuses,
+    fetch_job_meta_async,
+    kill_job,
+)
+from utils.events import job_stream_key, user_stream_key, TERMINAL_EVENT_STATUSES
+from utils.scheduling import QUEUES, queue_wait_key, summarize_waits
+from utils.tds import connection_stats
 
 operations = {
     "simulate": Simulate,
@@ -53,48 +78,218 @@ def build_api(*args) -> FastAPI:
 
 app = build_api()
 
+# Submissions and cancellations talk to TDS synchronously. They get their own
+# threads so they can neither block the event loop nor starve status polling.
+submission_executor = ThreadPoolExecutor(
+    max_workers=settings.SUBMIT_CONCURRENCY, thread_name_prefix="submit"
+)
+
+
+async def run_blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(
+        submission_executor, partial(fn, *args)
+    )
+
+
+@lru_cache
+def get_version():
+    version_file = "../.version"
+    if os.path.exists(version_file):
+        return open(version_file).read().strip("\n")
+    return "unknown"
+
 
 @app.get("/health")
-def get_health():
+async def get_health():
     """
     Get health and version
     """
-    version_file = "../.version"
-    if os.path.exists(version_file):
-        version = open(version_file).read().strip("\n")
-    else:
-        version = "unknown"
-    return {"status": "ok", "git_sha": version}
+    return {
+        "status": "ok",
+        "git_sha": get_version(),
+        "connections": connection_stats(),
+    }
+
+
+@app.get("/metrics/queues")
+async def get_queue_metrics(redis_conn=Depends(get_async_redis)):
+    """
+    Get the length of every queue and how long its recent jobs waited to start
+    """
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        for queue_name in QUEUES:
+            pipe.llen(f"rq:queue:{queue_name}")
+            pipe.lrange(queue_wait_key(queue_name), 0, -1)
+        replies = await pipe.execute()
+    return {
+        queue_name: {"queued": queued, "wait": summarize_waits(waits)}
+        for queue_name, queued, waits in zip(QUEUES, replies[::2], replies[1::2])
+    }
+
+
+def simulation_not_found(simulation_id):
+    return Response(
+        status_code=status.HTTP_404_NOT_FOUND,
+        content=f"Simulation {simulation_id} not found",
+    )
 
 
 @app.get("/status/{simulation_id}", response_model=StatusSimulationIdGetResponse)
-def get_status(
-    simulation_id: str, redis_conn=Depends(get_redis)
+async def get_status(
+    simulation_id: str, redis_conn=Depends(get_async_redis)
 ) -> StatusSimulationIdGetResponse:
     """
     Retrieve the status of a simulation
     """
-    status, error_msg = fetch_job_status(simulation_id, redis_conn)
-    logging.info(status)
-    if not isinstance(status, str):
-        return status
+    statuses = await fetch_job_statuses([simulation_id], redis_conn)
+    job_status, error_msg = statuses[simulation_id]
+    logging.info(job_status)
+    if job_status is None:
+        return simulation_not_found(simulation_id)
+
+    return {
+        "status": Status.from_rq(job_status),
+        "error_msg": error_msg,
+    }
+
+
+@app.post("/status", response_model=StatusGetResponse)
+async def get_statuses(
+    body: StatusQuery, redis_conn=Depends(get_async_redis)
+) -> StatusGetResponse:
+    """
+    Retrieve the status of many simulations at once
+    """
+    statuses = await fetch_job_statuses(body.simulation_ids, redis_conn)
+    response = []
+    for simulation_id in body.simulation_ids:
+        job_status, error_msg = statuses[simulation_id]
+        response.append(
+            {
+                "simulation_id": simulation_id,
+                "status": Status.from_rq(job_status) if job_status else None,
+                "error_msg": error_msg,
+            }
+        )
+    return {"statuses": response}
+
 
+@app.get(
+    "/status/{simulation_id}/scenarios",
+    response_model=ScenariosSimulationIdGetResponse,
+)
+async def get_scenario_statuses(
+    simulation_id: str, redis_conn=Depends(get_async_redis)
+) -> ScenariosSimulationIdGetResponse:
+    """
+    Retrieve the status of a batch simulation and each of its scenarios
+    """
+    statuses = await fetch_job_statuses([simulation_id], redis_conn)
+    job_status, error_msg = statuses[simulation_id]
+    if job_status is None:
+        return simulation_not_found(simulation_id)
+
+    meta = await fetch_job_meta_async(simulation_id, redis_conn)
     return {
-        "status": Status.from_rq(status),
+        "status": Status.from_rq(job_status),
         "error_msg": error_msg,
+        "scenarios": [
+            {"simulation_id": scenario_id, **scenario}
+            for scenario_id, scenario in meta.get("scenarios", {}).items()
+        ],
     }
 
 
+async def relay_events(request, redis_conn, key, last_event_id, stop_on_terminal):
+    """Relay the entries of a Redis stream as server-sent events."""
+    if last_event_id == "$":
+        # Pin "only new events" to an id so nothing is missed between reads
+        latest = await redis_conn.xrevrange(key, count=1)
+        last_event_id = latest[0][0].decode() if latest else "0-0"
+    while not await request.is_disconnected():
+        replies = await redis_conn.xread(
+            {key: last_event_id}, count=100, block=settings.EVENT_STREAM_BLOCK_MS
+        )
+        if not replies:
+            if stop_on_terminal and not await redis_conn.exists(key):
+                # The stream expired, no final status is coming anymore
+                return
+            yield ": keep-alive\n\n"
+            continue
+        for entry_id, fields in replies[0][1]:
+            last_event_id = entry_id.decode()
+            event, data = fields[b"event"].decode(), fields[b"data"].decode()
+            yield f"id: {last_event_id}\nevent: {event}\ndata: {data}\n\n"
+            if (
+                stop_on_terminal
+                and event == "status"
+                and json.loads(data)["status"] in TERMINAL_EVENT_STATUSES
+            ):
+                return
+
+
+def event_stream(request, redis_conn, key, last_event_id, stop_on_terminal):
+    return StreamingResponse(
+        relay_events(request, redis_conn, key, last_event_id, stop_on_terminal),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/stream/{simulation_id}")
+async def stream_job_events(
+    simulation_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    redis_conn=Depends(get_stream_redis),
+):
+    """
+    Stream status transitions and progress of a simulation as server-sent
+    events. The stream replays past events (or those after `Last-Event-ID`)
+    and ends once the simulation reaches a final status.
+    """
+    key = job_stream_key(simulation_id)
+    if not await redis_conn.exists(key, Job.key_for(simulation_id)):
+        return simulation_not_found(simulation_id)
+    return event_stream(
+        request,
+        redis_conn,
+        key,
+        last_event_id or "0-0",
+        stop_on_terminal=True,
+    )
+
+
+@app.get("/stream/users/{user_id}")
+async def stream_user_events(
+    user_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    redis_conn=Depends(get_stream_redis),
+):
+    """
+    Stream status transitions and progress of all simulations of a user as
+    server-sent events, starting after `Last-Event-ID` or with new events.
+    """
+    return event_stream(
+        request,
+        redis_conn,
+        user_stream_key(user_id),
+        last_event_id or "$",
+        stop_on_terminal=False,
+    )
+
+
 @app.get(
     "/cancel/{simulation_id}", response_model=StatusSimulationIdGetResponse
 )  # NOT IN SPEC
-def cancel_job(
+async def cancel_job(
     simulation_id: str, redis_conn=Depends(get_redis)
 ) -> StatusSimulationIdGetResponse:
     """
     Cancel a simulation
     """
-    status = kill_job(simulation_id, redis_conn)
+    status = await run_blocking(kill_job, simulation_id, redis_conn)
     logging.info(status)
     if not isinstance(status, str):
         return status
@@ -106,13 +301,24 @@ for operation_name, schema in operations.items():
     registrar = app.post(f"/{operation_name}", response_model=JobResponse)
 
     def make_operate(operation):
-        def operate(
+        async def operate(
             body: schema,
             redis_conn=Depends(get_redis),
         ) -> JobResponse:
-            return create_job(body, operation, redis_conn)
+            return await run_blocking(create_job, body, operation, redis_conn)
 
         return operate
 
     operate = make_operate(operation_name)
     registrar(operate)
+
+
+@app.post("/simulate-batch", response_model=BatchJobResponse)
+async def simulate_batch(
+    body: SimulateBatch,
+    redis_conn=Depends(get_redis),
+) -> BatchJobResponse:
+    """
+    Run several intervention scenarios of one model as a single job
+    """
+    return await run_blocking(create_batch_job, body, "simulate", redis_conn)
@@ -1,11 +1,31 @@
 import logging
 
+import pyro
+from rq import get_current_job
+
 # from juliacall import newmodule
 from utils.tds import (
     update_tds_status,
+    get_job_dir,
     cleanup_job_dir,
     attach_files,
+    serialize_files,
+    upload_artifacts,
+    copy_files,
+    connection_stats,
 )
+from utils.compiled_models import resolve_models
+from utils.rabbitmq import close_progress_publishers
+from utils.events import ProgressEvents, publish_status
+from utils import memo
+from utils.scheduling import record_queue_wait
+from utils.cost_model import record_runtime
+from utils.chunking import run_chunked
+from utils.sharding import sample_in_processes, shard_seed
+from utils.multistart import run_multistart
+from utils.calibration import CalibrationMonitor, StopCalibration
+from utils.cancellation import raise_if_cancelled, stop_when_cancelled
+from settings import settings
 
 from pyciemss.interfaces import (  # noqa: F401
     sample,
@@ -20,9 +40,59 @@ logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
 
+def run_operation(request, operation_name, kwargs, job_id):
+    if operation_name == "optimize" and request.num_runs() > 1:
+        seeds = [
+            shard_seed(job_id, index, request.seed)
+            for index in range(request.num_runs())
+        ]
+        if settings.OPTIMIZE_PROCESSES <= 1 and settings.WORKER_MODE == "warm":
+            kwargs = resolve_models(kwargs)
+        return run_multistart(optimize, kwargs, seeds)
+
+    chunk_sizes = request.sample_chunks()
+    seeds = [
+        shard_seed(job_id, index, request.seed) for index in range(len(chunk_sizes))
+    ]
+    if chunk_sizes and settings.SAMPLE_SHARD_PROCESSES > 1:
+        # Shards load the models themselves, from the AMR paths
+        results = sample_in_processes(operation_name, kwargs, chunk_sizes, seeds)
+    else:
+        if settings.WORKER_MODE == "warm":
+            kwargs = resolve_models(kwargs)
+        operation = eval(operation_name)
+        if not chunk_sizes:
+            try:
+                return operation(**kwargs)
+            except StopCalibration as stop:
+                return stop.output
+
+        def sample_chunks():
+            for num_samples, seed in zip(chunk_sizes, seeds):
+                raise_if_cancelled(job_id)
+                pyro.set_rng_seed(seed)
+                yield operation(**{**kwargs, "num_samples": num_samples})["data"]
+
+        results = sample_chunks()
+
+    logger.info(f"{job_id} drawing its samples in chunks of {chunk_sizes[0]}")
+    chunked_result = run_chunked(
+        chunk_sizes,
+        results,
+        get_job_dir(job_id),
+        request.output_format,
+        request.summary_quantiles,
+        request.seed,
+    )
+    return {"chunked_result": chunked_result}
+
+
 def run(request, *, job_id):
     logging.debug(f"STARTED {job_id} (user_id: {request.user_id})")
     update_tds_status(job_id, status="running", start=True)
+    job = get_current_job()
+    record_queue_wait(job)
+    publish_status(job.connection, job_id, request.user_id, "running")
 
     operation_name = request.__class__.pyciemss_lib_function
     kwargs = request.gen_pyciemss_args(job_id)
@@ -30,8 +100,136 @@ def run(request, *, job_id):
     if len(operation_name) == 0:
         raise Exception("No operation provided in request")
     else:
-        output = eval(operation_name)(**kwargs)
+        monitor = kwargs.get("progress_hook")
+        progress = ProgressEvents(
+            job.connection, job_id, request.user_id, operation_name
+        )
+        if "progress_hook" in kwargs:
+            kwargs["progress_hook"] = stop_when_cancelled(
+                job_id, progress.wrap(kwargs["progress_hook"])
+            )
+        if request.seed is not None:
+            pyro.set_rng_seed(request.seed)
+        try:
+            output = run_operation(request, operation_name, kwargs, job_id)
+        finally:
+            close_progress_publishers()
+            progress.flush()
+        if isinstance(monitor, CalibrationMonitor):
+            output = monitor.finish(output)
+    raise_if_cancelled(job_id)
 
-    attach_files(output, job_id)
+    result_files = attach_files(
+        output,
+        job_id,
+        output_format=request.output_format,
+        summary_quantiles=request.summary_quantiles,
+    )
     cleanup_job_dir(job_id)
+    record_runtime(job)
+    if "memo_digest" in job.meta:
+        memo.complete(job.connection, job.meta["memo_digest"], job_id, result_files)
+    publish_status(job.connection, job_id, request.user_id, "complete")
+    logger.info(f"{job_id} connection stats: {connection_stats()}")
     logging.debug(f"FINISHED {job_id} (user_id: {request.user_id})")
+
+
+def run_memoized(request, *, job_id, source_id, digest):
+    """Serve a request with the results of an identical earlier run."""
+    job = get_current_job()
+    source = memo.fetch(job.connection, digest)
+    if (
+        source is None
+        or source["simulation_id"] != source_id
+        or source["status"] != "complete"
+    ):
+        # The earlier run failed or its results expired, so compute them here
+        logging.info(f"{job_id} can't reuse results of {source_id}, running instead")
+        if memo.claim(job.connection, digest, job_id) is None:
+            job.meta["memo_digest"] = digest
+            job.save_meta()
+        return run(request, job_id=job_id)
+
+    record_queue_wait(job)
+    logging.debug(f"STARTED {job_id} as a copy of {source_id}")
+    update_tds_status(job_id, status="running", start=True)
+    publish_status(job.connection, job_id, request.user_id, "running")
+    copy_files(source_id, job_id, source["result_files"])
+    update_tds_status(
+        job_id, status="complete", result_files=source["result_files"], finish=True
+    )
+    publish_status(job.connection, job_id, request.user_id, "complete")
+    logging.debug(f"FINISHED {job_id} (user_id: {request.user_id})")
+
+
+def set_scenario_status(job, scenario_ids, status):
+    for scenario_id in scenario_ids:
+        job.meta["scenarios"][scenario_id]["status"] = status
+        publish_status(job.connection, scenario_id, job.meta.get("user_id"), status)
+    job.save_meta()
+
+
+def run_batch(request, *, job_id, scenario_ids):
+    logging.debug(f"STARTED batch {job_id} (user_id: {request.user_id})")
+    update_tds_status(job_id, status="running", start=True)
+    job = get_current_job()
+    record_queue_wait(job)
+    publish_status(job.connection, job_id, request.user_id, "running")
+
+    # Scenarios sharing a policy are served by a single `sample` call
+    scenario_args = request.gen_pyciemss_args(job_id)
+    failed = False
+    for index, (policy_intervention_id, args) in enumerate(scenario_args.items()):
+        raise_if_cancelled(job_id)
+        group = [
+            scenario_id
+            for scenario_id, scenario_policy_id in zip(
+                scenario_ids, request.policy_intervention_ids
+            )
+            if scenario_policy_id == policy_intervention_id
+        ]
+        set_scenario_status(job, group, "running")
+        for scenario_id in group:
+            update_tds_status(scenario_id, status="running", start=True)
+
+        try:
+            kwargs = args()
+            logger.info(
+                f"{job_id} running scenarios {group} with the following args: {kwargs}"
+            )
+            if settings.WORKER_MODE == "warm":
+                kwargs = resolve_models(kwargs)
+            pyro.set_rng_seed(shard_seed(job_id, index, request.seed))
+            output = sample(**kwargs)
+        except Exception:
+            logger.exception(f"{job_id} scenarios {group} failed")
+            failed = True
+            for scenario_id in group:
+                update_tds_status(scenario_id, status="error", finish=True)
+            set_scenario_status(job, group, "error")
+            continue
+
+        # Every scenario of the group gets the same artifacts, each one is
+        # uploaded to all of them before the next is serialized
+        files = serialize_files(
+            output,
+            job_id,
+            output_format=request.output_format,
+            summary_quantiles=request.summary_quantiles,
+        )
+        handles = upload_artifacts(group, files)
+        for scenario_id in group:
+            update_tds_status(
+                scenario_id, status="complete", result_files=handles, finish=True
+            )
+            cleanup_job_dir(scenario_id)
+        set_scenario_status(job, group, "complete")
+
+    batch_status = "error" if failed else "complete"
+    update_tds_status(job_id, status=batch_status, finish=True)
+    cleanup_job_dir(job_id)
+    if not failed:
+        record_runtime(job)
+    publish_status(job.connection, job_id, request.user_id, batch_status)
+    logger.info(f"{job_id} connection stats: {connection_stats()}")
+    logging.debug(f"FINISHED batch {job_id} (user_id: {request.user_id})")
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import ClassVar, Dict, Optional
+from enum import Enum
+from typing import Annotated, ClassVar, Dict, List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -8,6 +9,9 @@ class Timespan(BaseModel):
     start: float = Field(..., example=0)
     end: float = Field(..., example=90)
 
+    def num_steps(self, step_size):
+        return max((self.end - self.start) / step_size, 1)
+
 
 class ModelConfig(BaseModel):
     id: str = Field(..., example="cd339570-047d-11ee-be55")
@@ -70,14 +74,62 @@ class HMIIntervention(BaseModel):
     dynamic_interventions: Optional[list[HMIDynamicIntervention]] = Field(default=None)
 
 
+class OutputFormat(str, Enum):
+    csv = "csv"
+    parquet = "parquet"
+    arrow = "arrow"
+
+
 class OperationRequest(BaseModel):
     pyciemss_lib_function: ClassVar[str] = ""
     engine: str = Field("ciemss", example="ciemss")
     user_id: str = Field("not_provided", example="not_provided")
+    output_format: OutputFormat = Field(
+        OutputFormat.csv,
+        description="File format of the result and result summary tables",
+        example="csv",
+    )
+    summary_quantiles: List[Annotated[float, Field(gt=0, lt=1)]] = Field(
+        default_factory=list,
+        description="Extra quantiles to add to the result summary",
+        example=[0.05, 0.25, 0.75, 0.95],
+    )
+    seed: Optional[int] = Field(
+        None,
+        description="Seed for the random number generators, for reproducible runs",
+        example=0,
+    )
 
     def gen_pyciemss_args(self, job_id):
         raise NotImplementedError("PyCIEMSS cannot handle this operation")
 
+    def input_versions(self):
+        raise NotImplementedError("This operation cannot be memoized")
+
+    def estimated_cost(self) -> float:
+        """Rough amount of work in simulated steps, used to schedule the job"""
+        raise NotImplementedError("PyCIEMSS cannot handle this operation")
+
+    def num_runs(self) -> int:
+        """Number of pyciemss calls the job makes"""
+        return 1
+
+    def peak_rows(self) -> float:
+        """Rows of the largest trajectory table the job holds at once"""
+        raise NotImplementedError("PyCIEMSS cannot handle this operation")
+
+    def sample_chunks(self) -> List[int]:
+        """Sample counts of the chunks to draw the samples in, empty for one call"""
+        return []
+
+    def summary_timepoints(self) -> float:
+        """Timepoints of the streaming summary of chunked samples, 0 without one"""
+        return 0
+
+    def model_config_ids(self) -> List[str]:
+        """Model configurations the job simulates, used to size its outputs"""
+        return []
+
     # @field_validator("engine")
     # def must_be_ciemss(cls, engine_choice):
     #     if engine_choice != "ciemss":
@@ -2,30 +2,18 @@ from collections import defaultdict
 
 # TODO: Do not use Torch in PyCIEMSS Library interface
 import torch
-from utils.tds import fetch_interventions
 from typing import Dict, Callable
 from models.base import HMIIntervention, HMIStaticIntervention, HMIDynamicIntervention
+from settings import settings
+from utils.cache import LRUCache
+from utils.tds import record_version
 
-
-def fetch_and_convert_static_interventions(policy_intervention_id, model_map, job_id):
-    if not (policy_intervention_id):
-        return defaultdict(dict), defaultdict(dict)
-    policy_intervention = fetch_interventions(policy_intervention_id, job_id)
-    interventionList: list[HMIIntervention] = []
-    for inter in policy_intervention["interventions"]:
-        intervention = HMIIntervention(
-            name=inter["name"],
-            static_interventions=inter["static_interventions"],
-            dynamic_interventions=inter["dynamic_interventions"],
-        )
-        interventionList.append(intervention)
-    return convert_static_interventions(interventionList, model_map)
+compiled_interventions = LRUCache(settings.INTERVENTION_CACHE_SIZE)
 
 
-def fetch_and_convert_dynamic_interventions(policy_intervention_id, model_map, job_id):
-    if not (policy_intervention_id):
-        return defaultdict(dict), defaultdict(dict)
-    policy_intervention = fetch_interventions(policy_intervention_id, job_id)
+def parse_intervention_policy(policy_intervention) -> list[HMIIntervention]:
+    if not (policy_intervention):
+        return []
     interventionList: list[HMIIntervention] = []
     for inter in policy_intervention["interventions"]:
         intervention = HMIIntervention(
@@ -34,7 +22,7 @@ def fetch_and_convert_dynamic_interventions(policy_intervention_id, model_map, j
             dynamic_interventions=inter["dynamic_interventions"],
         )
         interventionList.append(intervention)
-    return convert_dynamic_interventions(interventionList, model_map)
+    return interventionList
 
 
 def get_parameter_value(parameter):
@@ -108,6 +96,44 @@ def convert_static_interventions(interventions: list[HMIIntervention], model_map
     return static_param_interventions, static_state_interventions
 
 
+# Used to convert from HMI Intervention Policy -> all pyciemss interventions.
+def compile_interventions(policy_intervention, model_config):
+    """
+    Build the static and dynamic pyciemss intervention arguments of a policy.
+
+    Results are cached by policy and model configuration version. The
+    returned dicts are shared between jobs and must not be mutated.
+    """
+    if not (policy_intervention):
+        return {
+            "static_parameter_interventions": defaultdict(dict),
+            "static_state_interventions": defaultdict(dict),
+            "dynamic_parameter_interventions": defaultdict(dict),
+            "dynamic_state_interventions": defaultdict(dict),
+        }
+    key = (record_version(policy_intervention), record_version(model_config))
+    compiled = compiled_interventions.get(key)
+    if compiled is not None:
+        return compiled
+
+    model_map = create_model_config_map(model_config)
+    interventions = parse_intervention_policy(policy_intervention)
+    static_parameter, static_state = convert_static_interventions(
+        interventions, model_map
+    )
+    dynamic_parameter, dynamic_state = convert_dynamic_interventions(
+        interventions, model_map
+    )
+    compiled = {
+        "static_parameter_interventions": static_parameter,
+        "static_state_interventions": static_state,
+        "dynamic_parameter_interventions": dynamic_parameter,
+        "dynamic_state_interventions": dynamic_state,
+    }
+    compiled_interventions.put(key, compiled)
+    return compiled
+
+
 def create_model_config_map(model_config):
     model_map = {
         "initials": {},
@@ -3,3 +3,4 @@ from models.operations.calibrate import Calibrate
 from models.operations.ensemble_simulate import EnsembleSimulate
 from models.operations.ensemble_calibrate import EnsembleCalibrate
 from models.operations.optimize import Optimize
+from models.operations.simulate_batch import SimulateBatch
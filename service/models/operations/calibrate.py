@@ -9,13 +9,17 @@ from pika.exceptions import AMQPConnectionError
 
 
 from models.base import Dataset, OperationRequest, Timespan
-from models.converters import (
-    fetch_and_convert_static_interventions,
-    fetch_and_convert_dynamic_interventions,
-    create_model_config_map,
-)
+from models.converters import compile_interventions
+from utils.calibration import CalibrationMonitor, GuideFactory
+from utils.prefetch import InputResolver
 from utils.rabbitmq import gen_calibrate_rabbitmq_hook
-from utils.tds import fetch_dataset, fetch_model, fetch_model_config
+from utils.tds import (
+    fetch_dataset,
+    fetch_model,
+    fetch_model_config,
+    fetch_interventions,
+    fetch_previous_guide,
+)
 
 
 class CalibrateExtra(BaseModel):
@@ -48,6 +52,21 @@ class CalibrateExtra(BaseModel):
         description="Step size required if solver method is euler.",
         example=1.0,
     )
+    warm_start: Optional[str] = Field(
+        None,
+        description="id of a previous calibration to start from",
+        example=None,
+    )
+    early_stopping_patience: Optional[int] = Field(
+        None,
+        description="Stop once the loss hasn't improved for this many iterations",
+        example=50,
+    )
+    early_stopping_tolerance: float = Field(
+        1e-3,
+        description="Smallest relative loss decrease counted as an improvement",
+        example=1e-3,
+    )
 
 
 class Calibrate(OperationRequest):
@@ -61,27 +80,34 @@ class Calibrate(OperationRequest):
         description="optional extra system specific arguments for advanced use cases",
     )
 
-    def gen_pyciemss_args(self, job_id):
-        amr_path = fetch_model(self.model_config_id, job_id)
-
-        model_config = fetch_model_config(self.model_config_id)
-        model_map = create_model_config_map(model_config)
+    def estimated_cost(self):
+        # Without a timespan the length of the dataset decides, assume 100 steps
+        extra = self.extra or CalibrateExtra()
+        num_steps = self.timespan.num_steps(1.0) if self.timespan else 100
+        return extra.num_iterations * extra.num_particles * num_steps
 
-        dataset_path = fetch_dataset(self.dataset.dict(), job_id)
+    def peak_rows(self):
+        extra = self.extra or CalibrateExtra()
+        num_steps = self.timespan.num_steps(1.0) if self.timespan else 100
+        return extra.num_particles * num_steps
 
-        (
-            static_param_interventions,
-            static_state_interventions,
-        ) = fetch_and_convert_static_interventions(
-            self.policy_intervention_id, model_map, job_id
-        )
+    def model_config_ids(self):
+        return [self.model_config_id]
 
-        (
-            dynamic_param_interventions,
-            dynamic_state_interventions,
-        ) = fetch_and_convert_dynamic_interventions(
-            self.policy_intervention_id, model_map, job_id
-        )
+    def gen_pyciemss_args(self, job_id):
+        with InputResolver(job_id) as resolver:
+            amr_path = resolver.fetch(fetch_model, self.model_config_id, job_id)
+            model_config = resolver.fetch(fetch_model_config, self.model_config_id)
+            dataset_path = resolver.fetch(fetch_dataset, self.dataset.dict(), job_id)
+            previous_guide = resolver.fetch(
+                fetch_previous_guide, self.extra.warm_start, job_id
+            )
+            policy_intervention = resolver.fetch(
+                fetch_interventions, self.policy_intervention_id, job_id
+            )
+            interventions = compile_interventions(
+                policy_intervention.result(), model_config.result()
+            )
 
         # TODO: Test RabbitMQ
         try:
@@ -98,6 +124,15 @@ class Calibrate(OperationRequest):
                 return None
 
         extra_options = self.extra.dict()
+        guides = GuideFactory(previous_guide.result())
+        monitor = CalibrationMonitor(
+            hook,
+            guides,
+            extra_options["num_iterations"],
+            patience=extra_options.pop("early_stopping_patience"),
+            tolerance=extra_options.pop("early_stopping_tolerance"),
+            warm_start=extra_options.pop("warm_start"),
+        )
         solver_options = {}
         step_size = extra_options.pop(
             "solver_step_size"
@@ -107,16 +142,14 @@ class Calibrate(OperationRequest):
             solver_options["step_size"] = step_size
 
         return {
-            "model_path_or_json": amr_path,
+            "model_path_or_json": amr_path.result(),
             "start_time": self.timespan.start,
             # TODO: Is this intentionally missing from `calibrate`?
             # "end_time": self.timespan.end,
-            "data_path": dataset_path,
-            "static_parameter_interventions": static_param_interventions,
-            "static_state_interventions": static_state_interventions,
-            "dynamic_parameter_interventions": dynamic_param_interventions,
-            "dynamic_state_interventions": dynamic_state_interventions,
-            "progress_hook": hook,
+            "data_path": dataset_path.result(),
+            **interventions,
+            "progress_hook": monitor,
+            "autoguide": guides,
             "solver_method": solver_method,
             "solver_options": solver_options,
             # "visual_options": True,
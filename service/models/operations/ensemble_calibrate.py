@@ -12,6 +12,7 @@ from pika.exceptions import AMQPConnectionError
 from models.base import Dataset, OperationRequest, Timespan, ModelConfig
 from models.converters import convert_to_solution_mapping
 from utils.rabbitmq import gen_calibrate_rabbitmq_hook
+from utils.prefetch import InputResolver
 from utils.tds import fetch_dataset, fetch_model
 
 
@@ -43,13 +44,33 @@ class EnsembleCalibrate(OperationRequest):
         description="optional extra system specific arguments for advanced use cases",
     )
 
+    def estimated_cost(self):
+        extra = self.extra or EnsembleCalibrateExtra()
+        return (
+            len(self.model_configs)
+            * extra.num_iterations
+            * extra.num_particles
+            * self.timespan.num_steps(self.step_size)
+        )
+
+    def peak_rows(self):
+        extra = self.extra or EnsembleCalibrateExtra()
+        return extra.num_particles * self.timespan.num_steps(self.step_size)
+
+    def model_config_ids(self):
+        return [config.id for config in self.model_configs]
+
     def gen_pyciemss_args(self, job_id):
         weights = torch.tensor([config.weight for config in self.model_configs])
         solution_mappings = [
             convert_to_solution_mapping(config) for config in self.model_configs
         ]
-        amr_paths = [fetch_model(config.id, job_id) for config in self.model_configs]
-        dataset_path = fetch_dataset(self.dataset.dict(), job_id)
+        with InputResolver(job_id) as resolver:
+            amr_paths = [
+                resolver.fetch(fetch_model, config.id, job_id)
+                for config in self.model_configs
+            ]
+            dataset_path = resolver.fetch(fetch_dataset, self.dataset.dict(), job_id)
 
         try:
             hook = gen_calibrate_rabbitmq_hook(job_id)
@@ -65,9 +86,9 @@ class EnsembleCalibrate(OperationRequest):
                 return None
 
         return {
-            "model_paths_or_jsons": amr_paths,
+            "model_paths_or_jsons": [amr_path.result() for amr_path in amr_paths],
             "solution_mappings": solution_mappings,
-            "data_path": dataset_path,
+            "data_path": dataset_path.result(),
             "start_time": self.timespan.start,
             # "end_time": self.timespan.end,
             "dirichlet_alpha": weights,
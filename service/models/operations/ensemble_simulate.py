@@ -7,7 +7,14 @@ import torch  # TODO: Do not use Torch in PyCIEMSS Library interface
 
 from models.base import OperationRequest, Timespan, ModelConfig
 from models.converters import convert_to_solution_mapping
-from utils.tds import fetch_model, fetch_inferred_parameters
+from utils.chunking import peak_samples, plan_chunks
+from utils.prefetch import InputResolver
+from utils.tds import (
+    fetch_model,
+    fetch_inferred_parameters,
+    fetch_model_config,
+    record_version,
+)
 
 
 class EnsembleSimulateExtra(BaseModel):
@@ -39,23 +46,64 @@ class EnsembleSimulate(OperationRequest):
     )
     timespan: Timespan
     logging_step_size: float = 1.0
+    memoize: bool = Field(
+        False,
+        description="Reuse the results of an identical earlier request",
+        example=False,
+    )
 
     extra: EnsembleSimulateExtra = Field(
         None,
         description="optional extra system specific arguments for advanced use cases",
     )
 
+    def input_versions(self):
+        return {
+            "model_configs": [
+                record_version(fetch_model_config(config.id))
+                for config in self.model_configs
+            ]
+        }
+
+    def estimated_cost(self):
+        extra = self.extra or EnsembleSimulateExtra()
+        return (
+            len(self.model_configs)
+            * extra.num_samples
+            * self.timespan.num_steps(self.logging_step_size)
+        )
+
+    def peak_rows(self):
+        num_samples = peak_samples((self.extra or EnsembleSimulateExtra()).num_samples)
+        return num_samples * self.timespan.num_steps(self.logging_step_size)
+
+    def sample_chunks(self):
+        return plan_chunks((self.extra or EnsembleSimulateExtra()).num_samples)
+
+    def summary_timepoints(self):
+        if not self.sample_chunks():
+            return 0
+        return self.timespan.num_steps(self.logging_step_size)
+
+    def model_config_ids(self):
+        return [config.id for config in self.model_configs]
+
     def gen_pyciemss_args(self, job_id):
         weights = torch.tensor([config.weight for config in self.model_configs])
         solution_mappings = [
             convert_to_solution_mapping(config) for config in self.model_configs
         ]
-        amr_paths = [fetch_model(config.id, job_id) for config in self.model_configs]
-
         extra_options = self.extra.dict()
-        inferred_parameters = fetch_inferred_parameters(
-            extra_options.pop("inferred_parameters"), job_id
-        )
+        with InputResolver(job_id) as resolver:
+            amr_paths = [
+                resolver.fetch(fetch_model, config.id, job_id)
+                for config in self.model_configs
+            ]
+            inferred_parameters = resolver.fetch(
+                fetch_inferred_parameters,
+                extra_options.pop("inferred_parameters"),
+                job_id,
+            )
 
         solver_options = {}
         step_size = extra_options.pop("solver_step_size")
@@ -64,13 +112,13 @@ class EnsembleSimulate(OperationRequest):
             solver_options["step_size"] = step_size
 
         return {
-            "model_paths_or_jsons": amr_paths,
+            "model_paths_or_jsons": [amr_path.result() for amr_path in amr_paths],
             "solution_mappings": solution_mappings,
             "start_time": self.timespan.start,
             "end_time": self.timespan.end,
             "logging_step_size": self.logging_step_size,
             "dirichlet_alpha": weights,
-            "inferred_parameters": inferred_parameters,
+            "inferred_parameters": inferred_parameters.result(),
             "solver_method": solver_method,
             "solver_options": solver_options,
             # "visual_options": True,
@@ -26,6 +26,8 @@ from models.converters import (
     convert_dynamic_interventions,
     create_model_config_map,
 )
+from settings import settings
+from utils.prefetch import InputResolver
 from utils.tds import fetch_model, fetch_inferred_parameters, fetch_model_config
 
 
@@ -229,6 +231,17 @@ class OptimizeExtra(BaseModel):
     )
     maxiter: int = 5
     maxfeval: int = 25
+    num_starts: int = Field(
+        1,
+        ge=1,
+        description="""
+            Independent optimizations to run, each with its own seed and initial
+            guess. The one with the lowest objective value is returned.
+            Starts run in parallel with OPTIMIZE_PROCESSES above 1, the
+            evaluations of a single start don't.
+        """,
+        example=1,
+    )
     alpha: Union[List[float], float] = 0.95
     solver_method: str = "dopri5"
     # https://github.com/ciemss/pyciemss/blob/main/pyciemss/integration_utils/interface_checks.py
@@ -256,11 +269,46 @@ class Optimize(OperationRequest):
         description="optional extra system specific arguments for advanced use cases",
     )
 
+    def estimated_cost(self):
+        extra = self.extra or OptimizeExtra()
+        return (
+            extra.num_starts
+            * (extra.maxiter + 1)
+            * extra.maxfeval
+            * extra.num_samples
+            * self.timespan.num_steps(self.logging_step_size)
+        )
+
+    def num_runs(self):
+        return (self.extra or OptimizeExtra()).num_starts
+
+    def peak_rows(self):
+        # Every evaluation of the risk samples the model again
+        extra = self.extra or OptimizeExtra()
+        concurrent_starts = min(extra.num_starts, max(settings.OPTIMIZE_PROCESSES, 1))
+        return (
+            concurrent_starts
+            * extra.num_samples
+            * self.timespan.num_steps(self.logging_step_size)
+        )
+
+    def model_config_ids(self):
+        return [self.model_config_id]
+
     def gen_pyciemss_args(self, job_id):
-        # Get model from TDS
-        amr_path = fetch_model(self.model_config_id, job_id)
-        model_config = fetch_model_config(self.model_config_id)
-        model_map = create_model_config_map(model_config)
+        extra_options = self.extra.dict()
+
+        # Get model and inputs from TDS
+        with InputResolver(job_id) as resolver:
+            amr_path = resolver.fetch(fetch_model, self.model_config_id, job_id)
+            model_config = resolver.fetch(fetch_model_config, self.model_config_id)
+            inferred_parameters = resolver.fetch(
+                fetch_inferred_parameters,
+                extra_options.pop("inferred_parameters"),
+                job_id,
+            )
+
+            model_map = create_model_config_map(model_config.result())
         (
             fixed_static_parameter_interventions,
             fixed_static_state_interventions,
@@ -362,11 +410,8 @@ class Optimize(OperationRequest):
                     start_time_param_value_objective(param_name=param_names)
                 )
 
-        extra_options = self.extra.dict()
-        inferred_parameters = fetch_inferred_parameters(
-            extra_options.pop("inferred_parameters"), job_id
-        )
         n_samples_ouu = extra_options.pop("num_samples")
+        num_starts = extra_options.pop("num_starts")
         solver_options = {}
         step_size = extra_options.pop(
             "solver_step_size"
@@ -376,8 +421,10 @@ class Optimize(OperationRequest):
             solver_options["step_size"] = step_size
 
         total_possible_iterations = (
-            extra_options.get("maxiter") + 1
-        ) * extra_options.get("maxfeval")
+            num_starts
+            * (extra_options.get("maxiter") + 1)
+            * extra_options.get("maxfeval")
+        )
         try:
             progress_hook = OptimizeHook(job_id, total_possible_iterations)
         except (socket.gaierror, AMQPConnectionError):
@@ -396,7 +443,7 @@ class Optimize(OperationRequest):
             risk_bounds.append(qoi.gen_risk_bound())
 
         return {
-            "model_path_or_json": amr_path,
+            "model_path_or_json": amr_path.result(),
             "logging_step_size": self.logging_step_size,
             "start_time": self.timespan.start,
             "end_time": self.timespan.end,
@@ -412,7 +459,7 @@ class Optimize(OperationRequest):
             "fixed_static_state_interventions": fixed_static_state_interventions,
             "fixed_dynamic_parameter_interventions": dynamic_param_interventions,
             "fixed_dynamic_state_interventions": dynamic_state_interventions,
-            "inferred_parameters": inferred_parameters,
+            "inferred_parameters": inferred_parameters.result(),
             "n_samples_ouu": n_samples_ouu,
             "solver_method": solver_method,
             "solver_options": solver_options,
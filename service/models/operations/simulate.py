@@ -5,12 +5,17 @@ from pydantic import BaseModel, Field, Extra
 
 
 from models.base import OperationRequest, Timespan
-from models.converters import (
-    fetch_and_convert_static_interventions,
-    fetch_and_convert_dynamic_interventions,
-    create_model_config_map,
+from models.converters import compile_interventions
+from utils.chunking import peak_samples, plan_chunks
+from utils.prefetch import InputResolver
+from utils.tds import (
+    fetch_model,
+    fetch_inferred_parameters,
+    fetch_model_config,
+    fetch_interventions,
+    fetch_intervention_policy,
+    record_version,
 )
-from utils.tds import fetch_model, fetch_inferred_parameters, fetch_model_config
 
 
 class SimulateExtra(BaseModel):
@@ -39,37 +44,66 @@ class Simulate(OperationRequest):
     pyciemss_lib_function: ClassVar[str] = "sample"
     model_config_id: str = Field(..., example="ba8da8d4-047d-11ee-be56")
     timespan: Timespan = Timespan(start=0, end=90)
-    policy_intervention_id: str = Field(None, example="ba8da8d4-047d-11ee-be56")
+    policy_intervention_id: Optional[str] = Field(
+        None, example="ba8da8d4-047d-11ee-be56"
+    )
     logging_step_size: float = 1.0
+    memoize: bool = Field(
+        False,
+        description="Reuse the results of an identical earlier request",
+        example=False,
+    )
     extra: SimulateExtra = Field(
         None,
         description="optional extra system specific arguments for advanced use cases",
     )
 
-    def gen_pyciemss_args(self, job_id):
-        # Get model from TDS
-        amr_path = fetch_model(self.model_config_id, job_id)
-
-        model_config = fetch_model_config(self.model_config_id)
-        model_map = create_model_config_map(model_config)
-        (
-            static_param_interventions,
-            static_state_interventions,
-        ) = fetch_and_convert_static_interventions(
-            self.policy_intervention_id, model_map, job_id
-        )
-
-        (
-            dynamic_param_interventions,
-            dynamic_state_interventions,
-        ) = fetch_and_convert_dynamic_interventions(
-            self.policy_intervention_id, model_map, job_id
-        )
+    def input_versions(self):
+        versions = {
+            "model_config": record_version(fetch_model_config(self.model_config_id))
+        }
+        if self.policy_intervention_id:
+            policy = fetch_intervention_policy(self.policy_intervention_id)
+            versions["policy_intervention"] = record_version(policy)
+        return versions
+
+    def estimated_cost(self):
+        extra = self.extra or SimulateExtra()
+        return extra.num_samples * self.timespan.num_steps(self.logging_step_size)
+
+    def peak_rows(self):
+        num_samples = peak_samples((self.extra or SimulateExtra()).num_samples)
+        return num_samples * self.timespan.num_steps(self.logging_step_size)
 
+    def sample_chunks(self):
+        return plan_chunks((self.extra or SimulateExtra()).num_samples)
+
+    def summary_timepoints(self):
+        if not self.sample_chunks():
+            return 0
+        return self.timespan.num_steps(self.logging_step_size)
+
+    def model_config_ids(self):
+        return [self.model_config_id]
+
+    def gen_pyciemss_args(self, job_id):
         extra_options = self.extra.dict()
-        inferred_parameters = fetch_inferred_parameters(
-            extra_options.pop("inferred_parameters"), job_id
-        )
+
+        # Get model and inputs from TDS
+        with InputResolver(job_id) as resolver:
+            amr_path = resolver.fetch(fetch_model, self.model_config_id, job_id)
+            model_config = resolver.fetch(fetch_model_config, self.model_config_id)
+            policy_intervention = resolver.fetch(
+                fetch_interventions, self.policy_intervention_id, job_id
+            )
+            inferred_parameters = resolver.fetch(
+                fetch_inferred_parameters,
+                extra_options.pop("inferred_parameters"),
+                job_id,
+            )
+            interventions = compile_interventions(
+                policy_intervention.result(), model_config.result()
+            )
 
         solver_options = {}
         step_size = extra_options.pop(
@@ -80,15 +114,12 @@ class Simulate(OperationRequest):
             solver_options["step_size"] = step_size
 
         return {
-            "model_path_or_json": amr_path,
+            "model_path_or_json": amr_path.result(),
             "logging_step_size": self.logging_step_size,
             "start_time": self.timespan.start,
             "end_time": self.timespan.end,
-            "static_parameter_interventions": static_param_interventions,
-            "static_state_interventions": static_state_interventions,
-            "dynamic_parameter_interventions": dynamic_param_interventions,
-            "dynamic_state_interventions": dynamic_state_interventions,
-            "inferred_parameters": inferred_parameters,
+            **interventions,
+            "inferred_parameters": inferred_parameters.result(),
             "solver_method": solver_method,
             "solver_options": solver_options,
             **extra_options,
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from functools import partial
+from typing import ClassVar, List, Optional
+from pydantic import Field, Extra
+
+
+from models.base import OperationRequest, Timespan
+from models.converters import compile_interventions
+from models.operations.simulate import Simulate, SimulateExtra
+from utils.prefetch import InputResolver
+from utils.tds import (
+    fetch_model,
+    fetch_inferred_parameters,
+    fetch_model_config,
+    fetch_interventions,
+)
+
+
+class SimulateBatch(OperationRequest):
+    pyciemss_lib_function: ClassVar[str] = "sample"
+    model_config_id: str = Field(..., example="ba8da8d4-047d-11ee-be56")
+    timespan: Timespan = Timespan(start=0, end=90)
+    policy_intervention_ids: List[Optional[str]] = Field(
+        ...,
+        min_length=1,
+        description="One scenario per intervention policy, null runs without interventions",
+        example=[None, "ba8da8d4-047d-11ee-be56"],
+    )
+    logging_step_size: float = 1.0
+    extra: SimulateExtra = Field(
+        None,
+        description="optional extra system specific arguments for advanced use cases",
+    )
+
+    def estimated_cost(self):
+        extra = self.extra or SimulateExtra()
+        return (
+            self.num_runs()
+            * extra.num_samples
+            * self.timespan.num_steps(self.logging_step_size)
+        )
+
+    def num_runs(self):
+        return len(set(self.policy_intervention_ids))
+
+    def peak_rows(self):
+        # Scenarios run one after another
+        extra = self.extra or SimulateExtra()
+        return extra.num_samples * self.timespan.num_steps(self.logging_step_size)
+
+    def model_config_ids(self):
+        return [self.model_config_id]
+
+    def scenarios(self) -> List[Simulate]:
+        scenarios = []
+        for policy_intervention_id in self.policy_intervention_ids:
+            scenario = Simulate(
+                policy_intervention_id=policy_intervention_id,
+                engine=self.engine,
+                user_id=self.user_id,
+                output_format=self.output_format,
+                summary_quantiles=self.summary_quantiles,
+                seed=self.seed,
+                model_config_id=self.model_config_id,
+                timespan=self.timespan,
+                logging_step_size=self.logging_step_size,
+                extra=self.extra,
+            )
+            scenarios.append(scenario)
+        return scenarios
+
+    def gen_pyciemss_args(self, job_id):
+        """
+        Map every distinct intervention policy to a function returning its
+        `sample` arguments. The model, its configuration and the inferred
+        parameters are fetched once and shared by all scenarios. A policy
+        that can't be fetched or compiled only fails when its function is
+        called, so it doesn't take down the other scenarios.
+        """
+        extra_options = self.extra.dict()
+        with InputResolver(job_id) as resolver:
+            amr_path = resolver.fetch(fetch_model, self.model_config_id, job_id)
+            model_config = resolver.fetch(fetch_model_config, self.model_config_id)
+            inferred_parameters = resolver.fetch(
+                fetch_inferred_parameters,
+                extra_options.pop("inferred_parameters"),
+                job_id,
+            )
+            policy_interventions = {
+                policy_intervention_id: resolver.fetch(
+                    fetch_interventions, policy_intervention_id, job_id
+                )
+                for policy_intervention_id in self.policy_intervention_ids
+            }
+
+        solver_options = {}
+        step_size = extra_options.pop(
+            "solver_step_size"
+        )  # Need to pop this out of extra.
+        solver_method = extra_options.pop("solver_method")
+        if step_size is not None and solver_method == "euler":
+            solver_options["step_size"] = step_size
+
+        def scenario_args(policy_intervention):
+            interventions = compile_interventions(
+                policy_intervention.result(), model_config.result()
+            )
+            return {
+                "model_path_or_json": amr_path.result(),
+                "logging_step_size": self.logging_step_size,
+                "start_time": self.timespan.start,
+                "end_time": self.timespan.end,
+                **interventions,
+                "inferred_parameters": inferred_parameters.result(),
+                "solver_method": solver_method,
+                "solver_options": solver_options,
+                **extra_options,
+            }
+
+        return {
+            policy_intervention_id: partial(scenario_args, policy_intervention)
+            for policy_intervention_id, policy_intervention in policy_interventions.items()
+        }
+
+    class Config:
+        extra = Extra.forbid
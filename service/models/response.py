@@ -20,10 +20,13 @@ class Status(Enum):
     def from_rq(rq_status):
         rq_status_to_tds_status = {
             "canceled": "cancelled",
+            "cancelled": "cancelled",
             "stopped": "cancelled",
             "complete": "complete",
             "error": "error",
             "queued": "queued",
+            "deferred": "queued",
+            "scheduled": "queued",
             "running": "running",
             "working": "running",
             "failed": "failed",
@@ -33,14 +36,63 @@ class Status(Enum):
         return Status(rq_status_to_tds_status[rq_status])
 
 
+class JobEstimate(BaseModel):
+    cost: float = Field(..., description="Estimated cost used to schedule the job")
+    peak_memory_bytes: int = Field(..., description="Estimated peak memory")
+    runtime_seconds: float = Field(..., description="Estimated runtime")
+    queue: str = Field(..., description="Queue the job waits in", example="high")
+    downgraded: bool = Field(
+        False, description="Sent to the low priority queue for exceeding its budget"
+    )
+
+
 class JobResponse(BaseModel):
     simulation_id: Optional[str] = Field(
         None,
         description="Simulation created successfully",
         example="fc5d80e4-0483-11ee-be56",
     )
+    estimate: Optional[JobEstimate] = None
+
+
+class BatchJobResponse(JobResponse):
+    scenario_ids: list[str] = Field(
+        default_factory=list,
+        description="Simulation ids of the individual scenarios, in request order",
+        example=["fc5d80e4-0483-11ee-be57"],
+    )
 
 
 class StatusSimulationIdGetResponse(BaseModel):
     status: Optional[Status] = None
     error_msg: Optional[str] = None
+
+
+class StatusQuery(BaseModel):
+    simulation_ids: list[str] = Field(
+        ...,
+        description="Simulations to report the status of",
+        example=["fc5d80e4-0483-11ee-be56"],
+        max_length=1000,
+    )
+
+
+class SimulationStatus(StatusSimulationIdGetResponse):
+    simulation_id: str
+
+
+class StatusGetResponse(BaseModel):
+    statuses: list[SimulationStatus] = Field(
+        default_factory=list,
+        description="Status of every simulation in query order, null if unknown",
+    )
+
+
+class ScenarioStatus(BaseModel):
+    simulation_id: str
+    policy_intervention_id: Optional[str] = None
+    status: Status
+
+
+class ScenariosSimulationIdGetResponse(StatusSimulationIdGetResponse):
+    scenarios: list[ScenarioStatus] = []
@@ -2,6 +2,8 @@
 Configures pyciemss-service using environment variables
 """
 
+from typing import Dict
+
 from pydantic_settings import BaseSettings
 
 
@@ -13,13 +15,71 @@ class Settings(BaseSettings):
     TDS_URL: str = "http://localhost:3000"
     TDS_USER: str = "user"
     TDS_PASSWORD: str = "password"
+    TDS_POOL_SIZE: int = 10
+    TDS_RETRIES: int = 3
+    TDS_BACKOFF_FACTOR: float = 0.5
+    TDS_CONNECT_TIMEOUT: float = 5.0
+    TDS_READ_TIMEOUT: float = 60.0
+    UPLOAD_CONCURRENCY: int = 4
+    PREFETCH_CONCURRENCY: int = 8
+    CACHE_DIR: str = "/tmp/pyciemss-cache"
+    MODEL_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    LEGACY_PARAMETERS_DILL: bool = True
+    PARAMETERS_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+    PARAMETERS_MEMORY_CACHE_SIZE: int = 8
+    DATASET_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    MODEL_MEMORY_CACHE_SIZE: int = 16
+    INTERVENTION_CACHE_SIZE: int = 64
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
+    REDIS_MAX_CONNECTIONS: int = 50
+    SUBMIT_CONCURRENCY: int = 16
+    STATUS_CACHE_TTL: float = 0.0
+    STATUS_CACHE_SIZE: int = 10000
+    SIMULATION_RECORD_CACHE_SIZE: int = 1000
+    EVENT_STREAM_MAXLEN: int = 1000
+    EVENT_STREAM_TTL: int = 24 * 60 * 60
+    EVENT_STREAM_BLOCK_MS: int = 5000
+    EVENT_STREAM_MAX_CLIENTS: int = 500
+    EVENT_PROGRESS_MAX_PER_SECOND: float = 4.0
+    MEMO_TTL: int = 7 * 24 * 60 * 60
     RABBITMQ_HOST: str = "rabbitmq.pyciemss"
     RABBITMQ_PORT: int = 5672
     RABBITMQ_USERNAME: str = "guest"
     RABBITMQ_PASSWORD: str = "guest"
     RABBITMQ_SSL: bool = False
+    PROGRESS_MAX_PER_SECOND: float = 4.0
+    PROGRESS_EVERY: int = 1
+    PROGRESS_MAX_BACKOFF: float = 30.0
+    SAMPLE_CHUNK_SIZE: int = 10000
+    SUMMARY_SKETCH_SIZE: int = 1024
+    SAMPLE_SHARD_PROCESSES: int = 0
+    SAMPLE_SHARD_MIN_SAMPLES: int = 1000
+    SAMPLE_SHARD_THREADS: int = 0
+    SAMPLE_SHARD_START_METHOD: str = "spawn"
+    OPTIMIZE_PROCESSES: int = 1
+    WORKER_MODE: str = "fork"
+    WORKER_QUEUES: str = "high default low"
+    QUEUE_HIGH_MAX_COST: float = 5e4
+    QUEUE_DEFAULT_MAX_COST: float = 1e6
+    USER_FAIR_SHARE: int = 4
+    DEFAULT_JOB_TIMEOUT: int = 60 * 60
+    JOB_TIMEOUTS: Dict[str, int] = {
+        "simulate": 60 * 60,
+        "ensemble-simulate": 2 * 60 * 60,
+        "calibrate": 4 * 60 * 60,
+        "ensemble-calibrate": 8 * 60 * 60,
+        "optimize": 12 * 60 * 60,
+    }
+    ADMISSION_POLICY: str = "reject"
+    MAX_JOB_MEMORY_BYTES: int = 16 * 1024 * 1024 * 1024
+    MAX_JOB_RUNTIME: float = 24 * 60 * 60
+    TIMEOUT_ESTIMATE_FACTOR: float = 3.0
+    WORKER_BASE_MEMORY_BYTES: int = 1024 * 1024 * 1024
+    BYTES_PER_RESULT_VALUE: int = 32
+    DEFAULT_MODEL_VARIABLES: int = 10
+    COST_MODEL_SECONDS_PER_UNIT: float = 5e-5
+    COST_MODEL_SMOOTHING: float = 0.2
 
 
 settings = Settings()
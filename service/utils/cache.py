@@ -0,0 +1,177 @@
+"""
+Worker-local caches shared between jobs
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from filelock import FileLock
+
+
+def content_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class DiskCache:
+    """
+    Size-bounded cache of files on local disk with least-recently-used eviction.
+
+    Entries are written atomically and every operation holds a file lock, so
+    several worker processes on the same node can share one directory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.lock = FileLock(os.path.join(directory, ".lock"))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        with self.lock:
+            if not os.path.exists(path):
+                return None
+            os.utime(path)
+            with open(path, "rb") as file:
+                return file.read()
+
+    def read_json(self, key: str) -> Optional[dict]:
+        content = self.read(key)
+        return None if content is None else json.loads(content)
+
+    def link(self, key: str, destination: str) -> bool:
+        """
+        Place the entry for `key` at `destination`, hard linking when possible.
+        Returns False on a cache miss.
+        """
+        path = self._path(key)
+        with self.lock:
+            if not os.path.exists(path):
+                return False
+            os.utime(path)
+            if os.path.exists(destination):
+                os.remove(destination)
+            try:
+                os.link(path, destination)
+            except OSError:  # e.g. the job dir lives on another filesystem
+                shutil.copyfile(path, destination)
+            return True
+
+    def touch(self, key: str) -> bool:
+        """Mark the entry for `key` as recently used. Returns False on a miss."""
+        path = self._path(key)
+        with self.lock:
+            if not os.path.exists(path):
+                return False
+            os.utime(path)
+            return True
+
+    def write(self, key: str, content: bytes):
+        path = self._path(key)
+        with self.lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as file:
+                file.write(content)
+            os.replace(tmp_path, path)
+            self._evict(keep=path)
+
+    def write_json(self, key: str, obj: dict):
+        self.write(key, json.dumps(obj).encode())
+
+    def write_file(self, key: str, source: str):
+        """Store a copy of the file at `source`, without reading it into memory"""
+        path = self._path(key)
+        with self.lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            os.close(fd)
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, path)
+            self._evict(keep=path)
+
+    def _evict(self, keep: str):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.startswith("."):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            logging.debug("Evicting %s from cache %s", path, self.directory)
+            os.remove(path)
+            total -= size
+
+
+class LRUCache:
+    """
+    In-memory least-recently-used cache bounded by entry count. Only useful
+    in processes that outlive a single job, e.g. the warm worker.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            return self.entries.pop(key, None)
+
+
+class TTLCache(LRUCache):
+    """
+    LRUCache whose entries expire `ttl` seconds after they were stored. A
+    non-positive `ttl` disables caching.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        super().__init__(max_entries if ttl > 0 else 0)
+        self.ttl = ttl
+
+    def get(self, key):
+        entry = super().get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, key, value):
+        super().put(key, (time.monotonic() + self.ttl, value))
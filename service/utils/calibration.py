@@ -0,0 +1,159 @@
+"""
+Warm starts and early stopping for calibrations
+
+A calibration can start from the guide of a previous calibration instead of a
+fresh one, and stop once its loss stops improving. The guide is kept by the
+factory that pyciemss builds it with, so a calibration stopped from its
+progress hook still returns its inferred parameters, in the same shape as a
+calibration that ran all its iterations.
+"""
+from __future__ import annotations
+
+import logging
+import math
+
+# Weight of the newest loss in the smoothed loss, SVI losses are noisy
+LOSS_SMOOTHING = 0.1
+
+
+class StopCalibration(Exception):
+    def __init__(self, output):
+        super().__init__("Calibration loss stopped improving")
+        self.output = output
+
+
+class GuideFactory:
+    """
+    Builds the guide pyciemss calibrates the model with, and keeps it.
+
+    pyciemss puts that guide in an AutoGuideList next to the point estimates
+    of the deterministic parameters, and the list is what a calibration
+    returns. A warm start builds a fresh guide that takes over the parameters
+    of the matching part of the previous calibration's list when first called.
+    """
+
+    def __init__(self, previous_guide=None):
+        self.previous_guide = previous_guide
+        self.guide = None
+
+    def previous_part(self):
+        from pyro.infer.autoguide import AutoGuideList, AutoLowRankMultivariateNormal
+
+        parts = (
+            list(self.previous_guide)
+            if isinstance(self.previous_guide, AutoGuideList)
+            else [self.previous_guide]
+        )
+        matching = [
+            part for part in parts if isinstance(part, AutoLowRankMultivariateNormal)
+        ]
+        return matching[-1] if matching else None
+
+    def __call__(self, model):
+        from pyro.infer.autoguide import AutoLowRankMultivariateNormal
+
+        previous = self.previous_part()
+        if previous is None:
+            self.guide = AutoLowRankMultivariateNormal(model)
+            return self.guide
+
+        self.guide = AutoLowRankMultivariateNormal(model, rank=previous.rank)
+        state = previous.state_dict()
+
+        def restore(guide, args, kwargs):
+            # Setting the guide up creates its parameters, which resets them
+            handle.remove()
+            if guide.prototype_trace is None:
+                guide._setup_prototype(*args, **kwargs)
+            try:
+                guide.load_state_dict(state)
+            except RuntimeError as error:
+                logging.warning(f"Can't warm start from the previous guide: {error}")
+
+        handle = self.guide.register_forward_pre_hook(restore, with_kwargs=True)
+        return self.guide
+
+    def full_guide(self):
+        """The guide the calibration returns, the list holding the built guide."""
+        if self.guide is None or self.guide.master is None:
+            return self.guide
+        return self.guide.master()
+
+
+class CalibrationMonitor:
+    """
+    Progress hook of a calibration that counts its iterations and, with a
+    patience, stops it once the smoothed loss hasn't improved by a relative
+    `tolerance` for that many iterations.
+
+    pyciemss calls the hook before each step with the loss of the previous
+    one, so the first call only carries a placeholder. That and non-finite
+    losses are left out, the smoothed loss starts at the first real step.
+    """
+
+    def __init__(
+        self,
+        hook,
+        guides,
+        num_iterations,
+        patience=None,
+        tolerance=0.0,
+        warm_start=None,
+    ):
+        self.hook = hook
+        self.guides = guides
+        self.num_iterations = num_iterations
+        self.patience = patience
+        self.tolerance = tolerance
+        self.warm_start = warm_start
+        self.iterations = 0
+        self.loss = None
+        self.smoothed = None
+        self.best = None
+        self.since_best = 0
+        self.stopped_early = False
+
+    def __call__(self, progress, loss):
+        self.iterations += 1
+        result = self.hook(progress, loss)
+        if self.iterations == 1 or not math.isfinite(float(loss)):
+            return result
+        self.loss = float(loss)
+        if self.smoothed is None:
+            self.smoothed = self.loss
+        else:
+            self.smoothed += LOSS_SMOOTHING * (self.loss - self.smoothed)
+        if self.best is None or self.smoothed < self.best - self.tolerance * abs(
+            self.best
+        ):
+            self.best = self.smoothed
+            self.since_best = 0
+        else:
+            self.since_best += 1
+        if self.patience and self.since_best >= self.patience:
+            self.stopped_early = True
+            raise StopCalibration(
+                {"inferred_parameters": self.guides.full_guide(), "loss": self.loss}
+            )
+        return result
+
+    def report(self):
+        return {
+            "warm_start": self.warm_start,
+            "iterations_requested": self.num_iterations,
+            "iterations_run": self.iterations,
+            "iterations_saved": max(self.num_iterations - self.iterations, 0),
+            "stopped_early": self.stopped_early,
+            "final_loss": self.loss,
+        }
+
+    def finish(self, output):
+        report = self.report()
+        logging.info(
+            "Calibration ran %s of %s iterations (warm start: %s, stopped early: %s)",
+            report["iterations_run"],
+            report["iterations_requested"],
+            report["warm_start"],
+            report["stopped_early"],
+        )
+        return {**output, "calibration": report}
@@ -0,0 +1,42 @@
+"""
+Cooperative cancellation of jobs that run inside the worker process
+
+A warm worker runs jobs in its own process, where RQ's stop-job command would
+kill the worker itself. It marks the job as cancelled instead, and the job
+stops at its next progress update, its next chunk or before it uploads its
+results.
+"""
+from __future__ import annotations
+
+import threading
+
+
+class JobCancelled(Exception):
+    def __init__(self, job_id):
+        super().__init__(f"Job {job_id} was cancelled")
+        self.job_id = job_id
+
+
+_cancelled = set()
+_lock = threading.Lock()
+
+
+def request_cancel(job_id):
+    with _lock:
+        _cancelled.add(str(job_id))
+
+
+def raise_if_cancelled(job_id):
+    with _lock:
+        if str(job_id) not in _cancelled:
+            return
+        _cancelled.discard(str(job_id))
+    raise JobCancelled(job_id)
+
+
+def stop_when_cancelled(job_id, hook):
+    def progress_hook(*args):
+        raise_if_cancelled(job_id)
+        return hook(*args)
+
+    return progress_hook
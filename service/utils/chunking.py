@@ -0,0 +1,242 @@
+"""
+Run large sample requests in chunks with flat memory
+
+The samples of a request are drawn in chunks of SAMPLE_CHUNK_SIZE, one after
+another or in a process pool (see `utils.sharding`). The rows of every chunk
+are appended to the result file in the job dir and folded into a streaming
+summary as they arrive, so memory doesn't grow with the number of chunks.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import warnings
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from settings import settings
+from utils.tds import dense_samples, summary_frame
+
+
+def split_samples(num_samples, chunk_size=None):
+    """Chunk sizes for `num_samples`, empty if a single call is small enough."""
+    chunk_size = settings.SAMPLE_CHUNK_SIZE if chunk_size is None else chunk_size
+    if chunk_size <= 0 or num_samples <= chunk_size:
+        return []
+    full, rest = divmod(num_samples, chunk_size)
+    return [chunk_size] * full + ([rest] if rest else [])
+
+
+def sharded(num_samples):
+    return (
+        settings.SAMPLE_SHARD_PROCESSES > 1
+        and num_samples >= settings.SAMPLE_SHARD_MIN_SAMPLES
+    )
+
+
+def plan_chunks(num_samples):
+    """
+    Chunk sizes to draw `num_samples` in. Sharded requests get at least one
+    chunk per process.
+    """
+    chunk_size = settings.SAMPLE_CHUNK_SIZE
+    if sharded(num_samples):
+        shard_size = math.ceil(num_samples / settings.SAMPLE_SHARD_PROCESSES)
+        chunk_size = min(chunk_size, shard_size) if chunk_size > 0 else shard_size
+    return split_samples(num_samples, chunk_size)
+
+
+def peak_samples(num_samples):
+    """Samples held in memory at once while drawing `num_samples`."""
+    chunks = plan_chunks(num_samples)
+    if not chunks:
+        return num_samples
+    if sharded(num_samples):
+        # Every process holds a chunk, and so does the job once it's sent back
+        return 2 * min(chunks[0] * settings.SAMPLE_SHARD_PROCESSES, num_samples)
+    return chunks[0]
+
+
+def summary_bytes(timepoints, columns):
+    """Memory of a `StreamingSummary` of `timepoints` x `columns` values"""
+    # The reservoir plus the count, mean, m2, min and max arrays, as float64
+    return timepoints * columns * (settings.SUMMARY_SKETCH_SIZE + 5) * 8
+
+
+class ResultWriter:
+    """Appends chunks of a result table to a CSV, Parquet or Arrow IPC file."""
+
+    def __init__(self, directory, output_format="csv"):
+        self.output_format = output_format
+        self.handle = {
+            "csv": "result.csv",
+            "parquet": "result.parquet",
+            "arrow": "result.arrow",
+        }[output_format]
+        self.path = os.path.join(directory, self.handle)
+        self.schema = None
+        self.writer = None
+        self.rows = 0
+
+    def write(self, df):
+        if self.output_format == "csv":
+            df.to_csv(self.path, mode="a", header=self.rows == 0, index=False)
+        else:
+            import pyarrow as pa
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.writer is None:
+                self.schema = table.schema
+                self.writer = self.open_writer(pa)
+            self.writer.write_table(table.cast(self.schema))
+        self.rows += len(df)
+
+    def open_writer(self, pa):
+        if self.output_format == "parquet":
+            import pyarrow.parquet as pq
+
+            return pq.ParquetWriter(self.path, self.schema, compression="zstd")
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        return pa.ipc.new_file(self.path, self.schema, options=options)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class StreamingSummary:
+    """
+    Accumulates the result summary of `get_result_summary` chunk by chunk.
+
+    Min, max, mean and standard deviation are exact, with chunk moments merged
+    the way Welford's algorithm merges samples. The median and the requested
+    quantiles come from a uniform reservoir of SUMMARY_SKETCH_SIZE samples, so
+    they are exact as long as the request has no more samples than that.
+    """
+
+    def __init__(self, quantiles=(), sketch_size=None, seed=None):
+        self.quantiles = list(quantiles)
+        self.sketch_size = sketch_size or settings.SUMMARY_SKETCH_SIZE
+        self.rng = np.random.default_rng(seed)
+        self.layout = None
+        self.reservoir = None
+        self.seen = 0
+        self.failed = False
+
+    def update(self, data_result):
+        if self.failed:
+            return
+        dense = dense_samples(data_result)
+        if dense is None:
+            return self.fail("ragged or non-numeric result")
+        timepoints, unknowns, values, value_columns = dense
+        if self.layout is None:
+            self.start(timepoints, unknowns, value_columns, data_result.dtypes, values)
+        elif not (
+            np.array_equal(self.layout[0], timepoints)
+            and list(self.layout[2]) == list(value_columns)
+        ):
+            return self.fail("chunks with different timepoints or columns")
+        self.update_moments(values)
+        self.update_reservoir(values)
+
+    def fail(self, reason):
+        logging.error("Can't summarize chunked result: %s", reason)
+        self.failed = True
+
+    def start(self, timepoints, unknowns, value_columns, dtypes, values):
+        self.layout = (timepoints, unknowns, value_columns, dtypes)
+        shape = values.shape[:2]
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self.reservoir = np.empty((*shape, self.sketch_size))
+
+    def update_moments(self, values):
+        with np.errstate(all="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            count = (~np.isnan(values)).sum(axis=-1)
+            mean = np.nan_to_num(np.nanmean(values, axis=-1))
+            m2 = np.nansum((values - mean[..., None]) ** 2, axis=-1)
+            self.min = np.fmin(self.min, np.nanmin(values, axis=-1))
+            self.max = np.fmax(self.max, np.nanmax(values, axis=-1))
+        total = self.count + count
+        safe_total = np.where(total > 0, total, 1)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / safe_total
+        self.m2 = self.m2 + m2 + delta**2 * self.count * count / safe_total
+        self.count = total
+
+    def update_reservoir(self, values):
+        num_samples = values.shape[-1]
+        filled = min(self.seen, self.sketch_size)
+        take = min(self.sketch_size - filled, num_samples)
+        self.reservoir[..., filled : filled + take] = values[..., :take]
+        # Algorithm R: sample i replaces a random slot with probability size / (i + 1)
+        rest = np.arange(take, num_samples)
+        if len(rest):
+            slots = self.rng.integers(0, self.seen + rest + 1)
+            keep = slots < self.sketch_size
+            self.reservoir[..., slots[keep]] = values[..., rest[keep]]
+        self.seen += num_samples
+
+    def result(self) -> Optional[pd.DataFrame]:
+        if self.failed or self.layout is None:
+            return None
+        timepoints, unknowns, value_columns, dtypes = self.layout
+        sketch = self.reservoir[..., : min(self.seen, self.sketch_size)]
+        with np.errstate(all="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            quantile_values = np.nanquantile(sketch, [0.5, *self.quantiles], axis=-1)
+            variance = self.m2 / (self.count - 1)
+        empty = self.count == 0
+        stats = {
+            "min": np.where(empty, np.nan, self.min),
+            "max": np.where(empty, np.nan, self.max),
+            "mean": np.where(empty, np.nan, self.mean),
+            "std": np.sqrt(np.where(self.count > 1, variance, np.nan)),
+            "median": quantile_values[0],
+            "quantiles": quantile_values[1:],
+        }
+        return summary_frame(
+            timepoints, unknowns, value_columns, dtypes, stats, self.quantiles
+        )
+
+
+@dataclass
+class ChunkedResult:
+    handle: str
+    path: str
+    summary: Optional[pd.DataFrame]
+
+
+def run_chunked(chunk_sizes, results, directory, output_format, quantiles, seed):
+    """
+    Stream the result tables of the chunks, in order, to the result file.
+    Sample ids are renumbered to run across chunks.
+
+    Only the trajectories are kept: evaluation quantiles and visualizations
+    describe a single chunk and are dropped.
+    """
+    writer = ResultWriter(directory, output_format)
+    summary = StreamingSummary(quantiles, seed=seed)
+    offset = 0
+    try:
+        for index, (num_samples, data_result) in enumerate(zip(chunk_sizes, results)):
+            data_result["sample_id"] += offset
+            writer.write(data_result)
+            summary.update(data_result)
+            offset += num_samples
+            logging.info(
+                "Chunk %s/%s done (%s samples)", index + 1, len(chunk_sizes), offset
+            )
+            del data_result
+    finally:
+        writer.close()
+    return ChunkedResult(writer.handle, writer.path, summary.result())
@@ -0,0 +1,40 @@
+"""
+In-memory cache of parsed AMR models for long-lived workers
+"""
+from __future__ import annotations
+
+import json
+import logging
+
+from mira.sources.amr import model_from_json
+
+from settings import settings
+from utils.cache import LRUCache, content_digest
+
+template_models = LRUCache(settings.MODEL_MEMORY_CACHE_SIZE)
+
+
+def load_template_model(amr_path):
+    with open(amr_path, "rb") as file:
+        content = file.read()
+    digest = content_digest(content)
+    template_model = template_models.get(digest)
+    if template_model is None:
+        template_model = model_from_json(json.loads(content))
+        template_models.put(digest, template_model)
+    else:
+        logging.debug(f"Reusing parsed model {digest}")
+    return template_model
+
+
+def resolve_models(kwargs):
+    """
+    Swap the AMR paths in pyciemss arguments for cached, already parsed models
+    """
+    if "model_path_or_json" in kwargs:
+        kwargs["model_path_or_json"] = load_template_model(kwargs["model_path_or_json"])
+    if "model_paths_or_jsons" in kwargs:
+        kwargs["model_paths_or_jsons"] = [
+            load_template_model(path) for path in kwargs["model_paths_or_jsons"]
+        ]
+    return kwargs
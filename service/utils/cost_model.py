@@ -0,0 +1,160 @@
+"""
+Estimate the peak memory and runtime of jobs and keep oversized ones out
+
+The work of a job is its estimated cost times the number of variables (states,
+parameters and observables) of the AMRs it simulates. Its runtime is that work
+times the seconds per unit of work of its operation, which workers learn from
+the jobs they finish. Its peak memory is the largest trajectory table it holds
+on top of the baseline of a worker, plus the streaming summary of chunked jobs.
+"""
+from __future__ import annotations
+
+import logging
+
+from fastapi import HTTPException, status
+from requests.exceptions import RequestException
+from rq.utils import utcnow
+
+from settings import settings
+from utils.cache import LRUCache
+from utils.chunking import summary_bytes
+from utils.tds import cache_model, model_cache
+
+RATES_KEY = "pyciemss:cost-model:seconds-per-unit"
+# Index, timepoint and sample id columns of every trajectory table
+ID_COLUMNS = 3
+
+# Variable counts by the cache key of the model, which changes with its content
+model_sizes = LRUCache(1024)
+
+
+def count_variables(model):
+    ode = model.get("semantics", {}).get("ode", {})
+    return max(
+        len(model.get("model", {}).get("states", []))
+        + len(ode.get("parameters", []))
+        + len(ode.get("observables", [])),
+        1,
+    )
+
+
+def fetch_model_size(model_config_id):
+    """
+    Count the variables of a configuration's model. The model is revalidated
+    with TDS and only downloaded again when it changed.
+    """
+    key = cache_model(model_config_id)
+    size = model_sizes.get(key)
+    if size is None:
+        # Just marked as recently used, so it isn't the next one evicted
+        size = count_variables(model_cache.read_json(key))
+        model_sizes.put(key, size)
+    return size
+
+
+def model_variables(request_payload):
+    """Total number of variables of the models a request simulates."""
+    total = 0
+    for model_config_id in request_payload.model_config_ids():
+        try:
+            total += fetch_model_size(model_config_id)
+        except RequestException as e:
+            logging.warning(
+                "Can't size model configuration %s (%s), assuming %s variables",
+                model_config_id,
+                e,
+                settings.DEFAULT_MODEL_VARIABLES,
+            )
+            total += settings.DEFAULT_MODEL_VARIABLES
+    return total or settings.DEFAULT_MODEL_VARIABLES
+
+
+def seconds_per_unit(redis_conn, sim_type):
+    rate = redis_conn.hget(RATES_KEY, sim_type)
+    return settings.COST_MODEL_SECONDS_PER_UNIT if rate is None else float(rate)
+
+
+def estimate(redis_conn, request_payload, sim_type):
+    variables = model_variables(request_payload)
+    cost = request_payload.estimated_cost()
+    work = cost * variables
+    columns = variables + ID_COLUMNS
+    peak_memory = (
+        settings.WORKER_BASE_MEMORY_BYTES
+        + request_payload.peak_rows() * columns * settings.BYTES_PER_RESULT_VALUE
+        + summary_bytes(request_payload.summary_timepoints(), variables)
+    )
+    return {
+        "sim_type": sim_type,
+        "cost": cost,
+        "work": work,
+        "peak_memory_bytes": int(peak_memory),
+        "runtime_seconds": work * seconds_per_unit(redis_conn, sim_type),
+    }
+
+
+def admit(redis_conn, request_payload, sim_type):
+    """
+    Estimate a job and check it against the memory and runtime budgets.
+
+    Jobs over the memory budget are always rejected. Jobs over the runtime
+    budget are rejected too, unless ADMISSION_POLICY is `downgrade`, in which
+    case they are flagged to run from the low priority queue.
+
+    Returns:
+        dict: The estimate, with `downgraded` set if the job must run last.
+    """
+    job_estimate = estimate(redis_conn, request_payload, sim_type)
+    job_estimate["downgraded"] = False
+    if job_estimate["peak_memory_bytes"] > settings.MAX_JOB_MEMORY_BYTES:
+        reject(
+            sim_type,
+            f"needs about {job_estimate['peak_memory_bytes'] / 2**30:.1f} GiB "
+            f"of memory, the limit is {settings.MAX_JOB_MEMORY_BYTES / 2**30:.1f} GiB",
+        )
+    if job_estimate["runtime_seconds"] > settings.MAX_JOB_RUNTIME:
+        if settings.ADMISSION_POLICY != "downgrade":
+            reject(
+                sim_type,
+                f"would run for about {job_estimate['runtime_seconds']:.0f}s, "
+                f"the limit is {settings.MAX_JOB_RUNTIME:.0f}s",
+            )
+        logging.info(
+            "Downgrading %s estimated to run for %.0fs",
+            sim_type,
+            job_estimate["runtime_seconds"],
+        )
+        job_estimate["downgraded"] = True
+    return job_estimate
+
+
+def reject(sim_type, reason):
+    logging.info("Rejecting %s request that %s", sim_type, reason)
+    raise HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=f"The {sim_type} request {reason}. "
+        "Reduce the samples, iterations or timepoints of the request.",
+    )
+
+
+def record_runtime(job):
+    """Fold the runtime of a finished job into its operation's rate."""
+    job_estimate = job.meta.get("estimate")
+    if not job_estimate or not job_estimate["work"] or job.started_at is None:
+        return
+    elapsed = (utcnow() - job.started_at).total_seconds()
+    rate = elapsed / job_estimate["work"]
+    sim_type = job_estimate["sim_type"]
+    previous = job.connection.hget(RATES_KEY, sim_type)
+    if previous is not None:
+        smoothing = settings.COST_MODEL_SMOOTHING
+        rate = smoothing * rate + (1 - smoothing) * float(previous)
+    job.connection.hset(RATES_KEY, sim_type, rate)
+    logging.info(
+        "%s took %.1fs for %.3g units of work, %s rate is now %.3g s/unit",
+        job.id,
+        elapsed,
+        job_estimate["work"],
+        sim_type,
+        rate,
+    )
@@ -0,0 +1,110 @@
+"""
+Job status and progress events for streaming clients
+
+Events are appended to a Redis stream per job and per user, which the API
+relays as server-sent events. Entry ids double as SSE event ids, so a client
+that reconnects with `Last-Event-ID` resumes where it left off.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from settings import settings
+
+TERMINAL_EVENT_STATUSES = {"complete", "error", "failed", "cancelled"}
+
+
+def job_stream_key(job_id):
+    return f"pyciemss:events:job:{job_id}"
+
+
+def user_stream_key(user_id):
+    return f"pyciemss:events:user:{user_id}"
+
+
+def publish_event(connection, job_id, user_id, event, data):
+    """Append an event to the job's stream and, if known, the user's stream."""
+    fields = {"event": event, "data": json.dumps({"job_id": job_id, **data})}
+    keys = [job_stream_key(job_id)]
+    if user_id:
+        keys.append(user_stream_key(user_id))
+    try:
+        pipe = connection.pipeline(transaction=False)
+        for key in keys:
+            pipe.xadd(
+                key, fields, maxlen=settings.EVENT_STREAM_MAXLEN, approximate=True
+            )
+            pipe.expire(key, settings.EVENT_STREAM_TTL)
+        pipe.execute()
+    except RedisError as e:
+        # Events are best effort, they must never fail the job itself
+        logging.warning("%s: Failed to publish %s event (%s)", job_id, event, e)
+
+
+def publish_status(connection, job_id, user_id, status, **data):
+    publish_event(connection, job_id, user_id, "status", {"status": status, **data})
+
+
+class ProgressEvents:
+    """
+    Publishes the progress hook calls of a running job as events, at most
+    EVENT_PROGRESS_MAX_PER_SECOND of them. The latest skipped call is
+    published by `flush`.
+    """
+
+    def __init__(self, connection, job_id, user_id, operation_name):
+        self.connection = connection
+        self.job_id = job_id
+        self.user_id = user_id
+        self.operation_name = operation_name
+        max_per_second = settings.EVENT_PROGRESS_MAX_PER_SECOND
+        self.interval = 1 / max_per_second if max_per_second > 0 else 0
+        self.iteration = 0
+        self.last_published = 0.0
+        self.pending = None
+
+    def to_event(self, args):
+        try:
+            if self.operation_name == "optimize":
+                (current_results,) = args
+                return {"current_results": current_results.tolist()}
+            progress, loss = args
+            return {"progress": progress, "loss": float(loss)}
+        except (TypeError, ValueError, AttributeError):
+            logging.debug("%s: Unexpected progress hook arguments", self.job_id)
+            return {}
+
+    def wrap(self, hook):
+        def progress_hook(*args):
+            self.record(args)
+            return hook(*args)
+
+        return progress_hook
+
+    def record(self, args):
+        self.iteration += 1
+        self.pending = (self.iteration, args)
+        if time.monotonic() - self.last_published >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending is None:
+            return
+        iteration, args = self.pending
+        self.pending = None
+        self.last_published = time.monotonic()
+        publish_event(
+            self.connection,
+            self.job_id,
+            self.user_id,
+            "progress",
+            {
+                "type": self.operation_name,
+                "iteration": iteration,
+                **self.to_event(args),
+            },
+        )
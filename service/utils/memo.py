@@ -0,0 +1,71 @@
+"""
+Reuse the results of identical requests
+
+A memoizable request is reduced to a digest of its canonical JSON and the
+versions of the TDS records it reads. The first job with a digest claims it
+in Redis; later jobs with the same digest copy that job's result artifacts
+instead of running the operation again.
+"""
+from __future__ import annotations
+
+import json
+import logging
+
+from settings import settings
+from utils.cache import content_digest
+
+# Fields that don't change what a job computes
+IGNORED_FIELDS = {"user_id", "memoize"}
+
+
+def memo_key(digest):
+    return f"pyciemss:memo:{digest}"
+
+
+def request_digest(request, sim_type):
+    canonical = {
+        "type": sim_type,
+        "request": request.dict(exclude=IGNORED_FIELDS),
+        "inputs": request.input_versions(),
+    }
+    return content_digest(json.dumps(canonical, sort_keys=True, default=str).encode())
+
+
+def claim(redis_conn, digest, simulation_id):
+    """
+    Register `simulation_id` as the run computing `digest`.
+
+    Returns:
+        None if the claim succeeded, otherwise the entry of the simulation
+        that already computed or is computing the digest.
+    """
+    key = memo_key(digest)
+    entry = {"simulation_id": simulation_id, "status": "queued"}
+    while True:
+        if redis_conn.set(key, json.dumps(entry), nx=True, ex=settings.MEMO_TTL):
+            return None
+        existing = redis_conn.get(key)
+        if existing is not None:  # Otherwise it expired in between, try again
+            return json.loads(existing)
+
+
+def complete(redis_conn, digest, simulation_id, result_files):
+    entry = {
+        "simulation_id": simulation_id,
+        "status": "complete",
+        "result_files": result_files,
+    }
+    redis_conn.set(memo_key(digest), json.dumps(entry), ex=settings.MEMO_TTL)
+
+
+def fetch(redis_conn, digest):
+    entry = redis_conn.get(memo_key(digest))
+    return None if entry is None else json.loads(entry)
+
+
+def release(redis_conn, digest, simulation_id):
+    """Forget the claim of a simulation that won't produce results."""
+    entry = fetch(redis_conn, digest)
+    if entry is not None and entry["simulation_id"] == simulation_id:
+        logging.info("Releasing memoized results of %s", simulation_id)
+        redis_conn.delete(memo_key(digest))
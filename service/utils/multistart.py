@@ -0,0 +1,130 @@
+"""
+Run several optimizations of one request and keep the best
+
+Every start runs pyciemss' basinhopping with its own seed and, after the first,
+from a random initial guess within the bounds of the interventions. With
+OPTIMIZE_PROCESSES above 1 the starts run in a local process pool and their
+progress is relayed to the progress hook of the job. The evaluations within a
+start stay sequential, each basinhopping step depends on the previous one, so
+only requests with several starts finish sooner.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+import dill
+import numpy as np
+
+from settings import settings
+from utils.sharding import process_pool, shard_context
+
+
+def start_kwargs(kwargs, index, seed):
+    """pyciemss arguments of the `index`th start."""
+    if index == 0:
+        return kwargs
+    lower, upper = kwargs["bounds_interventions"]
+    if any(bound is None for bound in [*lower, *upper]):
+        return kwargs
+    initial_guess = np.random.default_rng(seed).uniform(lower, upper)
+    return {**kwargs, "initial_guess_interventions": initial_guess.tolist()}
+
+
+def objective_value(output):
+    try:
+        return float(output["OptResults"]["fun"])
+    except (KeyError, TypeError, ValueError):
+        return np.inf
+
+
+def best_start(outputs):
+    """Index of the start with the lowest objective, the first one on ties."""
+    values = [objective_value(output) for output in outputs]
+    return min(range(len(values)), key=lambda index: (values[index], index))
+
+
+def without_hook(kwargs):
+    # Objectives and interventions are closures, which dill can serialize
+    return {key: value for key, value in kwargs.items() if key != "progress_hook"}
+
+
+def optimize_start(kwargs_blob, seed, progress_queue):
+    import pyro
+    from pyciemss import interfaces
+
+    kwargs = dill.loads(kwargs_blob)
+    kwargs["progress_hook"] = progress_queue.put
+    pyro.set_rng_seed(seed)
+    return interfaces.optimize(**kwargs)
+
+
+class EvaluationCounter:
+    """Wraps a progress hook to count objective evaluations."""
+
+    def __init__(self, hook):
+        self.hook = hook
+        self.evaluations = 0
+
+    def __call__(self, current_results):
+        self.evaluations += 1
+        return self.hook(current_results)
+
+
+def run_multistart(optimize, kwargs, seeds):
+    counter = EvaluationCounter(kwargs["progress_hook"])
+    kwargs = {**kwargs, "progress_hook": counter}
+    started = time.monotonic()
+    processes = min(settings.OPTIMIZE_PROCESSES, len(seeds))
+    if processes > 1:
+        outputs = optimize_in_processes(kwargs, seeds, processes)
+    else:
+        import pyro
+
+        outputs = []
+        for index, seed in enumerate(seeds):
+            pyro.set_rng_seed(seed)
+            outputs.append(optimize(**start_kwargs(kwargs, index, seed)))
+
+    best = best_start(outputs)
+    elapsed = time.monotonic() - started
+    logging.info(
+        "Start %s of %s is the best (objective values: %s); "
+        "%s evaluations in %.1fs, %.2f evaluations/s",
+        best,
+        len(outputs),
+        [objective_value(output) for output in outputs],
+        counter.evaluations,
+        elapsed,
+        counter.evaluations / elapsed if elapsed > 0 else 0,
+    )
+    return outputs[best]
+
+
+def optimize_in_processes(kwargs, seeds, processes):
+    progress_hook = kwargs["progress_hook"]
+    # Progress hooks publish through the connections of this process
+    with shard_context().Manager() as manager, process_pool(processes) as executor:
+        progress_queue = manager.Queue()
+
+        def relay():
+            for current_results in iter(progress_queue.get, None):
+                progress_hook(current_results)
+
+        relay_thread = threading.Thread(target=relay, daemon=True)
+        relay_thread.start()
+        try:
+            starts = [
+                executor.submit(
+                    optimize_start,
+                    dill.dumps(without_hook(start_kwargs(kwargs, index, seed))),
+                    seed,
+                    progress_queue,
+                )
+                for index, seed in enumerate(seeds)
+            ]
+            return [start.result() for start in starts]
+        finally:
+            progress_queue.put(None)
+            relay_thread.join()
@@ -0,0 +1,269 @@
+"""
+Store inferred parameters as a bundle of named tensors instead of a pickle
+
+The bundle uses the safetensors layout: an 8 byte little-endian header size,
+a JSON header with the dtype, shape and byte range of every tensor plus string
+metadata, then the raw tensor buffers. Loading it runs no code, and a loaded
+guide's parameters are backed by a copy-on-write mapping of the file.
+
+A calibration's guide is stored as its state dict plus what is needed to build
+an empty guide of the same shape: the guide class, its rank and the shape and
+support of every latent site, for every part of an AutoGuideList. Guides that
+can't be described this way are only stored with dill.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import struct
+
+import numpy as np
+
+DTYPES = {
+    "F64": np.float64,
+    "F32": np.float32,
+    "F16": np.float16,
+    "I64": np.int64,
+    "I32": np.int32,
+    "I16": np.int16,
+    "I8": np.int8,
+    "U8": np.uint8,
+    "BOOL": np.bool_,
+}
+DTYPE_CODES = {np.dtype(dtype): code for code, dtype in DTYPES.items()}
+
+# Supports of latent sites that keep their shape when unconstrained
+SUPPORTED_CONSTRAINTS = {
+    "Real",
+    "Interval",
+    "HalfOpenInterval",
+    "GreaterThan",
+    "GreaterThanEq",
+    "LessThan",
+    "IndependentConstraint",
+}
+# Guides of pyro.infer.autoguide that are rebuilt from their latent sites
+SUPPORTED_GUIDES = {
+    "AutoDelta",
+    "AutoNormal",
+    "AutoDiagonalNormal",
+    "AutoMultivariateNormal",
+    "AutoLowRankMultivariateNormal",
+}
+
+
+def dump_tensors(tensors: dict, metadata: dict) -> bytes:
+    """Serialize numpy arrays by name, with string metadata"""
+    header = {"__metadata__": metadata}
+    buffers = []
+    offset = 0
+    for name, array in tensors.items():
+        array = np.ascontiguousarray(array)
+        header[name] = {
+            "dtype": DTYPE_CODES[array.dtype],
+            "shape": list(array.shape),
+            "data_offsets": [offset, offset + array.nbytes],
+        }
+        buffers.append(array.tobytes())
+        offset += array.nbytes
+    encoded = json.dumps(header).encode()
+    # Buffers start 8 byte aligned
+    encoded += b" " * (-len(encoded) % 8)
+    return b"".join([struct.pack("<Q", len(encoded)), encoded, *buffers])
+
+
+def load_tensors(path):
+    """
+    Map the tensors of a bundle from the file at `path`.
+
+    Returns:
+        tuple: numpy arrays by name, backed by a copy-on-write mapping of the
+            file, and the metadata of the bundle.
+    """
+    with open(path, "rb") as file:
+        (header_size,) = struct.unpack("<Q", file.read(8))
+        header = json.loads(file.read(header_size))
+    metadata = header.pop("__metadata__", {})
+    tensors = {}
+    for name, info in header.items():
+        start, end = info["data_offsets"]
+        dtype = np.dtype(DTYPES[info["dtype"]])
+        if end == start:
+            tensors[name] = np.zeros(info["shape"], dtype)
+            continue
+        tensors[name] = np.memmap(
+            path,
+            dtype=dtype,
+            mode="c",
+            offset=8 + header_size + start,
+            shape=tuple(info["shape"]),
+        )
+    return tensors, metadata
+
+
+def describe_constraint(constraint):
+    name = type(constraint).__name__.lstrip("_")
+    if name not in SUPPORTED_CONSTRAINTS:
+        raise ValueError(f"Unsupported support {constraint}")
+    description = {"name": name}
+    if name == "IndependentConstraint":
+        description["base"] = describe_constraint(constraint.base_constraint)
+        description["reinterpreted_batch_ndims"] = constraint.reinterpreted_batch_ndims
+        return description
+    for bound in ["lower_bound", "upper_bound"]:
+        if hasattr(constraint, bound):
+            description[bound] = np.asarray(getattr(constraint, bound)).tolist()
+    return description
+
+
+def build_constraint(description):
+    import torch
+    from torch.distributions import constraints
+
+    name = description["name"]
+    if name == "IndependentConstraint":
+        return constraints.independent(
+            build_constraint(description["base"]),
+            description["reinterpreted_batch_ndims"],
+        )
+    bounds = {
+        key: torch.as_tensor(value)
+        for key, value in description.items()
+        if key in ("lower_bound", "upper_bound")
+    }
+    return getattr(constraints, f"_{name}")(**bounds)
+
+
+def init_to_unconstrained_zero(site):
+    # Sites of the rebuilt model can't be sampled, the state dict sets the
+    # actual values anyway
+    import torch
+    from torch.distributions import biject_to
+
+    fn = site["fn"]
+    return biject_to(fn.support)(torch.zeros(fn.shape()))
+
+
+def describe_guide(guide):
+    """The class, options and latent sites an autoguide is rebuilt from."""
+    name = type(guide).__name__
+    if name not in SUPPORTED_GUIDES or guide.prototype_trace is None:
+        raise ValueError(f"Unsupported guide {name}")
+    sites = []
+    for site_name, site in guide.prototype_trace.iter_stochastic_nodes():
+        if site["cond_indep_stack"]:
+            raise ValueError(f"Site {site_name} is in a plate")
+        fn = site["fn"]
+        sites.append(
+            {
+                "name": site_name,
+                "batch_shape": list(fn.batch_shape),
+                "event_shape": list(fn.event_shape),
+                "support": describe_constraint(fn.support),
+            }
+        )
+    options = {"rank": guide.rank} if hasattr(guide, "rank") else {}
+    return {"guide": name, "options": options, "sites": sites}
+
+
+def dump_guide(guide):
+    """
+    Serialize a trained autoguide, or an AutoGuideList of them as pyciemss
+    calibrations return. The parameters of a list are stored under the index
+    of their part, e.g. `1.loc`, and its parts are described in the metadata.
+
+    Returns:
+        bytes: The bundle, or None if the guide can't be rebuilt from one.
+    """
+    name = type(guide).__name__
+    try:
+        if name == "AutoGuideList":
+            metadata = {
+                "guide": name,
+                "parts": json.dumps([describe_guide(part) for part in guide]),
+            }
+        else:
+            description = describe_guide(guide)
+            metadata = {
+                "guide": name,
+                "options": json.dumps(description["options"]),
+                "sites": json.dumps(description["sites"]),
+            }
+        tensors = {
+            key: value.detach().cpu().numpy()
+            for key, value in guide.state_dict().items()
+        }
+        return dump_tensors(tensors, metadata)
+    except Exception as error:
+        logging.warning(f"Can't store {name} as tensors, only using dill: {error}")
+        return None
+
+
+def site_model(sites):
+    import pyro
+    import torch
+
+    supports = {site["name"]: build_constraint(site["support"]) for site in sites}
+
+    def model(*args, **kwargs):
+        # Only the names, shapes and supports of the latent sites shape a guide
+        for site in sites:
+            pyro.sample(
+                site["name"],
+                pyro.distributions.ImproperUniform(
+                    supports[site["name"]],
+                    torch.Size(site["batch_shape"]),
+                    torch.Size(site["event_shape"]),
+                ),
+            )
+
+    return model
+
+
+def build_guide(description):
+    from pyro.infer import autoguide
+
+    guide_type = getattr(autoguide, description["guide"])
+    guide = guide_type(
+        site_model(description["sites"]),
+        init_loc_fn=init_to_unconstrained_zero,
+        **description["options"],
+    )
+    # Outside of a call the setup doesn't register parameters in the param store
+    guide._setup_prototype()
+    return guide
+
+
+def load_guide(path):
+    """Rebuild the guide stored at `path` by `dump_guide`."""
+    import torch
+    from pyro.infer.autoguide import AutoGuideList
+    from pyro.infer.autoguide.initialization import InitMessenger
+
+    tensors, metadata = load_tensors(path)
+    if metadata["guide"] == "AutoGuideList":
+        parts = json.loads(metadata["parts"])
+        # Unlike its parts, the list samples the model to set itself up
+        model = InitMessenger(init_to_unconstrained_zero)(
+            site_model([site for part in parts for site in part["sites"]])
+        )
+        guide = AutoGuideList(model)
+        for part in parts:
+            guide.append(build_guide(part))
+        guide._setup_prototype()
+        # Parts use the plates of the list, which are otherwise made by a call
+        guide._create_plates()
+    else:
+        guide = build_guide(
+            {
+                "guide": metadata["guide"],
+                "options": json.loads(metadata["options"]),
+                "sites": json.loads(metadata["sites"]),
+            }
+        )
+    # Assigning keeps the mapped buffers, copying would read them all in
+    guide.load_state_dict(
+        {key: torch.from_numpy(value) for key, value in tensors.items()},
+        assign=True,
+    )
+    return guide
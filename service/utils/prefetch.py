@@ -0,0 +1,59 @@
+"""
+Concurrent resolution of the inputs an operation fetches from TDS
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from settings import settings
+
+
+class InputResolver:
+    """
+    Runs the independent input fetches of a job concurrently.
+
+    Identical fetches (same function and arguments) only run once and every
+    fetch is timed. Work that depends on fetched inputs waits on the returned
+    futures.
+    """
+
+    def __init__(self, job_id, max_workers=None):
+        self.job_id = job_id
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.PREFETCH_CONCURRENCY
+        )
+        self.futures: dict[str, Future] = {}
+        self.timings: dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, fn, *args) -> Future:
+        key = f"{fn.__name__}({json.dumps(args, default=str)})"
+        with self.lock:
+            if key not in self.futures:
+                self.futures[key] = self.executor.submit(self._timed, key, fn, *args)
+            return self.futures[key]
+
+    def _timed(self, key, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.timings[key] = time.perf_counter() - start
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        logging.info(
+            "%s input fetch timings: %s",
+            self.job_id,
+            {key: f"{elapsed:.3f}s" for key, elapsed in self.timings.items()},
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,7 +1,9 @@
 import pika
 import json
+import threading
 import time
 import logging
+from typing import Set
 
 from settings import settings
 
@@ -52,61 +54,204 @@ def mock_rabbitmq_consumer():
     channel.start_consuming()
 
 
-def gen_calibrate_rabbitmq_hook(job_id):
-    def get_new_rabbit_conn():
-        connection = pika.BlockingConnection(
-            conn_config,
+class ProgressPublisher:
+    """
+    Publishes progress messages for a job over one persistent connection.
+
+    `publish` never blocks the caller: messages are handed to a background
+    thread that sends at most PROGRESS_MAX_PER_SECOND of them, and a message
+    still waiting to be sent is replaced (coalesced) by a newer one. Only
+    every PROGRESS_EVERY-th call is considered at all. A failed publish is
+    dropped and the connection is re-established with exponential backoff.
+    Creating the publisher connects synchronously, so callers can still fall
+    back to logging when RabbitMQ is unreachable.
+    """
+
+    def __init__(self, job_id, max_per_second=None, every=None):
+        self.job_id = job_id
+        max_per_second = max_per_second or settings.PROGRESS_MAX_PER_SECOND
+        self.interval = 1 / max_per_second if max_per_second > 0 else 0
+        self.every = max(every or settings.PROGRESS_EVERY, 1)
+        self.calls = 0
+        self.published = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.pending = None
+        self.latest = None
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.connection = pika.BlockingConnection(conn_config)
+        self.channel = self.connection.channel()
+        self.thread = threading.Thread(
+            target=self._run, name=f"progress-{job_id}", daemon=True
         )
-        return connection
+        self.thread.start()
+        publishers.add(self)
+
+    def publish(self, message: dict):
+        with self.condition:
+            self.calls += 1
+            self.latest = message
+            if (self.calls - 1) % self.every != 0:
+                self.skipped += 1
+                return
+            self._enqueue(message)
+
+    def _enqueue(self, message):
+        if self.pending is not None:
+            self.coalesced += 1
+        self.pending = message
+        self.latest = None
+        self.condition.notify()
+
+    def _run(self):
+        # The connection is only used from this thread, including to close it
+        try:
+            self._publish_pending()
+        finally:
+            self._disconnect()
+
+    def _publish_pending(self):
+        last_sent = 0.0
+        backoff = 0.5
+        while True:
+            message = None
+            with self.condition:
+                if self.pending is None and not self.closed:
+                    self.condition.wait(timeout=1)
+                if self.pending is None and self.closed:
+                    return
+                if self.pending is not None:
+                    # Newer messages keep replacing the pending one meanwhile,
+                    # and each of them wakes this wait up early
+                    send_at = last_sent + self.interval
+                    while not self.closed and time.monotonic() < send_at:
+                        self.condition.wait(timeout=send_at - time.monotonic())
+                    message, self.pending = self.pending, None
+            if message is None:
+                # Outside of the lock, so publish never waits on broker I/O
+                self._heartbeat()
+                continue
+
+            try:
+                if self.channel is None:
+                    self._connect()
+                self.channel.basic_publish(
+                    exchange="",
+                    routing_key="simulation-status",
+                    body=json.dumps(message),
+                )
+                self.published += 1
+                backoff = 0.5
+            except Exception as e:
+                self.dropped += 1
+                logging.warning(
+                    "%s: Failed to publish progress (%s), reconnecting in %.1fs",
+                    self.job_id,
+                    e,
+                    backoff,
+                )
+                self._disconnect()
+                retry_at = time.monotonic() + backoff
+                with self.condition:
+                    while not self.closed and time.monotonic() < retry_at:
+                        self.condition.wait(timeout=retry_at - time.monotonic())
+                backoff = min(backoff * 2, settings.PROGRESS_MAX_BACKOFF)
+            last_sent = time.monotonic()
+
+    def _connect(self):
+        self.connection = pika.BlockingConnection(conn_config)
+        self.channel = self.connection.channel()
 
-    # FIXME: https://github.com/DARPA-ASKEM/pyciemss-service/issues/128 Nasty temp hack to get around weird test setup that depends on connection to fail
-    conn_dummy = get_new_rabbit_conn()
-    conn_dummy.close()
+    def _disconnect(self):
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+        self.channel = None
+
+    def _heartbeat(self):
+        # BlockingConnection only answers broker heartbeats while processing
+        # I/O, so keep it serviced while waiting for messages
+        try:
+            if self.connection is not None:
+                self.connection.process_data_events(time_limit=0)
+        except Exception:
+            self._disconnect()
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "skipped": self.skipped,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
+
+    def close(self, timeout=5):
+        """Flush the latest progress message and close the connection."""
+        with self.condition:
+            if self.closed:
+                return
+            if self.latest is not None:
+                self._enqueue(self.latest)
+            self.closed = True
+            self.condition.notify()
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            # It closes the connection itself once its last publish returns
+            logging.warning("%s: progress publisher still flushing", self.job_id)
+        publishers.discard(self)
+        logging.info("%s progress publisher stats: %s", self.job_id, self.stats())
+
+
+publishers: Set[ProgressPublisher] = set()
+
+
+def close_progress_publishers():
+    for publisher in list(publishers):
+        publisher.close()
+
+
+def gen_calibrate_rabbitmq_hook(job_id):
+    publisher = ProgressPublisher(job_id)
 
     def hook(progress, loss):
-        conn = get_new_rabbit_conn()
-        channel = conn.channel()
-        channel.basic_publish(
-            exchange="",
-            routing_key="simulation-status",
-            body=json.dumps(
-                {
-                    "job_id": job_id,
-                    "type": "calibrate",
-                    "progress": progress,
-                    "loss": str(loss),
-                }
-            ),
+        publisher.publish(
+            {
+                "job_id": job_id,
+                "type": "calibrate",
+                "progress": progress,
+                "loss": str(loss),
+            }
         )
-        conn.close()
 
     return hook
 
 
 class OptimizeHook:
     def __init__(self, job_id, total_possible_iterations):
-        connection = pika.BlockingConnection(
-            conn_config,
-        )
-        self.channel = connection.channel()
+        self.publisher = ProgressPublisher(job_id)
         self.job_id = job_id
         self.type = "optimize"
         self.result = []
         self.step = 0
         self.total_possible_iterations = total_possible_iterations
+        self.started = time.monotonic()
 
     def __call__(self, current_results):
         self.step += 1
-        self.channel.basic_publish(
-            exchange="",
-            routing_key="simulation-status",
-            body=json.dumps(
-                {
-                    "job_id": self.job_id,
-                    "progress": self.step,
-                    "type": self.type,
-                    "current_results": current_results.tolist(),
-                    "total_possible_iterations": self.total_possible_iterations,
-                }
-            ),
+        elapsed = time.monotonic() - self.started
+        self.publisher.publish(
+            {
+                "job_id": self.job_id,
+                "progress": self.step,
+                "type": self.type,
+                "current_results": current_results.tolist(),
+                "total_possible_iterations": self.total_possible_iterations,
+                "evaluations_per_second": self.step / elapsed if elapsed > 0 else 0,
+            }
         )
@@ -2,28 +2,79 @@
 from __future__ import annotations
 
 import logging
+import zlib
+from base64 import b64decode
 from uuid import uuid4
 
 from fastapi import Response, status
-from redis import Redis
+from redis import ConnectionPool, Redis
+from redis import asyncio as aioredis
 from rq import Queue
 from rq.exceptions import NoSuchJobError
-from rq.job import Job
+from rq.job import Dependency, Job
+from rq.results import Result
 from rq.command import send_stop_job_command
+from rq.serializers import resolve_serializer
 
 from settings import settings
+from utils.cache import TTLCache
+from utils.cancellation import JobCancelled
+from utils.events import publish_status
+from utils import memo
+from utils.cost_model import admit
+from utils.scheduling import route, track_active_job, untrack_active_job
 from utils.tds import update_tds_status, create_tds_job, cancel_tds_job
 
 logging.basicConfig()
 logging.getLogger().setLevel(logging.DEBUG)
 
 
+redis_pool = ConnectionPool(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+)
+async_redis_pool = aioredis.ConnectionPool(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+)
+
+
 def get_redis():
-    return Redis(settings.REDIS_HOST, settings.REDIS_PORT)
+    return Redis(connection_pool=redis_pool)
+
+
+def get_async_redis():
+    return aioredis.Redis(connection_pool=async_redis_pool)
+
+
+# Every open event stream holds a connection while it waits for new events
+stream_redis_pool = aioredis.ConnectionPool(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    max_connections=settings.EVENT_STREAM_MAX_CLIENTS,
+)
+
+
+def get_stream_redis():
+    return aioredis.Redis(connection_pool=stream_redis_pool)
+
+
+def untrack_job_on_success(job, connection, result, *args, **kwargs):
+    untrack_active_job(connection, job.meta.get("user_id"), str(job.id))
 
 
 def update_status_on_job_fail(job, connection, etype, value, traceback):
+    untrack_active_job(connection, job.meta.get("user_id"), str(job.id))
+    if "memo_digest" in job.meta:
+        memo.release(connection, job.meta["memo_digest"], str(job.id))
+    if etype is not None and issubclass(etype, JobCancelled):
+        # `kill_job` already reported the cancellation
+        logging.info(f"Job {job.id} stopped after it was cancelled")
+        return
     update_tds_status(str(job.id), "error")
+    publish_status(connection, str(job.id), job.meta.get("user_id"), "error")
     log_message = f"""
         ###############################
 
@@ -36,7 +87,19 @@ def update_status_on_job_fail(job, connection, etype, value, traceback):
     logging.exception(log_message)
 
 
-def create_job(request_payload, sim_type, redis_conn):
+def update_batch_status_on_job_fail(job, connection, etype, value, traceback):
+    cancelled = etype is not None and issubclass(etype, JobCancelled)
+    status = "cancelled" if cancelled else "error"
+    for scenario_id, scenario in job.meta.get("scenarios", {}).items():
+        if scenario["status"] not in ("complete", "error"):
+            scenario["status"] = status
+            update_tds_status(scenario_id, status)
+            publish_status(connection, scenario_id, job.meta.get("user_id"), status)
+    job.save_meta()
+    update_status_on_job_fail(job, connection, etype, value, traceback)
+
+
+def create_simulation(request_payload, sim_type):
     workflow_id = f"{uuid4()}"
 
     payload = {
@@ -51,46 +114,197 @@ def create_job(request_payload, sim_type, redis_conn):
     logging.info(payload)
 
     res = create_tds_job(payload)
-    job_id = res["id"]
-
     logging.info(res)
+    return res["id"]
 
-    queue = Queue(connection=redis_conn, default_timeout=-1)
+
+def create_job(request_payload, sim_type, redis_conn):
+    estimate = admit(redis_conn, request_payload, sim_type)
+    job_id = create_simulation(request_payload, sim_type)
+
+    func = "execute.run"
+    kwargs = {"job_id": job_id}
+    meta = {"user_id": request_payload.user_id, "estimate": estimate}
+    depends_on = None
+    if getattr(request_payload, "memoize", False):
+        digest = memo.request_digest(request_payload, sim_type)
+        source = memo.claim(redis_conn, digest, job_id)
+        if source is None:
+            meta["memo_digest"] = digest
+        else:
+            # Copy the results of the identical run, once it has finished
+            logging.info("%s reuses the results of %s", job_id, source)
+            func = "execute.run_memoized"
+            kwargs.update(source_id=source["simulation_id"], digest=digest)
+            if source["status"] != "complete" and Job.exists(
+                source["simulation_id"], connection=redis_conn
+            ):
+                depends_on = Dependency(
+                    jobs=[source["simulation_id"]], allow_failure=True
+                )
+
+    queue_name, timeout = route(redis_conn, request_payload, sim_type, estimate)
+    queue = Queue(queue_name, connection=redis_conn)
     queue.enqueue_call(
-        func="execute.run",
+        func=func,
         args=[request_payload],
-        kwargs={"job_id": job_id},
+        kwargs=kwargs,
+        timeout=timeout,
         job_id=job_id,
+        on_success=untrack_job_on_success,
         on_failure=update_status_on_job_fail,
+        meta=meta,
+        depends_on=depends_on,
+    )
+    track_active_job(redis_conn, request_payload.user_id, job_id)
+    publish_status(redis_conn, job_id, request_payload.user_id, "queued")
+
+    return {"simulation_id": job_id, "estimate": {**estimate, "queue": queue_name}}
+
+
+def scenario_key(scenario_id):
+    return f"batch-scenario:{scenario_id}"
+
+
+def create_batch_job(request_payload, sim_type, redis_conn):
+    """
+    Create one TDS simulation per scenario plus one for the batch itself, then
+    enqueue a single job that runs every scenario.
+    """
+    estimate = admit(redis_conn, request_payload, sim_type)
+    scenarios = {}
+    for scenario in request_payload.scenarios():
+        scenario_id = create_simulation(scenario, sim_type)
+        scenarios[scenario_id] = {
+            "policy_intervention_id": scenario.policy_intervention_id,
+            "status": "queued",
+        }
+    job_id = create_simulation(request_payload, sim_type)
+    # Scenarios aren't jobs, their status is looked up in the batch job
+    with redis_conn.pipeline(transaction=False) as pipe:
+        for scenario_id in scenarios:
+            pipe.set(scenario_key(scenario_id), job_id, ex=settings.MEMO_TTL)
+        pipe.execute()
+
+    queue_name, timeout = route(redis_conn, request_payload, sim_type, estimate)
+    queue = Queue(queue_name, connection=redis_conn)
+    queue.enqueue_call(
+        func="execute.run_batch",
+        args=[request_payload],
+        kwargs={"job_id": job_id, "scenario_ids": list(scenarios)},
+        timeout=timeout,
+        job_id=job_id,
+        on_success=untrack_job_on_success,
+        on_failure=update_batch_status_on_job_fail,
+        meta={
+            "user_id": request_payload.user_id,
+            "scenarios": scenarios,
+            "estimate": estimate,
+        },
     )
+    track_active_job(redis_conn, request_payload.user_id, job_id)
+    for simulation_id in [*scenarios, job_id]:
+        publish_status(redis_conn, simulation_id, request_payload.user_id, "queued")
+
+    return {
+        "simulation_id": job_id,
+        "scenario_ids": list(scenarios),
+        "estimate": {**estimate, "queue": queue_name},
+    }
+
+
+TERMINAL_STATUSES = {"finished", "failed", "stopped", "canceled"}
 
-    return {"simulation_id": job_id}
+# Only terminal statuses are cached since they never change again
+status_cache = TTLCache(settings.STATUS_CACHE_SIZE, settings.STATUS_CACHE_TTL)
 
 
-def fetch_job_status(job_id, redis_conn):
-    """Fetch a job's results from RQ.
+def decode_exc_info(raw_exc_info):
+    try:
+        return zlib.decompress(raw_exc_info).decode()
+    except zlib.error:
+        return raw_exc_info.decode()
+
+
+async def fetch_job_statuses(job_ids, redis_conn):
+    """Fetch the status of many jobs in one pipelined Redis round trip.
+
+    Only the `status` and `exc_info` fields of each job and its latest
+    result are read, the pickled job itself is never loaded.
 
     Args:
-        job_id (uuid): The id of the job being run in RQ.
+        job_ids (list[uuid]): The ids of the jobs being run in RQ.
 
     Returns:
-        Response:
-            status_code: 200 if successful, 404 if job does not exist.
-            content: contains the job's results.
+        dict: Maps every job id to its `(status, exc_info)`, where status
+            is None if the job does not exist.
     """
-    try:
-        job = Job.fetch(job_id, connection=redis_conn)
-    except NoSuchJobError:
-        return (
-            Response(
-                status_code=status.HTTP_404_NOT_FOUND,
-                content=f"Simulation {job_id} not found",
-            ),
-            None,
-        )
-    else:
-        result = job.get_status()
-        return result, job.exc_info
+    statuses = {}
+    uncached = []
+    for job_id in dict.fromkeys(job_ids):
+        cached = status_cache.get(job_id)
+        if cached is None:
+            uncached.append(job_id)
+        else:
+            statuses[job_id] = cached
+    if not uncached:
+        return statuses
+
+    async with redis_conn.pipeline(transaction=False) as pipe:
+        for job_id in uncached:
+            pipe.hmget(Job.key_for(job_id), "status", "exc_info")
+            pipe.xrevrange(Result.get_key(job_id), "+", "-", count=1)
+        replies = await pipe.execute()
+
+    for job_id, (job_status, raw_exc_info), latest in zip(
+        uncached, replies[::2], replies[1::2]
+    ):
+        if job_status is None:
+            statuses[job_id] = (None, None)
+            continue
+        job_status = job_status.decode()
+        exc_info = None
+        if job_status == "failed":
+            # RQ 1.12+ keeps failures in the job's result stream, not the job hash
+            result = latest[0][1] if latest else {}
+            if int(result.get(b"type", 0)) == Result.Type.FAILED.value:
+                exc_info = zlib.decompress(b64decode(result[b"exc_string"])).decode()
+            elif raw_exc_info:
+                exc_info = decode_exc_info(raw_exc_info)
+        statuses[job_id] = (job_status, exc_info)
+        if job_status in TERMINAL_STATUSES:
+            status_cache.put(job_id, statuses[job_id])
+
+    missing = [job_id for job_id in uncached if statuses[job_id] == (None, None)]
+    if missing:
+        statuses.update(await fetch_scenario_statuses(missing, redis_conn))
+    return statuses
+
+
+async def fetch_scenario_statuses(scenario_ids, redis_conn):
+    """Read the status of batch scenarios from the meta of their batch job.
+
+    Returns:
+        dict: Maps every scenario id found to its `(status, None)`.
+    """
+    batch_ids = await redis_conn.mget([scenario_key(id) for id in scenario_ids])
+    statuses = {}
+    metas = {}
+    for scenario_id, batch_id in zip(scenario_ids, batch_ids):
+        if batch_id is None:
+            continue
+        batch_id = batch_id.decode()
+        if batch_id not in metas:
+            metas[batch_id] = await fetch_job_meta_async(batch_id, redis_conn)
+        scenario = metas[batch_id].get("scenarios", {}).get(scenario_id)
+        if scenario is not None:
+            statuses[scenario_id] = (scenario["status"], None)
+    return statuses
+
+
+async def fetch_job_meta_async(job_id, redis_conn):
+    meta = await redis_conn.hget(Job.key_for(job_id), "meta")
+    return resolve_serializer().loads(meta) if meta else {}
 
 
 def kill_job(job_id, redis_conn):
@@ -102,10 +316,15 @@ def kill_job(job_id, redis_conn):
             content=f"Simulation job with id = {job_id} not found",
         )
     else:
-        job.cancel()
+        # Jobs waiting to reuse this job's results compute them themselves
+        job.cancel(enqueue_dependents=True)
         send_stop_job_command(redis_conn, job_id)
+        untrack_active_job(redis_conn, job.meta.get("user_id"), str(job_id))
+        if "memo_digest" in job.meta:
+            memo.release(redis_conn, job.meta["memo_digest"], str(job_id))
 
         cancel_tds_job(str(job_id))
+        publish_status(redis_conn, str(job_id), job.meta.get("user_id"), "cancelled")
 
         result = job.get_status()
         return result
@@ -0,0 +1,134 @@
+"""
+Route jobs to the high, default and low priority queues
+"""
+from __future__ import annotations
+
+import logging
+import math
+
+import numpy as np
+
+from settings import settings
+
+QUEUES = ["high", "default", "low"]
+
+# Waits of the most recent jobs of every queue, for the queue metrics
+WAIT_SAMPLES = 1000
+# Don't let jobs lost to crashed workers count against a user forever
+ACTIVE_JOBS_TTL = 24 * 60 * 60
+
+
+def active_jobs_key(user_id):
+    return f"pyciemss:active:{user_id}"
+
+
+def queue_wait_key(queue_name):
+    return f"pyciemss:queue-wait:{queue_name}"
+
+
+def queue_for_cost(cost):
+    if cost <= settings.QUEUE_HIGH_MAX_COST:
+        return "high"
+    if cost <= settings.QUEUE_DEFAULT_MAX_COST:
+        return "default"
+    return "low"
+
+
+def fair_share_queue(redis_conn, user_id, queue_name):
+    """
+    Demote the job by one class while the user already has USER_FAIR_SHARE
+    jobs queued or running, so one user can't monopolize the faster queues.
+    """
+    if user_id == "not_provided" or queue_name == "low":
+        return queue_name
+    active = redis_conn.scard(active_jobs_key(user_id))
+    if active >= settings.USER_FAIR_SHARE:
+        demoted = QUEUES[QUEUES.index(queue_name) + 1]
+        logging.info(
+            "User %s has %s active jobs, demoting from %s to %s",
+            user_id,
+            active,
+            queue_name,
+            demoted,
+        )
+        return demoted
+    return queue_name
+
+
+def route(redis_conn, request_payload, sim_type, job_estimate=None):
+    """
+    Pick the queue and timeout of a job.
+
+    With an estimate, the queue is picked by the job's work, which also counts
+    the variables of its models. The thresholds are in cost units of a model
+    with DEFAULT_MODEL_VARIABLES variables, so a large model with few samples
+    still goes to a slower queue. The timeout is the operation's timeout per run, or a multiple of the
+    estimated runtime for longer jobs. That multiple stops at MAX_JOB_RUNTIME
+    unless the job was downgraded for running over it.
+    """
+    cost = request_payload.estimated_cost()
+    if job_estimate is not None:
+        cost = job_estimate["work"] / settings.DEFAULT_MODEL_VARIABLES
+    downgraded = job_estimate is not None and job_estimate["downgraded"]
+    if downgraded:
+        queue_name = "low"
+    else:
+        queue_name = fair_share_queue(
+            redis_conn, request_payload.user_id, queue_for_cost(cost)
+        )
+    timeout = settings.JOB_TIMEOUTS.get(sim_type, settings.DEFAULT_JOB_TIMEOUT)
+    timeout *= request_payload.num_runs()
+    if job_estimate is not None:
+        expected = settings.TIMEOUT_ESTIMATE_FACTOR * job_estimate["runtime_seconds"]
+        if not downgraded:
+            expected = min(expected, settings.MAX_JOB_RUNTIME)
+        timeout = max(timeout, math.ceil(expected))
+    logging.info(
+        "Routing %s with estimated cost %.3g to queue %s (timeout %ss)",
+        sim_type,
+        cost,
+        queue_name,
+        timeout,
+    )
+    return queue_name, timeout
+
+
+def track_active_job(redis_conn, user_id, job_id):
+    if user_id == "not_provided":
+        return
+    key = active_jobs_key(user_id)
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.sadd(key, job_id)
+    pipe.expire(key, ACTIVE_JOBS_TTL)
+    pipe.execute()
+
+
+def untrack_active_job(redis_conn, user_id, job_id):
+    if user_id and user_id != "not_provided":
+        redis_conn.srem(active_jobs_key(user_id), job_id)
+
+
+def record_queue_wait(job):
+    if job.enqueued_at is None or job.started_at is None:
+        return
+    wait = (job.started_at - job.enqueued_at).total_seconds()
+    key = queue_wait_key(job.origin)
+    pipe = job.connection.pipeline(transaction=False)
+    pipe.lpush(key, wait)
+    pipe.ltrim(key, 0, WAIT_SAMPLES - 1)
+    pipe.execute()
+    logging.info("%s waited %.1fs in queue %s", job.id, wait, job.origin)
+
+
+def summarize_waits(waits):
+    if not waits:
+        return {"count": 0}
+    waits = np.array([float(wait) for wait in waits])
+    p50, p95 = np.percentile(waits, [50, 95])
+    return {
+        "count": len(waits),
+        "mean": waits.mean(),
+        "p50": p50,
+        "p95": p95,
+        "max": waits.max(),
+    }
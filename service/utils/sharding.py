@@ -0,0 +1,90 @@
+"""
+Draw the samples of a job in a pool of local processes
+
+Every shard gets its own seed, derived from the request seed or the job id, so
+a sharded run is reproducible and its shards draw independent samples. Shards
+split the cores of the worker between them through torch's intra-op threads.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import dill
+
+from settings import settings
+
+
+def shard_seed(job_id, index, seed=None):
+    """Seed of the `index`th shard or chunk of a job."""
+    base = job_id if seed is None else seed
+    digest = hashlib.sha256(f"{base}:{index}".encode()).digest()
+    return int.from_bytes(digest[:4], "little")
+
+
+def shard_threads(processes):
+    """Torch threads per process, so the processes don't oversubscribe cores."""
+    if settings.SAMPLE_SHARD_THREADS > 0:
+        return settings.SAMPLE_SHARD_THREADS
+    return max((os.cpu_count() or 1) // processes, 1)
+
+
+def shard_context():
+    return multiprocessing.get_context(settings.SAMPLE_SHARD_START_METHOD)
+
+
+def process_pool(processes):
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=shard_context(),
+        initializer=init_shard,
+        initargs=(shard_threads(processes),),
+    )
+
+
+def init_shard(num_threads):
+    import torch
+
+    torch.set_num_threads(num_threads)
+
+
+def sample_shard(operation_name, kwargs_blob, seed, num_samples):
+    import pyro
+    from pyciemss import interfaces
+
+    kwargs = dill.loads(kwargs_blob)
+    pyro.set_rng_seed(seed)
+    output = getattr(interfaces, operation_name)(**kwargs, num_samples=num_samples)
+    return output["data"]
+
+
+def sample_in_processes(operation_name, kwargs, chunk_sizes, seeds):
+    """
+    Yield the result table of every chunk, in order, drawing up to
+    SAMPLE_SHARD_PROCESSES of them at once.
+    """
+    # Interventions and inferred parameters hold tensors and closures
+    kwargs_blob = dill.dumps({k: v for k, v in kwargs.items() if k != "num_samples"})
+    processes = min(settings.SAMPLE_SHARD_PROCESSES, len(chunk_sizes))
+    logging.info(
+        "Drawing %s chunks in %s processes with %s threads each",
+        len(chunk_sizes),
+        processes,
+        shard_threads(processes),
+    )
+    with process_pool(processes) as executor:
+        pending = deque()
+        for num_samples, seed in zip(chunk_sizes, seeds):
+            if len(pending) == processes:
+                yield pending.popleft().result()
+            pending.append(
+                executor.submit(
+                    sample_shard, operation_name, kwargs_blob, seed, num_samples
+                )
+            )
+        while pending:
+            yield pending.popleft().result()
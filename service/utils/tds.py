@@ -5,19 +5,30 @@ from __future__ import annotations
 
 import logging
 
+import hashlib
+import io
 import os
 import shutil
 import json
+import threading
+import warnings
 import requests
 import dill
 import numbers
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 from typing import Optional
 import pandas as pd
 
 from fastapi import HTTPException
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from settings import settings
+from utils.cache import DiskCache, LRUCache, content_digest
+from utils.parameters import dump_guide, load_guide
 
 TDS_URL = settings.TDS_URL
 TDS_USER = settings.TDS_USER
@@ -26,29 +37,123 @@ TDS_SIMULATIONS = "/simulations"
 TDS_DATASETS = "/datasets"
 TDS_CONFIGURATIONS = "/model-configurations"
 TDS_INTERVENTIONS = "/interventions"
+TERMINAL_STATUSES = {"complete", "error", "failed", "cancelled"}
+# PUTs of a simulation record that lost the race against another writer are
+# retried on a fresh copy
+SIMULATION_WRITE_ATTEMPTS = 3
+
+# Normalized AMRs keyed by content digest, plus the last validator (ETag or
+# Last-Modified) and digest seen for every model configuration
+model_cache = DiskCache(
+    os.path.join(settings.CACHE_DIR, "models"), settings.MODEL_CACHE_MAX_BYTES
+)
+
+# Inferred parameters of calibrations, which don't change once uploaded, by
+# calibration id. Parsed in memory for hot ids and as files on disk for the rest
+PARAMETERS_FILES = ["parameters.safetensors", "parameters.dill"]
+inferred_parameters = LRUCache(settings.PARAMETERS_MEMORY_CACHE_SIZE)
+parameters_cache = DiskCache(
+    os.path.join(settings.CACHE_DIR, "parameters"), settings.PARAMETERS_CACHE_MAX_BYTES
+)
+
+# Last known simulation record and ETag of every running job, by job id
+simulation_records = LRUCache(settings.SIMULATION_RECORD_CACHE_SIZE)
+
+# Parquet copies of datasets keyed by dataset id and filename, plus the last
+# validator and digest seen for the file they were parsed from
+dataset_cache = DiskCache(
+    os.path.join(settings.CACHE_DIR, "datasets"), settings.DATASET_CACHE_MAX_BYTES
+)
 
 
 #
 # FIXME: remove when pyciemss resolve https://github.com/ciemss/pyciemss/issues/567
 #
-# Recursively force every numeric looking value in a dict to be float to make it more likely to
-# be compatible with tensor datatypes downstream
+# Force every numeric value in a dict to be float to make it more likely to be
+# compatible with tensor datatypes downstream. Booleans are left alone.
 def shim_float(obj):
-    if type(obj) == dict:
-        for k, v in obj.items():
-            obj[k] = shim_float(v)
-    elif type(obj) == list:
-        for idx, v in enumerate(obj):
-            obj[idx] = shim_float(v)
-
-    if isinstance(obj, numbers.Number):
-        return float(obj)
-    else:
-        return obj
+    if type(obj) not in (dict, list):
+        return float(obj) if _is_number(obj) else obj
+    # Walked with an explicit stack, deep models exceed the recursion limit
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        items = node.items() if type(node) == dict else enumerate(node)
+        for key, value in items:
+            kind = type(value)
+            if kind is dict or kind is list:
+                stack.append(value)
+            elif kind is int or (kind not in _NOT_SHIMMED and _is_number(value)):
+                node[key] = float(value)
+    return obj
+
+
+# Decoded JSON values that shim_float leaves as they are
+_NOT_SHIMMED = (float, str, bool, type(None))
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def loads_float(content):
+    """
+    Decode JSON with every number as a float, which is what `shim_float` makes
+    of a decoded document, without walking it again.
+    """
+    return json.loads(content, parse_int=float)
+
+
+class PooledSession(requests.Session):
+    """
+    Session with a bounded keep-alive connection pool, retries on transient
+    gateway errors and a default timeout on every call
+    """
+
+    def __init__(self):
+        super().__init__()
+        retries = Retry(
+            total=settings.TDS_RETRIES,
+            backoff_factor=settings.TDS_BACKOFF_FACTOR,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=settings.TDS_POOL_SIZE,
+            pool_maxsize=settings.TDS_POOL_SIZE,
+            max_retries=retries,
+        )
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault(
+            "timeout", (settings.TDS_CONNECT_TIMEOUT, settings.TDS_READ_TIMEOUT)
+        )
+        return super().request(method, url, **kwargs)
 
 
-def tds_session():
-    session = requests.Session()
+_sessions = {}
+_sessions_pid = None
+_sessions_lock = threading.Lock()
+
+
+def _shared_session(name, build):
+    # Sessions are kept per process. RQ forks a work horse for every job and
+    # pooled sockets inherited from the parent must not be reused by the child.
+    global _sessions_pid
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        if name not in _sessions:
+            _sessions[name] = build()
+        return _sessions[name]
+
+
+def _build_tds_session():
+    session = PooledSession()
     session.auth = (TDS_USER, TDS_PASSWORD)
     session.headers.update(
         {"Content-Type": "application/json", "X-Enable-Snake-Case": ""}
@@ -56,6 +161,45 @@ def tds_session():
     return session
 
 
+def tds_session():
+    return _shared_session("tds", _build_tds_session)
+
+
+def storage_session():
+    """
+    Session used for presigned file storage URLs. It must not carry the TDS
+    credentials, which would invalidate the URL signature
+    """
+    return _shared_session("storage", PooledSession)
+
+
+def connection_stats():
+    """
+    Count the connections opened and reused by the pooled sessions of this process
+    """
+    stats = {}
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    for name, session in sessions.items():
+        opened = 0
+        requests_sent = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                try:
+                    pool = pools[key]
+                except KeyError:  # Evicted while iterating
+                    continue
+                opened += pool.num_connections
+                requests_sent += pool.num_requests
+        stats[name] = {
+            "requests": requests_sent,
+            "connections_opened": opened,
+            "connections_reused": max(requests_sent - opened, 0),
+        }
+    return stats
+
+
 def create_tds_job(payload):
     post_url = TDS_URL + TDS_SIMULATIONS
     response = tds_session().post(post_url, json=payload)
@@ -69,44 +213,88 @@ def create_tds_job(payload):
     return response.json()
 
 
-def cancel_tds_job(job_id):
+def update_simulation(job_id, change):
+    """
+    Apply `change` to the simulation record of `job_id` and PUT it back.
+
+    When TDS sends an ETag, the last known record of every running job is
+    kept, so an update costs a single PUT conditional on it. If another
+    writer, e.g. a cancellation, updated the record since, it's fetched again
+    and only changed if it isn't in a terminal status yet. Without an ETag
+    the record is fetched before every update instead, and left alone once
+    it has been cancelled.
+
+    Returns:
+        The response of the PUT, or None if the record was left as it is.
+    """
     url = TDS_URL + TDS_SIMULATIONS + "/" + str(job_id)
-    tds_payload = tds_session().get(url).json()
-    tds_payload["status"] = "cancelled"
-    return tds_session().put(url, json=json.loads(json.dumps(tds_payload, default=str)))
+    entry = simulation_records.get(job_id)
+    conflict = False
+    for _ in range(SIMULATION_WRITE_ATTEMPTS):
+        if entry is None:
+            response = tds_session().get(url)
+            entry = (response.json(), response.headers.get("ETag"))
+        record, etag = entry
+        current = record.get("status")
+        if (conflict and current in TERMINAL_STATUSES) or (
+            not etag and current == "cancelled"
+        ):
+            logging.info(
+                "Simulation %s is already %s, not updating it", job_id, record["status"]
+            )
+            simulation_records.pop(job_id)
+            return None
+        record = change(dict(record))
+        headers = {"If-Match": etag} if etag else {}
+        response = tds_session().put(url, json=record, headers=headers)
+        if response.status_code != 412:
+            break
+        entry, conflict = None, True
+
+    etag = response.headers.get("ETag")
+    if (
+        response.status_code >= 300
+        or record.get("status") in TERMINAL_STATUSES
+        or not etag
+    ):
+        simulation_records.pop(job_id)
+    else:
+        simulation_records.put(job_id, (record, etag))
+    return response
+
+
+def cancel_tds_job(job_id):
+    return update_simulation(job_id, lambda record: {**record, "status": "cancelled"})
 
 
 def update_tds_status(job_id, status, result_files=[], start=False, finish=False):
-    url = TDS_URL + TDS_SIMULATIONS + "/" + str(job_id)
     logging.debug(
         "Updating simulation `%s` -- %s start: %s; finish: %s; result_files: %s",
-        url,
+        job_id,
         status,
         start,
         finish,
         result_files,
     )
-    tds_payload = tds_session().get(url)
-    tds_payload = tds_payload.json()
 
-    if start:
-        tds_payload["start_time"] = datetime.now().isoformat()
-    if finish:
-        tds_payload["completed_time"] = datetime.now().isoformat()
+    def change(tds_payload):
+        if start:
+            tds_payload["start_time"] = datetime.now().isoformat()
+        if finish:
+            tds_payload["completed_time"] = datetime.now().isoformat()
 
-    tds_payload["status"] = status
-    if result_files:
-        tds_payload["result_files"] = result_files
+        tds_payload["status"] = status
+        if result_files:
+            tds_payload["result_files"] = result_files
+        return tds_payload
 
-    update_response = tds_session().put(
-        url, json=json.loads(json.dumps(tds_payload, default=str))
-    )
-    if update_response.status_code >= 300:
-        logging.debug("error", update_response.reason)
+    update_response = update_simulation(job_id, change)
+    if update_response is not None and update_response.status_code >= 300:
+        logging.debug("error: %s", update_response.reason)
         raise Exception(
             (
                 "Failed to update simulation on TDS "
-                f"(status: {update_response.status_code}): {json.dumps(tds_payload, default=str)}"
+                f"(status: {update_response.status_code}): {job_id} => {status}"
             )
         )
 
@@ -124,40 +312,165 @@ def cleanup_job_dir(job_id):
     shutil.rmtree(path)
 
 
-def fetch_model(model_config_id, job_id):
-    job_dir = get_job_dir(job_id)
-    logging.debug(f"Fetching model {model_config_id}")
+def normalize_model(model_json, shimmed=False):
+    """
+    Args:
+        shimmed: The numbers of `model_json` are already floats, e.g. it was
+            decoded with `loads_float`.
+    """
+    # Ensure we don't have null observables which can be problematic downstream, if so convert
+    # to empty list
+    if "semantics" in model_json and "ode" in model_json["semantics"]:
+        ode = model_json["semantics"]["ode"]
+        if "observables" in ode and ode["observables"] is None:
+            ode["observables"] = []
+
+    return model_json if shimmed else shim_float(model_json)
 
-    model_url = TDS_URL + TDS_CONFIGURATIONS + "/" + model_config_id + "/model"
 
-    model_response = tds_session().get(model_url)
-    if model_response.status_code == 404:
+def check_model_response(response):
+    if response.status_code == 404:
         raise HTTPException(status_code=404, detail="Model not found")
+    if response.status_code >= 300:
+        raise HTTPException(status_code=400, detail="Unable to retrieve model")
 
+
+def cache_model(model_config_id, amr_path=None):
+    """
+    Keep the normalized model of a configuration in the model cache, only
+    downloading it again when it changed, and place a copy at `amr_path`.
+
+    Returns:
+        str: The cache key of the normalized model, which is derived from its
+            content.
+    """
+    model_url = TDS_URL + TDS_CONFIGURATIONS + "/" + model_config_id + "/model"
+
+    def place(key):
+        if amr_path is None:
+            return model_cache.touch(key)
+        return model_cache.link(key, amr_path)
+
+    validator_key = f"validator:{model_config_id}"
+    validator = model_cache.read_json(validator_key) or {}
+    headers = {}
+    if validator.get("etag"):
+        headers["If-None-Match"] = validator["etag"]
+    if validator.get("last_modified"):
+        headers["If-Modified-Since"] = validator["last_modified"]
+
+    model_response = tds_session().get(model_url, headers=headers)
+    if model_response.status_code == 304:
+        key = f"model:{validator['digest']}"
+        if place(key):
+            logging.debug(f"Model {model_config_id} is unchanged, using cached copy")
+            return key
+        # The entry was evicted since it was validated
+        model_response = tds_session().get(model_url)
+    # Error bodies must not end up in the cache
+    check_model_response(model_response)
+
+    # Identical documents only get normalized once, even without a validator
+    digest = content_digest(model_response.content)
+    key = f"model:{digest}"
+    if not place(key):
+        shimmed_model = normalize_model(
+            loads_float(model_response.content), shimmed=True
+        )
+        model_cache.write(key, json.dumps(shimmed_model).encode())
+        place(key)
+
+    model_cache.write_json(
+        validator_key,
+        {
+            "etag": model_response.headers.get("ETag"),
+            "last_modified": model_response.headers.get("Last-Modified"),
+            "digest": digest,
+        },
+    )
+    return key
+
+
+def fetch_model(model_config_id, job_id):
+    job_dir = get_job_dir(job_id)
+    logging.debug(f"Fetching model {model_config_id}")
     amr_path = os.path.join(job_dir, f"./{model_config_id}.json")
-    with open(amr_path, "w") as file:
-        # Ensure we don't have null observables which can be problematic downstream, if so convert
-        # to empty list
-        model_json = model_response.json()
-        if "semantics" in model_json and "ode" in model_json["semantics"]:
-            ode = model_json["semantics"]["ode"]
-            if "observables" in ode and ode["observables"] is None:
-                ode["observables"] = []
-
-        shimmed_model = shim_float(model_json)
-        json.dump(shimmed_model, file)
+    cache_model(model_config_id, amr_path)
     return amr_path
 
 
+def record_version(record):
+    """Identify a TDS record by its id and last update, or its content if undated"""
+    version = record.get("updated_on") or content_digest(
+        json.dumps(record, sort_keys=True).encode()
+    )
+    return record.get("id"), version
+
+
 def fetch_model_config(model_config_id):
     model_url = TDS_URL + TDS_CONFIGURATIONS + "/" + model_config_id
     model_config_response = tds_session().get(model_url)
-    if model_config_response.status_code == 404:
-        raise HTTPException(status_code=404, detail="Model not found")
+    check_model_response(model_config_response)
     return model_config_response.json()
 
 
+def cache_dataset(dataset: dict, url, job_dir):
+    """
+    Place a Parquet copy of the dataset in the job dir. The file is only
+    downloaded again if it changed since it was cached, and only parsed again
+    if its content did.
+    """
+    key = f"dataset:{dataset['id']}:{dataset['filename']}"
+    validator_key = f"validator:{key}"
+    parquet_path = os.path.join(job_dir, "dataset.parquet")
+
+    validator = dataset_cache.read_json(validator_key) or {}
+    headers = {}
+    if validator.get("etag"):
+        headers["If-None-Match"] = validator["etag"]
+    if validator.get("last_modified"):
+        headers["If-Modified-Since"] = validator["last_modified"]
+
+    response = storage_session().get(url, headers=headers, stream=True)
+    if response.status_code == 304:
+        if dataset_cache.link(key, parquet_path):
+            logging.debug(f"Dataset {dataset['id']} is unchanged, using cached copy")
+            return parquet_path
+        # The entry was evicted since it was validated
+        response = storage_session().get(url, stream=True)
+    if response.status_code >= 300:
+        raise HTTPException(status_code=400, detail="Unable to retrieve dataset")
+
+    download_path = os.path.join(job_dir, "dataset.download")
+    digest = hashlib.sha256()
+    with open(download_path, "wb") as file:
+        for block in response.iter_content(chunk_size=1024 * 1024):
+            digest.update(block)
+            file.write(block)
+    digest = digest.hexdigest()
+
+    if digest != validator.get("digest") or not dataset_cache.link(key, parquet_path):
+        # Written next to the job's copy, which may be a hard link into the cache
+        converted_path = download_path + ".parquet"
+        pd.read_csv(download_path).to_parquet(converted_path, index=False)
+        os.replace(converted_path, parquet_path)
+        dataset_cache.write_file(key, parquet_path)
+    os.remove(download_path)
+
+    dataset_cache.write_json(
+        validator_key,
+        {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "digest": digest,
+        },
+    )
+    return parquet_path
+
+
 def fetch_dataset(dataset: dict, job_id):
+    import pyarrow.parquet as pq
+
     job_dir = get_job_dir(job_id)
     logging.debug(f"Fetching dataset {dataset['id']}")
     dataset_url = (
@@ -179,170 +492,470 @@ def fetch_dataset(dataset: dict, job_id):
     if response.status_code >= 300:
         raise HTTPException(status_code=400, detail="Unable to retrieve dataset")
 
-    df = pd.read_csv(response.json()["url"])
-    df = df.rename(columns=dataset["mappings"])
+    parquet_path = cache_dataset(dataset, response.json()["url"], job_dir)
+
+    # Only read the columns that are being mapped
+    mappings = dataset["mappings"]
+    columns = pq.read_schema(parquet_path).names
+    if mappings:
+        columns = [
+            column
+            for column in columns
+            if column in mappings or column in mappings.values()
+        ]
+    df = pd.read_parquet(parquet_path, columns=columns)
+    df = df.rename(columns=mappings)
 
     # Shift Timestamp to first position
     col = df.pop("Timestamp")
     df.insert(0, "Timestamp", col)
 
-    # drop columns that aren't being mapped
-    if len(df.columns) > len(dataset["mappings"]) and len(dataset["mappings"]) > 0:
-        extra_columns = set(df.columns) - set(dataset["mappings"].values())
-        df.drop(columns=list(extra_columns), inplace=True)
-
-    dataset_path = os.path.join(job_dir, "./temp.json")
-    with open(dataset_path, "w") as file:
-        df.to_csv(file, index=False)
+    # pyciemss only loads datasets from CSV files
+    dataset_path = os.path.join(job_dir, "dataset.csv")
+    df.to_csv(dataset_path, index=False)
     return dataset_path
 
 
+def download_parameters(parameters_id, handle):
+    download_url = (
+        f"{TDS_URL}{TDS_SIMULATIONS}/{parameters_id}/download-url?filename={handle}"
+    )
+    download_response = tds_session().get(download_url)
+    if download_response.status_code >= 300:
+        return download_response
+    return storage_session().get(download_response.json()["url"])
+
+
+def fetch_parameters_file(parameters_id, job_dir):
+    """
+    Place the inferred parameters of a calibration in the job dir, from the
+    disk cache if they were downloaded before.
+
+    Returns:
+        str: The path of the tensor bundle or, for calibrations from before
+            tensor bundles or with guides that can't be stored as one, the
+            pickle.
+    """
+    for handle in PARAMETERS_FILES:
+        parameters_path = os.path.join(job_dir, handle)
+        if parameters_cache.link(f"{parameters_id}:{handle}", parameters_path):
+            logging.debug(f"Using cached {handle} of {parameters_id}")
+            return parameters_path
+
+    for handle in PARAMETERS_FILES:
+        response = download_parameters(parameters_id, handle)
+        if response.status_code < 300:
+            parameters_path = os.path.join(job_dir, handle)
+            parameters_cache.write(f"{parameters_id}:{handle}", response.content)
+            parameters_cache.link(f"{parameters_id}:{handle}", parameters_path)
+            return parameters_path
+        logging.debug(f"No {handle} for {parameters_id}")
+    raise HTTPException(status_code=400, detail="Unable to retrieve parameters")
+
+
+def load_parameters(parameters_id, job_id):
+    parameters_path = fetch_parameters_file(parameters_id, get_job_dir(job_id))
+    if parameters_path.endswith(".safetensors"):
+        return load_guide(parameters_path)
+    with open(parameters_path, "rb") as file:
+        return dill.load(file)
+
+
 def fetch_inferred_parameters(parameters_id: Optional[str], job_id):
+    """
+    Inferred parameters of a calibration. They are shared by the jobs of a
+    long-lived worker and must not be modified, see `fetch_previous_guide`.
+    """
     if parameters_id is None:
         return
-    job_dir = get_job_dir(job_id)
+    parameters = inferred_parameters.get(parameters_id)
+    if parameters is not None:
+        logging.debug(f"Reusing inferred parameters {parameters_id}")
+        return parameters
     logging.debug(f"Fetching inferred parameters {parameters_id}")
-    download_url = f"{TDS_URL}{TDS_SIMULATIONS}/{parameters_id}/download-url?filename=parameters.dill"
+    parameters = load_parameters(parameters_id, job_id)
+    inferred_parameters.put(parameters_id, parameters)
+    return parameters
 
-    parameters_url = tds_session().get(download_url).json()["url"]
-    # response = tds_session().get(parameters_url)
 
-    response = requests.get(parameters_url)
-    if response.status_code >= 300:
-        raise HTTPException(status_code=400, detail="Unable to retrieve parameters")
-    parameters_path = os.path.join(job_dir, "parameters.dill")
-    with open(parameters_path, "wb") as file:
-        file.write(response.content)
-    return dill.loads(response.content)
+def fetch_previous_guide(parameters_id: Optional[str], job_id):
+    """Own copy of the inferred parameters of a calibration, to train further"""
+    if parameters_id is None:
+        return
+    logging.debug(f"Fetching guide of {parameters_id}")
+    return load_parameters(parameters_id, job_id)
+
+
+SUMMARY_GROUP_COLUMNS = ["timepoint_id", "timepoint_unknown"]
+SUMMARY_STATISTICS = ["min", "max", "mean", "median", "std"]
 
 
-def get_result_summary(data_result):
+def quantile_column(column, quantile):
+    return f"{column}_q{quantile:g}"
+
+
+def _grouped_result_summary(data_result, quantiles=()):
     try:
-        df2 = data_result.groupby(
-            ["timepoint_id", "timepoint_unknown"], as_index=False
-        ).agg(["min", "max", "mean", "median", "std"])
+        df2 = data_result.groupby(SUMMARY_GROUP_COLUMNS, as_index=False).agg(
+            SUMMARY_STATISTICS
+        )
         df2 = df2.drop(columns=["sample_id"])
         df2.columns = ["_".join(i) for i in df2.columns]
         df2 = df2.rename(columns={"timepoint_id_": "timepoint_id"})
         df2 = df2.rename(columns={"timepoint_unknown_": "timepoint_unknown"})
+        if quantiles:
+            grouped = data_result.drop(columns=["sample_id"]).groupby(
+                SUMMARY_GROUP_COLUMNS
+            )
+            extra = {}
+            for quantile in quantiles:
+                quantile_df = grouped.quantile(quantile).reset_index(drop=True)
+                for column in quantile_df.columns:
+                    extra[quantile_column(column, quantile)] = quantile_df[column]
+            columns = list(SUMMARY_GROUP_COLUMNS)
+            for column in quantile_df.columns:
+                columns += [f"{column}_{statistic}" for statistic in SUMMARY_STATISTICS]
+                columns += [quantile_column(column, q) for q in quantiles]
+            df2 = pd.concat([df2, pd.DataFrame(extra)], axis=1)[columns]
         return df2
     # If the format of the data_result does not match expected column names ect just throw error
     except:
         raise
 
 
-def attach_files(output: dict, job_id, status="complete"):
+def dense_samples(data_result):
+    """
+    Reshape a result table into a dense (timepoint x column x sample) array.
+
+    Returns:
+        tuple: The timepoint ids, the `timepoint_unknown` of every timepoint,
+            the array and its value columns, or None if the result is ragged
+            or not numeric.
+    """
+    value_columns = [
+        column
+        for column in data_result.columns
+        if column not in SUMMARY_GROUP_COLUMNS and column != "sample_id"
+    ]
+    codes, timepoints = pd.factorize(data_result["timepoint_id"], sort=True)
+    counts = np.bincount(codes, minlength=len(timepoints))
+    if len(timepoints) == 0 or (counts != counts[0]).any():
+        return None
+    shape = (len(timepoints), counts[0])
+
+    # Rows usually arrive grouped by timepoint already
+    order = None if (np.diff(codes) >= 0).all() else np.argsort(codes, kind="stable")
+    unknowns = data_result["timepoint_unknown"].to_numpy()
+    unknowns = (unknowns if order is None else unknowns[order]).reshape(shape)
+    if not (unknowns == unknowns[:, :1]).all():
+        return None
+    try:
+        values = data_result[value_columns].to_numpy(dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    if order is not None:
+        values = values[order]
+    values = values.reshape(*shape, len(value_columns)).transpose(0, 2, 1)
+    return (
+        timepoints.to_numpy(),
+        unknowns[:, 0],
+        np.ascontiguousarray(values),
+        value_columns,
+    )
+
+
+def summary_frame(timepoints, unknowns, value_columns, dtypes, stats, quantiles):
+    """Lay out per timepoint statistics like the pandas groupby summary."""
+    summary = {"timepoint_id": timepoints, "timepoint_unknown": unknowns}
+    for idx, column in enumerate(value_columns):
+        is_integer = pd.api.types.is_integer_dtype(dtypes[column])
+        for statistic in SUMMARY_STATISTICS:
+            column_stat = stats[statistic][:, idx]
+            if is_integer and statistic in ("min", "max"):
+                column_stat = column_stat.astype(dtypes[column])
+            summary[f"{column}_{statistic}"] = column_stat
+        for quantile, column_quantile in zip(quantiles, stats["quantiles"]):
+            summary[quantile_column(column, quantile)] = column_quantile[:, idx]
+    return pd.DataFrame(summary)
+
+
+def get_result_summary(data_result, quantiles=()):
+    """
+    Summarize every output column per timepoint.
+
+    Samples are reshaped into a dense (timepoint x column x sample) array
+    that is sorted once in place along the sample axis. Min, max, median and
+    the requested quantiles are read off the sorted array and mean/std come
+    from the same array. Ragged or non-numeric results fall back to a pandas
+    groupby.
+    """
+    dense = dense_samples(data_result)
+    if dense is None:
+        return _grouped_result_summary(data_result, quantiles)
+    timepoints, unknowns, values, value_columns = dense
+    num_samples = values.shape[-1]
+
+    probabilities = [0.5, *quantiles]
+    with np.errstate(all="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        if np.isnan(values).any():
+            stats = {
+                "min": np.nanmin(values, axis=-1),
+                "max": np.nanmax(values, axis=-1),
+                "mean": np.nanmean(values, axis=-1),
+                "std": np.nanstd(values, axis=-1, ddof=1),
+            }
+            quantile_values = np.nanquantile(values, probabilities, axis=-1)
+        else:
+            values.sort(axis=-1)
+            positions = np.asarray(probabilities) * (num_samples - 1)
+            lower = np.floor(positions).astype(int)
+            upper = np.ceil(positions).astype(int)
+            weights = positions - lower
+            below = np.moveaxis(values[..., lower], -1, 0)
+            above = np.moveaxis(values[..., upper], -1, 0)
+            mean = values.mean(axis=-1)
+            deviations = values - mean[..., None]
+            stats = {
+                "min": values[..., 0],
+                "max": values[..., -1],
+                "mean": mean,
+                "std": np.sqrt(
+                    np.einsum("ijk,ijk->ij", deviations, deviations) / (num_samples - 1)
+                ),
+            }
+            quantile_values = below + weights[:, None, None] * (above - below)
+    stats["median"] = quantile_values[0]
+    stats["quantiles"] = quantile_values[1:]
+    return summary_frame(
+        timepoints, unknowns, value_columns, data_result.dtypes, stats, quantiles
+    )
+
+
+def serialize_table(df, name, output_format="csv", index=False):
+    """
+    Serialize a result table in the requested format and return its filename
+    and content. Parquet and Arrow IPC tables are zstd compressed and keep
+    column types.
+    """
+    buffer = io.BytesIO()
+    if output_format == "parquet":
+        handle = f"{name}.parquet"
+        df.to_parquet(buffer, index=index, compression="zstd")
+    elif output_format == "arrow":
+        handle = f"{name}.arrow"
+        if index:
+            df = df.reset_index()
+        df.to_feather(buffer, compression="zstd")
+    else:
+        handle = f"{name}.csv"
+        df.to_csv(buffer, index=index)
+    return handle, buffer.getvalue()
+
+
+def serialize_json(obj, **kwargs):
+    return json.dumps(obj, **kwargs).encode("utf-8")
+
+
+def upload_file(job_id, handle, content):
     sim_results_url = TDS_URL + TDS_SIMULATIONS + "/" + str(job_id)
-    job_dir = get_job_dir(job_id)
-    files = {}
+    upload_url = f"{sim_results_url}/upload-url?filename={handle}"
+    upload_response = tds_session().get(upload_url)
+    presigned_upload_url = upload_response.json()["url"]
+
+    # Results streamed to the job dir are uploaded from disk
+    body = open(content, "rb") if isinstance(content, Path) else io.BytesIO(content)
+    with body:
+        upload_response = storage_session().put(presigned_upload_url, body)
+    if upload_response.status_code >= 300:
+        raise Exception(
+            (
+                "Failed to upload file to TDS "
+                f"(status: {upload_response.status_code}): {handle}"
+            )
+        )
+
 
-    output_filename = os.path.join(job_dir, "./result.csv")
+def download_file(job_id, handle):
+    sim_results_url = TDS_URL + TDS_SIMULATIONS + "/" + str(job_id)
+    download_url = f"{sim_results_url}/download-url?filename={handle}"
+    presigned_download_url = tds_session().get(download_url).json()["url"]
+
+    download_response = storage_session().get(presigned_download_url)
+    if download_response.status_code >= 300:
+        raise Exception(
+            (
+                "Failed to download file from TDS "
+                f"(status: {download_response.status_code}): {handle}"
+            )
+        )
+    return download_response.content
+
+
+def copy_files(source_id, job_id, handles):
+    """Copy the result artifacts of one simulation to another."""
+    with ThreadPoolExecutor(max_workers=settings.UPLOAD_CONCURRENCY) as executor:
+        files = dict(
+            zip(
+                handles,
+                executor.map(lambda handle: download_file(source_id, handle), handles),
+            )
+        )
+    upload_files(job_id, files)
+
+
+def upload_files(job_id, files):
+    """
+    Upload artifacts concurrently. Presigned URLs are requested by the upload
+    threads so they overlap with the transfers of other files.
+    """
+    with ThreadPoolExecutor(max_workers=settings.UPLOAD_CONCURRENCY) as executor:
+        uploads = [
+            executor.submit(upload_file, job_id, handle, content)
+            for handle, content in files.items()
+        ]
+        for upload in uploads:
+            upload.result()
+
+
+def serialize_files(output: dict, job_id, output_format="csv", summary_quantiles=()):
+    """
+    Serialize the result artifacts of an output one at a time, in memory.
+
+    Yields:
+        tuple: The handle and content of each artifact. Nothing here keeps a
+            reference to an artifact once it is yielded, so it is released as
+            soon as the consumer drops it.
+    """
     data_result = output.get("data", None)
     if data_result is not None:
-        data_result.to_csv(output_filename, index=False)
-        files[output_filename] = "result.csv"
+        yield serialize_table(data_result, "result", output_format)
         # Add a result summary file for the HMI to digest.
         try:
-            result_summary_filename = os.path.join(job_dir, "./result_summary.csv")
-            summary_data = get_result_summary(data_result)
+            summary_data = get_result_summary(data_result, summary_quantiles)
             summary_df = pd.DataFrame.from_records(summary_data)
-            summary_df.to_csv(result_summary_filename)
-            files[result_summary_filename] = "result_summary.csv"
+            yield serialize_table(
+                summary_df, "result_summary", output_format, index=True
+            )
         except (
             Exception
         ) as error:  # If the result file is a new format do not fail entire simulation run
             logging.error(f"{job_id} get_result_summary ran into error")
             logging.error(error)
 
+    chunked_result = output.get("chunked_result", None)
+    if chunked_result is not None:
+        yield chunked_result.handle, Path(chunked_result.path)
+        if chunked_result.summary is not None:
+            yield serialize_table(
+                chunked_result.summary, "result_summary", output_format, index=True
+            )
+
     risk_result = output.get("risk", None)
     if risk_result is not None:
         # Update qoi (tensor) to a list before serializing with json.dumps
         for k, v in risk_result.items():
             risk_result[k]["qoi"] = v["qoi"].tolist()
-        risk_json_obj = json.dumps(risk_result, default=str)
-        json_obj = json.loads(risk_json_obj)
-        json_filename = os.path.join(job_dir, "./risk.json")
-        with open(json_filename, "w") as f:
-            json.dump(json_obj, f, ensure_ascii=False, indent=4)
-        files[json_filename] = "risk.json"
-
-    eval_output_filename = os.path.join(job_dir, "./eval.csv")
+        yield "risk.json", serialize_json(
+            risk_result, default=str, ensure_ascii=False, indent=4
+        )
+
     eval_result = output.get("quantiles", None)
     if eval_result is not None:
-        eval_result.to_csv(eval_output_filename, index=False)
-        files[eval_output_filename] = "eval.csv"
+        yield "eval.csv", serialize_table(eval_result, "eval")[1]
+
+    calibration_result = output.get("calibration", None)
+    if calibration_result is not None:
+        yield "calibration.json", serialize_json(calibration_result, indent=2)
 
-    params_filename = os.path.join(job_dir, "./parameters.dill")
     params_result = output.get("inferred_parameters", None)
     if params_result is not None:
-        with open(params_filename, "wb") as file:
-            dill.dump(params_result, file)
-        files[params_filename] = "parameters.dill"
+        parameters = dump_guide(params_result)
+        stored = parameters is not None
+        if stored:
+            yield "parameters.safetensors", parameters
+            del parameters
+        if not stored or settings.LEGACY_PARAMETERS_DILL:
+            yield "parameters.dill", dill.dumps(params_result)
 
-    policy_filename = os.path.join(job_dir, "./policy.json")
     policy = output.get("policy", None)
     if policy is not None:
-        with open(policy_filename, "w") as file:
-            json.dump(policy.tolist(), file)
-        files[policy_filename] = "policy.json"
+        yield "policy.json", serialize_json(policy.tolist())
 
-    results_filename = os.path.join(job_dir, "./optimize_results.dill")
     results = output.get("OptResults", None)
     if results is not None:
-        json_obj = json.loads(json.dumps(results, default=str))
-        json_filename = os.path.join(job_dir, "./optimize_result.json")
-        with open(json_filename, "w") as f:
-            json.dump(json_obj, f, ensure_ascii=False, indent=4)
-        files[json_filename] = "optimize_results.json"
-
-        with open(results_filename, "wb") as file:
-            dill.dump(results, file)
-        files[results_filename] = "optimize_results.dill"
+        yield "optimize_results.json", serialize_json(
+            results, default=str, ensure_ascii=False, indent=4
+        )
+        yield "optimize_results.dill", dill.dumps(results)
 
-    visualization_filename = os.path.join(job_dir, "./visualization.json")
     viz_result = output.get("visual", None)
     if viz_result is not None:
-        with open(visualization_filename, "w") as f:
-            json.dump(viz_result, f, indent=2)
-        files[visualization_filename] = "visualization.json"
-
+        yield "visualization.json", serialize_json(viz_result, indent=2)
+
+
+def upload_artifacts(job_ids, files):
+    """
+    Upload artifacts as they are serialized, each one to every job of
+    `job_ids`. An artifact is uploaded before the next one is serialized, so
+    only one is held in memory at a time; its uploads to several jobs run
+    concurrently from that one buffer.
+
+    Returns:
+        list: The handles of the uploaded artifacts.
+    """
+    handles = []
+    with ThreadPoolExecutor(max_workers=settings.UPLOAD_CONCURRENCY) as executor:
+        for handle, content in files:
+            uploads = [
+                executor.submit(upload_file, job_id, handle, content)
+                for job_id in job_ids
+            ]
+            del content
+            for upload in uploads:
+                upload.result()
+            handles.append(handle)
+    return handles
+
+
+def upload_results(job_id, files, status="complete"):
     if status != "error":
-        for location, handle in files.items():
-            upload_url = f"{sim_results_url}/upload-url?filename={handle}"
-            upload_response = tds_session().get(upload_url)
-            presigned_upload_url = upload_response.json()["url"]
-
-            with open(location, "rb") as f:
-                upload_response = requests.put(presigned_upload_url, f)
-                if upload_response.status_code >= 300:
-                    raise Exception(
-                        (
-                            "Failed to upload file to TDS "
-                            f"(status: {upload_response.status_code}): {handle}"
-                        )
-                    )
+        handles = upload_artifacts([job_id], files)
     else:
         logging.error(f"{job_id} ran into error")
+        handles = [handle for handle, _ in files]
 
     # Update simulation object with status and filepaths.
-    update_tds_status(
-        job_id, status=status, result_files=list(files.values()), finish=True
-    )
+    update_tds_status(job_id, status=status, result_files=handles, finish=True)
     logging.info("uploaded files to %s", job_id)
+    return handles
 
 
-def fetch_interventions(policy_intervention_id: str, job_id):
-    job_dir = get_job_dir(job_id)
-    logging.debug(f"Fetching interventions {policy_intervention_id}")
+def attach_files(
+    output: dict, job_id, status="complete", output_format="csv", summary_quantiles=()
+):
+    files = serialize_files(output, job_id, output_format, summary_quantiles)
+    return upload_results(job_id, files, status)
+
 
+def fetch_intervention_policy(policy_intervention_id):
     intervention_url = TDS_URL + TDS_INTERVENTIONS + "/" + policy_intervention_id
     intervention_response = tds_session().get(intervention_url)
     if intervention_response.status_code == 404:
         raise HTTPException(status_code=404, detail="Intervention not found")
+    return intervention_response.json()
+
+
+def fetch_interventions(policy_intervention_id: Optional[str], job_id):
+    if not policy_intervention_id:
+        return
+    job_dir = get_job_dir(job_id)
+    logging.debug(f"Fetching interventions {policy_intervention_id}")
+
+    intervention_json = fetch_intervention_policy(policy_intervention_id)
 
     intervention_path = os.path.join(job_dir, f"./{policy_intervention_id}.json")
     with open(intervention_path, "w") as file:
-        intervention_json = intervention_response.json()
         json.dump(intervention_json, file)
 
-    return intervention_response.json()
+    return intervention_json
@@ -0,0 +1,51 @@
+"""
+Entrypoint for the RQ worker
+"""
+from __future__ import annotations
+
+import logging
+
+from redis import Redis
+from rq import Queue, SimpleWorker, Worker
+
+from settings import settings
+from utils.cancellation import request_cancel
+
+logging.basicConfig()
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class WarmWorker(SimpleWorker):
+    """
+    Runs jobs in the worker process, so parsed models stay cached between
+    them. Stopping a job cancels it cooperatively instead of killing the
+    "work horse", which is this process.
+    """
+
+    def kill_horse(self, sig=None):
+        job_id = self.get_current_job_id()
+        if job_id is not None:
+            self.log.info("Cancelling job %s", job_id)
+            request_cancel(job_id)
+
+
+def main():
+    # Importing `execute` loads pyciemss, torch, pyro and chirho. Doing it
+    # before the worker starts means every job, whether it runs in a forked
+    # work horse or in this process, finds them already imported.
+    import execute  # noqa: F401
+
+    redis_conn = Redis(settings.REDIS_HOST, settings.REDIS_PORT)
+    queues = [
+        Queue(name, connection=redis_conn) for name in settings.WORKER_QUEUES.split()
+    ]
+    if settings.WORKER_MODE == "warm":
+        worker_class = WarmWorker
+    else:
+        worker_class = Worker
+    logging.info(f"Starting {worker_class.__name__} on {settings.WORKER_QUEUES}")
+    worker_class(queues, connection=redis_conn).work()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,27 +7,35 @@ import pytest
 
 from rq import SimpleWorker, Queue
 from fastapi.testclient import TestClient
-from fakeredis import FakeStrictRedis
+from fakeredis import FakeServer, FakeStrictRedis
+from fakeredis.aioredis import FakeRedis
 
-from service.api import app, get_redis
+from service.api import app, get_redis, get_async_redis, get_stream_redis
 
 
 @pytest.fixture
-def redis():
-    return FakeStrictRedis()
+def redis_server():
+    return FakeServer()
+
+
+@pytest.fixture
+def redis(redis_server):
+    return FakeStrictRedis(server=redis_server)
 
 
 @pytest.fixture
 def worker(redis):
-    queue = Queue(connection=redis, default_timeout=-1)
-    return SimpleWorker([queue], connection=redis)
+    queues = [Queue(name, connection=redis) for name in ("high", "default", "low")]
+    return SimpleWorker(queues, connection=redis)
 
 
 @pytest.fixture
-def client(redis):
+def client(redis, redis_server):
     app.dependency_overrides[get_redis] = lambda: redis
+    app.dependency_overrides[get_async_redis] = lambda: FakeRedis(server=redis_server)
+    app.dependency_overrides[get_stream_redis] = lambda: FakeRedis(server=redis_server)
     yield TestClient(app)
-    app.dependency_overrides[get_redis] = get_redis
+    app.dependency_overrides.clear()
 
 
 @pytest.fixture
@@ -1,5 +1,7 @@
 import json
 
+import dill
+
 import pytest
 
 from service.settings import settings
@@ -19,13 +21,15 @@ def test_calibrate_example(
 
     dataset_id = example_context["request"]["dataset"]["id"]
     filename = example_context["request"]["dataset"]["filename"]
-    dataset = example_context["fetch"](filename, True)
-    dataset_loc = {"method": "GET", "url": dataset}
+    dataset = example_context["fetch"](filename)
+    dataset_loc = {"method": "GET", "url": "http://dataset"}
     requests_mock.get(
         f"{TDS_URL}/datasets/{dataset_id}/download-url?filename={filename}",
         json=dataset_loc,
     )
+    requests_mock.get("http://dataset", text=dataset)
 
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
     requests_mock.post(f"{TDS_URL}/simulations", json={"id": str(job_id)})
 
     response = client.post(
@@ -47,7 +51,6 @@ def test_calibrate_example(
     requests_mock.put(
         f"{TDS_URL}/simulations/{simulation_id}", json={"status": "success"}
     )
-    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
     model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
     requests_mock.get(
         f"{TDS_URL}/model-configurations/{config_id}",
@@ -71,3 +74,63 @@ def test_calibrate_example(
 
     # assert viz is not None
     # assert file_check("json", viz)
+
+
+@pytest.mark.example_dir("calibrate")
+def test_warm_start_calibrate(
+    example_context, client, worker, file_storage, file_check, requests_mock
+):
+    job_id = "0478a0f7-21b3-4241-afa2-252e1c1992d9"
+    previous_id = "0478a0f7-21b3-4241-afa2-252e1c1992d8"
+
+    request = example_context["request"]
+    request["extra"] = {
+        **request["extra"],
+        "warm_start": previous_id,
+        "early_stopping_patience": 5,
+        "early_stopping_tolerance": 0.5,
+    }
+    config_id = request["model_config_id"]
+    model = json.loads(example_context["fetch"](config_id + ".json"))
+    model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
+
+    dataset_id = request["dataset"]["id"]
+    filename = request["dataset"]["filename"]
+    requests_mock.get(
+        f"{TDS_URL}/datasets/{dataset_id}/download-url?filename={filename}",
+        json={"method": "GET", "url": "http://dataset"},
+    )
+    requests_mock.get("http://dataset", text=example_context["fetch"](filename))
+    # Calibrations from before tensor bundles only have parameters.dill
+    requests_mock.get(
+        f"{TDS_URL}/simulations/{previous_id}/download-url?filename=parameters.safetensors",
+        status_code=404,
+    )
+    requests_mock.get(
+        f"{TDS_URL}/simulations/{previous_id}/download-url?filename=parameters.dill",
+        json={"url": "https://storage/previous/parameters.dill"},
+    )
+    requests_mock.get(
+        "https://storage/previous/parameters.dill", content=dill.dumps({"x": 1})
+    )
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}", json=model_config)
+    requests_mock.post(f"{TDS_URL}/simulations", json={"id": job_id})
+    requests_mock.get(
+        f"{TDS_URL}/simulations/{job_id}",
+        json={**example_context["tds_simulation"], "id": job_id},
+    )
+    requests_mock.put(f"{TDS_URL}/simulations/{job_id}", json={"status": "success"})
+
+    client.post("/calibrate", json=request)
+    worker.work(burst=True)
+
+    assert client.get(f"/status/{job_id}").json()["status"] == "complete"
+    report = json.loads(file_storage("calibration.json"))
+    assert report["warm_start"] == previous_id
+    assert report["stopped_early"]
+    assert report["iterations_run"] < report["iterations_requested"]
+    assert (
+        report["iterations_saved"]
+        == report["iterations_requested"] - report["iterations_run"]
+    )
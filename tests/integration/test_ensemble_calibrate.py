@@ -26,8 +26,8 @@ def test_ensemble_calibrate_example(
 
     dataset_id = example_context["request"]["dataset"]["id"]
     filename = example_context["request"]["dataset"]["filename"]
-    dataset = example_context["fetch"](filename, True)
-    dataset_loc = {"method": "GET", "url": dataset}
+    dataset = example_context["fetch"](filename)
+    dataset_loc = {"method": "GET", "url": "http://dataset"}
     requests_mock.get(
         f"{TDS_URL}/datasets/{dataset_id}/download-url?filename={filename}",
         json=dataset_loc,
@@ -0,0 +1,67 @@
+import json
+import re
+
+import pytest
+
+from service.settings import settings
+
+TDS_URL = settings.TDS_URL
+
+
+@pytest.mark.example_dir("simulate")
+def test_memoized_simulate(
+    example_context, client, worker, file_storage, file_check, requests_mock
+):
+    job_ids = [
+        "5f0c5c36-8c4f-4c53-a4c4-3f1e1d7b9a01",
+        "5f0c5c36-8c4f-4c53-a4c4-3f1e1d7b9a02",
+    ]
+
+    request = {**example_context["request"], "memoize": True, "seed": 0}
+    config_id = request["model_config_id"]
+    model = json.loads(example_context["fetch"](config_id + ".json"))
+    model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
+
+    requests_mock.post(
+        f"{TDS_URL}/simulations", [{"json": {"id": id}} for id in job_ids]
+    )
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}", json=model_config)
+    tds_sim = example_context["tds_simulation"]
+    updates = {}
+    for id in job_ids:
+        requests_mock.get(f"{TDS_URL}/simulations/{id}", json={**tds_sim, "id": id})
+        updates[id] = requests_mock.put(
+            f"{TDS_URL}/simulations/{id}", json={"status": "success"}
+        )
+    downloads = requests_mock.get(
+        re.compile(f"{TDS_URL}/simulations/{job_ids[0]}/download-url"),
+        json=lambda request, _: {
+            "url": f"https://filesave?filename={request.qs['filename'][0]}"
+        },
+    )
+    requests_mock.get(
+        re.compile("filesave"),
+        content=lambda request, _: file_storage(request.qs["filename"][0]).encode(),
+    )
+
+    for _ in job_ids:
+        response = client.post("/simulate", json=request)
+    assert response.json()["simulation_id"] == job_ids[1]
+    # The second job waits on the first one
+    response = client.get(f"/status/{job_ids[1]}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "queued"
+
+    worker.work(burst=True)
+
+    statuses = client.post("/status", json={"simulation_ids": job_ids}).json()
+    assert [status["status"] for status in statuses["statuses"]] == [
+        "complete",
+        "complete",
+    ]
+    original_files = updates[job_ids[0]].last_request.json()["result_files"]
+    copied_files = updates[job_ids[1]].last_request.json()["result_files"]
+    assert copied_files == original_files
+    assert downloads.call_count == len(original_files)
+    assert file_check("csv", file_storage("result.csv"))
@@ -3,6 +3,7 @@ import json
 import pytest
 
 from service.settings import settings
+from service.utils import multistart
 
 TDS_URL = settings.TDS_URL
 
@@ -17,6 +18,7 @@ def test_optimize_example(
     config_id = request["model_config_id"]
     model = json.loads(example_context["fetch"](config_id + ".json"))
 
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
     requests_mock.post(f"{TDS_URL}/simulations", json={"id": str(job_id)})
 
     response = client.post(
@@ -37,7 +39,6 @@ def test_optimize_example(
     requests_mock.put(
         f"{TDS_URL}/simulations/{simulation_id}", json={"status": "success"}
     )
-    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
     model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
     requests_mock.get(
         f"{TDS_URL}/model-configurations/{config_id}",
@@ -57,3 +58,43 @@ def test_optimize_example(
 
     assert policy is not None
     assert file_check("json", policy)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+@pytest.mark.example_dir("optimize")
+def test_optimize_multistart(
+    example_context,
+    client,
+    worker,
+    file_storage,
+    file_check,
+    requests_mock,
+    monkeypatch,
+    processes,
+):
+    job_id = "9ed74639-7778-4bb9-96fd-7509d68cd427"
+    monkeypatch.setattr(multistart.settings, "OPTIMIZE_PROCESSES", processes)
+
+    request = example_context["request"]
+    request["extra"] = {**request["extra"], "num_starts": 3}
+    config_id = request["model_config_id"]
+    model = json.loads(example_context["fetch"](config_id + ".json"))
+    model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
+
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}", json=model_config)
+    requests_mock.post(f"{TDS_URL}/simulations", json={"id": job_id})
+    requests_mock.get(
+        f"{TDS_URL}/simulations/{job_id}",
+        json={**example_context["tds_simulation"], "id": job_id},
+    )
+    requests_mock.put(f"{TDS_URL}/simulations/{job_id}", json={"status": "success"})
+
+    client.post("/optimize", json=request)
+    worker.work(burst=True)
+
+    assert client.get(f"/status/{job_id}").json()["status"] == "complete"
+    assert file_check("json", file_storage("policy.json"))
+
+    events = client.get(f"/stream/{job_id}").text
+    assert "current_results" in events
@@ -1,8 +1,11 @@
+import io
 import json
 
+import pandas as pd
 import pytest
 
 from service.settings import settings
+from service.utils import chunking
 
 TDS_URL = settings.TDS_URL
 
@@ -18,6 +21,7 @@ def test_simulate_example(
     model = json.loads(example_context["fetch"](config_id + ".json"))
     model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
 
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
     requests_mock.post(f"{TDS_URL}/simulations", json={"id": str(job_id)})
 
     response = client.post(
@@ -26,6 +30,7 @@ def test_simulate_example(
         headers={"Content-Type": "application/json"},
     )
     simulation_id = response.json()["simulation_id"]
+    assert response.json()["estimate"]["queue"] == "high"
     response = client.get(
         f"/status/{simulation_id}",
     )
@@ -39,7 +44,6 @@ def test_simulate_example(
     requests_mock.put(
         f"{TDS_URL}/simulations/{simulation_id}", json={"status": "success"}
     )
-    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
     requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}", json=model_config)
 
     worker.work(burst=True)
@@ -60,3 +64,55 @@ def test_simulate_example(
 
     # assert viz is not None
     # assert file_check("json", viz)
+
+    events = client.get(f"/stream/{simulation_id}").text
+    statuses = [
+        json.loads(line[len("data: ") :])["status"]
+        for line in events.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert statuses == ["queued", "running", "complete"]
+
+    metrics = client.get("/metrics/queues").json()
+    assert metrics["high"]["wait"]["count"] == 1
+
+
+@pytest.mark.parametrize("shard_processes", [0, 2])
+@pytest.mark.example_dir("simulate")
+def test_simulate_in_chunks(
+    example_context,
+    client,
+    worker,
+    file_storage,
+    file_check,
+    requests_mock,
+    monkeypatch,
+    shard_processes,
+):
+    job_id = "9ed74639-7778-4bb9-96fd-7509d68cd426"
+    monkeypatch.setattr(chunking.settings, "SAMPLE_CHUNK_SIZE", 30)
+    monkeypatch.setattr(chunking.settings, "SAMPLE_SHARD_PROCESSES", shard_processes)
+    monkeypatch.setattr(chunking.settings, "SAMPLE_SHARD_MIN_SAMPLES", 10)
+
+    request = example_context["request"]
+    config_id = request["model_config_id"]
+    model = json.loads(example_context["fetch"](config_id + ".json"))
+    model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
+
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}", json=model_config)
+    requests_mock.post(f"{TDS_URL}/simulations", json={"id": job_id})
+    requests_mock.get(
+        f"{TDS_URL}/simulations/{job_id}",
+        json={**example_context["tds_simulation"], "id": job_id},
+    )
+    requests_mock.put(f"{TDS_URL}/simulations/{job_id}", json={"status": "success"})
+
+    client.post("/simulate", json=request)
+    worker.work(burst=True)
+
+    assert client.get(f"/status/{job_id}").json()["status"] == "complete"
+    result = pd.read_csv(io.StringIO(file_storage("result.csv")))
+    assert sorted(result["sample_id"].unique()) == list(range(100))
+    assert file_check("csv", file_storage("result.csv"))
+    assert isinstance(file_storage("result_summary.csv"), str)
@@ -0,0 +1,140 @@
+import json
+
+import pytest
+
+from service.settings import settings
+
+TDS_URL = settings.TDS_URL
+
+
+@pytest.mark.example_dir("simulate")
+def test_simulate_batch_example(
+    example_context, client, worker, file_storage, file_check, requests_mock
+):
+    batch_id = "b8e4f31c-3f0e-4d2c-9d6a-2b8f52d4a001"
+    scenario_ids = [
+        "b8e4f31c-3f0e-4d2c-9d6a-2b8f52d4a002",
+        "b8e4f31c-3f0e-4d2c-9d6a-2b8f52d4a003",
+    ]
+    policy_id = "7ff1c6d2-fdca-43e9-8132-558b33a70006"
+
+    request = example_context["request"]
+    config_id = request["model_config_id"]
+    model = json.loads(example_context["fetch"](config_id + ".json"))
+    model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
+    policy = json.loads(example_context["fetch"]("intervention.json"))
+    for intervention in policy["interventions"]:
+        for static_intervention in intervention["static_interventions"]:
+            static_intervention["applied_to"] = "beta"
+
+    request = {
+        key: value for key, value in request.items() if key != "policy_intervention_id"
+    }
+    request["policy_intervention_ids"] = [None, policy_id]
+
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
+    requests_mock.post(
+        f"{TDS_URL}/simulations",
+        [{"json": {"id": id}} for id in [*scenario_ids, batch_id]],
+    )
+
+    response = client.post(
+        "/simulate-batch",
+        json=request,
+        headers={"Content-Type": "application/json"},
+    )
+    simulation_id = response.json()["simulation_id"]
+    assert simulation_id == batch_id
+    assert response.json()["scenario_ids"] == scenario_ids
+
+    response = client.get(f"/status/{simulation_id}/scenarios")
+    assert response.json()["status"] == "queued"
+    assert [scenario["status"] for scenario in response.json()["scenarios"]] == [
+        "queued",
+        "queued",
+    ]
+    # Scenario ids resolve through the batch job
+    response = client.get(f"/status/{scenario_ids[0]}")
+    assert response.json()["status"] == "queued"
+
+    tds_sim = example_context["tds_simulation"]
+    for id in [*scenario_ids, batch_id]:
+        requests_mock.get(f"{TDS_URL}/simulations/{id}", json={**tds_sim, "id": id})
+        requests_mock.put(f"{TDS_URL}/simulations/{id}", json={"status": "success"})
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}", json=model_config)
+    requests_mock.get(f"{TDS_URL}/interventions/{policy_id}", json=policy)
+
+    worker.work(burst=True)
+
+    response = client.get(f"/status/{simulation_id}/scenarios")
+    scenarios = response.json()["scenarios"]
+    result = file_storage("result.csv")
+
+    # Checks
+    assert response.json()["status"] == "complete"
+    assert [scenario["simulation_id"] for scenario in scenarios] == scenario_ids
+    assert [scenario["policy_intervention_id"] for scenario in scenarios] == [
+        None,
+        policy_id,
+    ]
+    assert all(scenario["status"] == "complete" for scenario in scenarios)
+    response = client.get(f"/status/{scenario_ids[1]}")
+    assert response.json()["status"] == "complete"
+
+    assert result is not None
+    assert file_check("csv", result)
+
+
+@pytest.mark.example_dir("simulate")
+def test_failed_policy_only_fails_its_scenario(
+    example_context, client, worker, file_storage, requests_mock
+):
+    batch_id = "b8e4f31c-3f0e-4d2c-9d6a-2b8f52d4a011"
+    scenario_ids = [
+        "b8e4f31c-3f0e-4d2c-9d6a-2b8f52d4a012",
+        "b8e4f31c-3f0e-4d2c-9d6a-2b8f52d4a013",
+    ]
+    policy_id = "7ff1c6d2-fdca-43e9-8132-558b33a70016"
+
+    request = example_context["request"]
+    config_id = request["model_config_id"]
+    model = json.loads(example_context["fetch"](config_id + ".json"))
+    model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
+    request = {
+        key: value for key, value in request.items() if key != "policy_intervention_id"
+    }
+    request["policy_intervention_ids"] = [None, policy_id]
+
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}/model", json=model)
+    requests_mock.get(f"{TDS_URL}/model-configurations/{config_id}", json=model_config)
+    requests_mock.get(f"{TDS_URL}/interventions/{policy_id}", status_code=404)
+    requests_mock.post(
+        f"{TDS_URL}/simulations",
+        [{"json": {"id": id}} for id in [*scenario_ids, batch_id]],
+    )
+    tds_sim = example_context["tds_simulation"]
+    for id in [*scenario_ids, batch_id]:
+        requests_mock.get(f"{TDS_URL}/simulations/{id}", json={**tds_sim, "id": id})
+        requests_mock.put(f"{TDS_URL}/simulations/{id}", json={"status": "success"})
+
+    client.post(
+        "/simulate-batch",
+        json=request,
+        headers={"Content-Type": "application/json"},
+    )
+    worker.work(burst=True)
+
+    response = client.get(f"/status/{batch_id}/scenarios")
+    assert [scenario["status"] for scenario in response.json()["scenarios"]] == [
+        "complete",
+        "error",
+    ]
+
+
+def test_batch_needs_a_scenario(client):
+    response = client.post(
+        "/simulate-batch",
+        json={"model_config_id": "config", "policy_intervention_ids": []},
+        headers={"Content-Type": "application/json"},
+    )
+    assert response.status_code == 422
@@ -0,0 +1,38 @@
+from rq import Queue
+
+
+def test_status_not_found(client):
+    response = client.get("/status/missing")
+    assert response.status_code == 404
+
+
+def test_status_failed_job(client, redis, worker):
+    queue = Queue(connection=redis, default_timeout=-1)
+    job = queue.enqueue("builtins.int", "not a number")
+
+    worker.work(burst=True)
+
+    response = client.get(f"/status/{job.id}")
+    assert response.json()["status"] == "failed"
+    assert "ValueError" in response.json()["error_msg"]
+
+
+def test_status_batch(client, redis, worker):
+    queue = Queue(connection=redis, default_timeout=-1)
+    succeeded = queue.enqueue("builtins.int", "1")
+    failed = queue.enqueue("builtins.int", "not a number")
+    worker.work(burst=True)
+    queued = queue.enqueue("builtins.int", "2")
+
+    simulation_ids = [succeeded.id, failed.id, queued.id, "missing"]
+    response = client.post("/status", json={"simulation_ids": simulation_ids})
+    statuses = response.json()["statuses"]
+
+    assert [status["simulation_id"] for status in statuses] == simulation_ids
+    assert [status["status"] for status in statuses] == [
+        "complete",
+        "failed",
+        "queued",
+        None,
+    ]
+    assert "ValueError" in statuses[1]["error_msg"]
@@ -0,0 +1,55 @@
+import json
+
+from rq.job import Job
+
+from settings import settings
+from service.utils.events import publish_event, publish_status
+
+
+def read_events(response):
+    events = []
+    for block in response.text.split("\n\n"):
+        fields = dict(
+            line.split(": ", 1) for line in block.splitlines() if ": " in line
+        )
+        if "event" in fields:
+            events.append((fields["id"], fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_replays_until_final_status(client, redis):
+    job_id = "stream-job"
+    publish_status(redis, job_id, "user", "queued")
+    publish_status(redis, job_id, "user", "running")
+    publish_event(redis, job_id, "user", "progress", {"iteration": 1, "loss": 2.0})
+    publish_status(redis, job_id, "user", "complete")
+
+    events = read_events(client.get(f"/stream/{job_id}"))
+    assert [event for _, event, _ in events] == [
+        "status",
+        "status",
+        "progress",
+        "status",
+    ]
+    assert events[2][2] == {"job_id": job_id, "iteration": 1, "loss": 2.0}
+    assert events[-1][2]["status"] == "complete"
+
+    resumed = read_events(
+        client.get(f"/stream/{job_id}", headers={"Last-Event-ID": events[1][0]})
+    )
+    assert resumed == events[2:]
+
+
+def test_unknown_simulations_are_not_streamed(client):
+    assert client.get("/stream/unknown-job").status_code == 404
+
+
+def test_stream_ends_once_expired(client, redis, monkeypatch):
+    monkeypatch.setattr(settings, "EVENT_STREAM_BLOCK_MS", 10)
+    job_id = "expired-job"
+    redis.hset(Job.key_for(job_id), "status", "finished")
+
+    response = client.get(f"/stream/{job_id}")
+
+    assert response.status_code == 200
+    assert read_events(response) == []
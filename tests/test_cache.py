@@ -0,0 +1,46 @@
+import os
+import time
+
+from service.utils.cache import DiskCache, TTLCache
+
+
+class TestDiskCache:
+    def test_roundtrip(self, tmp_path):
+        cache = DiskCache(str(tmp_path / "cache"), max_bytes=1024)
+        assert cache.read("model:a") is None
+
+        cache.write_json("model:a", {"x": 1.0})
+        assert cache.read_json("model:a") == {"x": 1.0}
+
+        destination = str(tmp_path / "a.json")
+        assert cache.link("model:a", destination)
+        assert os.path.exists(destination)
+        assert not cache.link("model:b", str(tmp_path / "b.json"))
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = DiskCache(str(tmp_path / "cache"), max_bytes=250)
+        cache.write("first", b"1" * 100)
+        time.sleep(0.01)
+        cache.write("second", b"2" * 100)
+        time.sleep(0.01)
+        cache.read("first")
+        time.sleep(0.01)
+        cache.write("third", b"3" * 100)
+
+        assert cache.read("first") is not None
+        assert cache.read("second") is None
+        assert cache.read("third") is not None
+
+
+class TestTTLCache:
+    def test_expires(self):
+        cache = TTLCache(max_entries=2, ttl=0.05)
+        cache.put("job", ("finished", None))
+        assert cache.get("job") == ("finished", None)
+        time.sleep(0.06)
+        assert cache.get("job") is None
+
+    def test_disabled(self):
+        cache = TTLCache(max_entries=2, ttl=0)
+        cache.put("job", ("finished", None))
+        assert cache.get("job") is None
@@ -0,0 +1,169 @@
+import pyro
+import pytest
+import torch
+from pyciemss.interfaces import calibrate, sample
+from pyro import distributions as dist
+from pyro import poutine
+from pyro.infer import SVI, Trace_ELBO
+from pyro.infer.autoguide import AutoDelta, AutoGuideList
+
+from service.utils.calibration import (
+    CalibrationMonitor,
+    GuideFactory,
+    StopCalibration,
+)
+
+CALIBRATE_INPUT = "tests/examples/calibrate/input"
+DATA = torch.tensor(1.5)
+
+
+def model(data):
+    beta = pyro.sample("beta", dist.Uniform(0.1, 0.9))
+    gamma = pyro.sample("gamma", dist.LogNormal(0.0, 1.0))
+    pyro.sample("obs", dist.Normal(beta + gamma, 0.1), obs=data)
+
+
+def calibration_guide(autoguide):
+    # Built the way pyciemss builds the guide of a calibration
+    guide = AutoGuideList(model)
+    guide.append(AutoDelta(poutine.block(model, expose=["gamma"])))
+    part = autoguide(poutine.block(model, hide=["gamma"]))
+    part._setup_prototype(DATA)
+    guide.append(part)
+    return guide
+
+
+def train(guide, steps, hook=lambda *args: None):
+    svi = SVI(model, guide, pyro.optim.Adam({"lr": 0.05}), Trace_ELBO())
+    for step in range(steps):
+        hook(step, svi.step(DATA))
+
+
+def calibrate_loop(guide, data, steps, hook):
+    # The way pyciemss reports progress, before each step with the last loss
+    svi = SVI(model, guide, pyro.optim.Adam({"lr": 0.05}), Trace_ELBO())
+    loss = 0.0
+    for step in range(steps):
+        hook(step, loss)
+        loss = svi.step(data)
+
+
+def run(monitor, losses):
+    for iteration, loss in enumerate(losses):
+        monitor(iteration, loss)
+
+
+def test_runs_every_iteration_without_patience():
+    calls = []
+    monitor = CalibrationMonitor(
+        lambda *args: calls.append(args), GuideFactory(), num_iterations=100
+    )
+    run(monitor, [1.0] * 100)
+
+    assert len(calls) == 100
+    assert monitor.report()["iterations_saved"] == 0
+    assert not monitor.report()["stopped_early"]
+
+
+def test_stops_once_the_loss_plateaus():
+    monitor = CalibrationMonitor(
+        lambda *args: None,
+        GuideFactory(),
+        num_iterations=1000,
+        patience=10,
+        tolerance=1e-3,
+        warm_start="calibration-id",
+    )
+    losses = [100 / (iteration + 1) for iteration in range(50)] + [2.0] * 950
+
+    with pytest.raises(StopCalibration) as stop:
+        run(monitor, losses)
+
+    assert stop.value.output == {"inferred_parameters": None, "loss": 2.0}
+    report = monitor.report()
+    assert report["stopped_early"]
+    assert report["warm_start"] == "calibration-id"
+    assert 50 < report["iterations_run"] < 200
+    assert report["iterations_saved"] == 1000 - report["iterations_run"]
+
+
+def test_keeps_going_while_real_losses_decrease():
+    pyro.set_rng_seed(0)
+    pyro.clear_param_store()
+    guides = GuideFactory()
+    guide = calibration_guide(guides)
+    losses = []
+    monitor = CalibrationMonitor(
+        lambda step, loss: losses.append(loss), guides, 15, patience=5
+    )
+
+    # Far from the prior, the loss falls steadily for the first steps
+    calibrate_loop(guide, torch.tensor(4.0), 15, monitor)
+
+    assert losses[0] == 0.0
+    assert losses[-1] < losses[1]
+    assert monitor.best < losses[1]
+    assert not monitor.report()["stopped_early"]
+
+
+def test_skips_placeholder_and_non_finite_losses():
+    monitor = CalibrationMonitor(lambda *args: None, GuideFactory(), 10, patience=3)
+    run(monitor, [0.0, float("nan"), 10.0, float("inf"), 9.0, 8.0, 7.0, 6.0])
+
+    assert monitor.smoothed < 10.0
+    assert monitor.since_best == 0
+    assert monitor.report()["final_loss"] == 6.0
+    assert monitor.report()["iterations_run"] == 8
+
+
+def test_early_stops_return_the_whole_guide():
+    pyro.clear_param_store()
+    guides = GuideFactory()
+    guide = calibration_guide(guides)
+    monitor = CalibrationMonitor(lambda *args: None, guides, 100, patience=1)
+
+    with pytest.raises(StopCalibration) as stop:
+        train(guide, 100, lambda step, loss: monitor(step, 1.0))
+
+    assert stop.value.output["inferred_parameters"] is guide
+
+
+def test_warm_start_takes_over_the_previous_guide():
+    pyro.clear_param_store()
+    previous = calibration_guide(GuideFactory())
+    train(previous, 50)
+
+    pyro.clear_param_store()
+    guides = GuideFactory(previous)
+    guide = calibration_guide(guides)
+    assert guides.guide is not previous[1]
+    guide(DATA)
+
+    for name, value in previous[1].state_dict().items():
+        torch.testing.assert_close(guides.guide.state_dict()[name], value)
+    assert guides.full_guide() is guide
+
+
+def test_warm_started_calibrations_sample():
+    model_path = f"{CALIBRATE_INPUT}/0da53e71-52c4-49fd-b957-2219af712fdd.json"
+    options = {
+        "data_mapping": {"tstep": "Timestamp", "S": "Susceptible"},
+        "num_iterations": 5,
+    }
+    previous = calibrate(model_path, f"{CALIBRATE_INPUT}/test.csv", **options)
+
+    guides = GuideFactory(previous["inferred_parameters"])
+    monitor = CalibrationMonitor(lambda *args: None, guides, 5, patience=1)
+    with pytest.raises(StopCalibration) as stop:
+        calibrate(
+            model_path,
+            f"{CALIBRATE_INPUT}/test.csv",
+            autoguide=guides,
+            progress_hook=lambda step, loss: monitor(step, 1.0),
+            **options,
+        )
+
+    guide = stop.value.output["inferred_parameters"]
+    assert isinstance(guide, AutoGuideList)
+    result = sample(model_path, 10, 1.0, num_samples=5, inferred_parameters=guide)
+    assert result["data"]["sample_id"].nunique() == 5
@@ -0,0 +1,24 @@
+import pytest
+from fakeredis import FakeStrictRedis
+from rq import Queue
+from rq.command import handle_stop_job_command
+
+from service.worker import WarmWorker
+
+# The same module the worker flags jobs in, service.utils.cancellation is a copy
+from utils.cancellation import JobCancelled, raise_if_cancelled, stop_when_cancelled
+
+
+def test_stopping_a_job_cancels_it_cooperatively():
+    redis = FakeStrictRedis()
+    worker = WarmWorker([Queue(connection=redis)], connection=redis)
+    worker.set_current_job_id("job")
+    hook = stop_when_cancelled("job", lambda progress: progress)
+    assert hook(0.5) == 0.5
+
+    # Would kill the worker process itself if it weren't cooperative
+    handle_stop_job_command(worker, {"job_id": "job"})
+
+    with pytest.raises(JobCancelled):
+        hook(0.6)
+    raise_if_cancelled("job")
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from service.utils import chunking
+from service.utils.chunking import (
+    ResultWriter,
+    StreamingSummary,
+    peak_samples,
+    plan_chunks,
+    run_chunked,
+    split_samples,
+)
+from service.utils.sharding import shard_seed
+from service.utils.tds import get_result_summary
+from tests.test_result_summary import make_result
+
+
+def chunks_of(data_result, num_chunks):
+    sample_ids = np.array_split(data_result["sample_id"].unique(), num_chunks)
+    return [
+        data_result[data_result["sample_id"].isin(ids)].reset_index(drop=True)
+        for ids in sample_ids
+    ]
+
+
+def test_split_samples():
+    assert split_samples(100, 100) == []
+    assert split_samples(250, 100) == [100, 100, 50]
+    assert split_samples(250, 0) == []
+
+
+@pytest.mark.parametrize("quantiles", [(), (0.05, 0.95)])
+def test_summary_matches_in_memory_summary(quantiles):
+    data_result = make_result(num_samples=40)
+    data_result.loc[::7, "S_state"] = np.nan
+
+    summary = StreamingSummary(quantiles)
+    for chunk in chunks_of(data_result, 3):
+        summary.update(chunk)
+
+    pd.testing.assert_frame_equal(
+        summary.result(),
+        get_result_summary(data_result, quantiles),
+        check_dtype=False,
+    )
+
+
+def test_summary_sketches_quantiles_of_large_requests():
+    data_result = make_result(num_samples=2000)
+    expected = get_result_summary(data_result, (0.25,))
+
+    summary = StreamingSummary((0.25,), sketch_size=500, seed=0)
+    for chunk in chunks_of(data_result, 8):
+        summary.update(chunk)
+    actual = summary.result()
+
+    exact = ["S_state_mean", "S_state_std", "S_state_min", "S_state_max"]
+    pd.testing.assert_frame_equal(actual[exact], expected[exact])
+    for column in ["S_state_median", "S_state_q0.25"]:
+        np.testing.assert_allclose(actual[column], expected[column], rtol=0.05)
+
+
+@pytest.mark.parametrize("output_format", ["csv", "parquet", "arrow"])
+def test_writer_appends_chunks(tmp_path, output_format):
+    data_result = make_result()
+    writer = ResultWriter(tmp_path, output_format)
+    for chunk in chunks_of(data_result, 3):
+        writer.write(chunk)
+    writer.close()
+
+    read = {
+        "csv": pd.read_csv,
+        "parquet": pd.read_parquet,
+        "arrow": pd.read_feather,
+    }[output_format]
+    written = read(writer.path).sort_values(["sample_id", "timepoint_id"])
+    expected = data_result.sort_values(["sample_id", "timepoint_id"])
+    pd.testing.assert_frame_equal(
+        written.reset_index(drop=True), expected.reset_index(drop=True)
+    )
+
+
+def test_run_chunked_renumbers_samples(tmp_path):
+    chunk_sizes = [10, 10, 5]
+    results = (
+        make_result(num_samples=num_samples, seed=index)
+        for index, num_samples in enumerate(chunk_sizes)
+    )
+
+    result = run_chunked(chunk_sizes, results, tmp_path, "csv", (), seed=0)
+
+    written = pd.read_csv(result.path)
+    assert sorted(written["sample_id"].unique()) == list(range(25))
+    assert len(result.summary) == written["timepoint_id"].nunique()
+
+
+def test_shards_get_a_chunk_per_process(monkeypatch):
+    monkeypatch.setattr(chunking.settings, "SAMPLE_SHARD_PROCESSES", 4)
+    monkeypatch.setattr(chunking.settings, "SAMPLE_SHARD_MIN_SAMPLES", 1000)
+
+    assert plan_chunks(999) == []
+    assert plan_chunks(2000) == [500] * 4
+    assert plan_chunks(10**5) == [chunking.settings.SAMPLE_CHUNK_SIZE] * 10
+    assert peak_samples(2000) == 4000
+
+
+def test_shard_seeds():
+    seeds = [shard_seed("job", index) for index in range(4)]
+    assert len(set(seeds)) == 4
+    assert seeds == [shard_seed("job", index) for index in range(4)]
+    assert shard_seed("job", 0, seed=1) == shard_seed("other-job", 0, seed=1)
+    assert shard_seed("job", 0) != shard_seed("other-job", 0)
@@ -17,6 +17,7 @@ from service.models import (
     EnsembleSimulate,
     EnsembleCalibrate,
     Optimize,
+    SimulateBatch,
 )
 from service.settings import settings
 
@@ -60,6 +61,73 @@ class TestSimulate:
         # assert kwargs.get("visual_options", False)
         is_satisfactory(kwargs, sample)
 
+    @pytest.mark.example_dir("simulate")
+    def test_intervention_conversion(self, example_context, requests_mock):
+        job_id = example_context["tds_simulation"]["id"]
+
+        config_id = example_context["request"]["model_config_id"]
+        model = json.loads(example_context["fetch"](config_id + ".json"))
+        requests_mock.get(
+            f"{TDS_URL}/model-configurations/{config_id}/model",
+            json=model,
+        )
+        model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
+        requests_mock.get(
+            f"{TDS_URL}/model-configurations/{config_id}",
+            json=model_config,
+        )
+        policy = json.loads(example_context["fetch"]("intervention.json"))
+        policy_id = policy["id"]
+        policy_mock = requests_mock.get(
+            f"{TDS_URL}/interventions/{policy_id}", json=policy
+        )
+
+        ### Act and Assert
+
+        operation_request = Simulate(
+            **example_context["request"], policy_intervention_id=policy_id
+        )
+        kwargs = operation_request.gen_pyciemss_args(job_id)
+
+        assert policy_mock.call_count == 1
+        assert len(kwargs["static_parameter_interventions"]) == 2
+        assert not kwargs["dynamic_parameter_interventions"]
+        assert (
+            operation_request.gen_pyciemss_args(job_id)[
+                "static_parameter_interventions"
+            ]
+            is kwargs["static_parameter_interventions"]
+        )
+
+
+class TestSimulateBatch:
+    @pytest.mark.example_dir("simulate")
+    def test_example_conversion(self, example_context, requests_mock):
+        job_id = example_context["tds_simulation"]["id"]
+
+        config_id = example_context["request"]["model_config_id"]
+        model = json.loads(example_context["fetch"](config_id + ".json"))
+        requests_mock.get(
+            f"{TDS_URL}/model-configurations/{config_id}/model",
+            json=model,
+        )
+        model_config = json.loads(example_context["fetch"](config_id + "_config.json"))
+        requests_mock.get(
+            f"{TDS_URL}/model-configurations/{config_id}",
+            json=model_config,
+        )
+
+        ### Act and Assert
+
+        operation_request = SimulateBatch(
+            **example_context["request"], policy_intervention_ids=[None, None]
+        )
+        scenario_args = operation_request.gen_pyciemss_args(job_id)
+
+        assert list(scenario_args) == [None]
+        for args in scenario_args.values():
+            is_satisfactory(args(), sample)
+
 
 class TestCalibrate:
     @pytest.mark.example_dir("calibrate")
@@ -80,12 +148,13 @@ class TestCalibrate:
 
         dataset_id = example_context["request"]["dataset"]["id"]
         filename = example_context["request"]["dataset"]["filename"]
-        dataset = example_context["fetch"](filename, True)
-        dataset_loc = {"method": "GET", "url": dataset}
+        dataset = example_context["fetch"](filename)
+        dataset_loc = {"method": "GET", "url": "http://dataset"}
         requests_mock.get(
             f"{TDS_URL}/datasets/{dataset_id}/download-url?filename={filename}",
             json=dataset_loc,
         )
+        requests_mock.get("http://dataset", text=dataset)
 
         ### Act and Assert
         operation_request = Calibrate(**example_context["request"])
@@ -136,8 +205,8 @@ class TestEnsembleCalibrate:
 
         dataset_id = example_context["request"]["dataset"]["id"]
         filename = example_context["request"]["dataset"]["filename"]
-        dataset = example_context["fetch"](filename, True)
-        dataset_loc = {"method": "GET", "url": dataset}
+        dataset = example_context["fetch"](filename)
+        dataset_loc = {"method": "GET", "url": "http://dataset"}
         requests_mock.get(
             f"{TDS_URL}/datasets/{dataset_id}/download-url?filename={filename}",
             json=dataset_loc,
@@ -0,0 +1,184 @@
+import json
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from fakeredis import FakeStrictRedis
+from fastapi import HTTPException
+from requests.exceptions import ConnectTimeout
+from rq.utils import utcnow
+
+from service.models import Simulate
+from service.settings import settings
+from service.utils import cost_model
+from service.utils.cache import DiskCache, LRUCache
+from service.utils.cost_model import RATES_KEY, admit, estimate, record_runtime
+from service.utils.scheduling import route
+
+# The module the cost model fetches through, service.utils.tds is a copy
+from utils import tds
+
+TDS_URL = settings.TDS_URL
+
+
+@pytest.fixture(autouse=True)
+def model_cache(monkeypatch, tmp_path):
+    cache = DiskCache(str(tmp_path / "models"), 10**7)
+    monkeypatch.setattr(tds, "model_cache", cache)
+    monkeypatch.setattr(cost_model, "model_cache", cache)
+    monkeypatch.setattr(cost_model, "model_sizes", LRUCache(10))
+    return cache
+
+
+@pytest.fixture
+def sidarthe(requests_mock):
+    with open("tests/examples/simulate/input/sidarthe.json") as file:
+        model = json.load(file)
+
+    def get(request, context):
+        context.headers["ETag"] = '"sidarthe-1"'
+        if request.headers.get("If-None-Match") == '"sidarthe-1"':
+            context.status_code = 304
+            return b""
+        return json.dumps(model).encode()
+
+    requests_mock.get(f"{TDS_URL}/model-configurations/sidarthe/model", content=get)
+    # 8 states, 16 parameters and 3 observables
+    return 27
+
+
+def simulate_request(num_samples=100, logging_step_size=1.0, end=90):
+    return Simulate(
+        model_config_id="sidarthe",
+        timespan={"start": 0, "end": end},
+        logging_step_size=logging_step_size,
+        extra={"num_samples": num_samples},
+    )
+
+
+class TestEstimate:
+    def test_scales_with_model_size(self, sidarthe):
+        job_estimate = estimate(FakeStrictRedis(), simulate_request(), "simulate")
+
+        assert job_estimate["work"] == 100 * 90 * sidarthe
+        assert job_estimate["runtime_seconds"] == pytest.approx(
+            job_estimate["work"] * settings.COST_MODEL_SECONDS_PER_UNIT
+        )
+        assert job_estimate["peak_memory_bytes"] == (
+            settings.WORKER_BASE_MEMORY_BYTES
+            + 100 * 90 * (sidarthe + 3) * settings.BYTES_PER_RESULT_VALUE
+        )
+
+    def test_models_are_only_downloaded_when_changed(self, sidarthe, requests_mock):
+        for _ in range(2):
+            job_estimate = estimate(FakeStrictRedis(), simulate_request(), "simulate")
+            assert job_estimate["work"] == 100 * 90 * sidarthe
+
+        conditional = [
+            "If-None-Match" in request.headers
+            for request in requests_mock.request_history
+        ]
+        assert conditional == [False, True]
+
+    def test_learns_from_finished_jobs(self, sidarthe):
+        redis = FakeStrictRedis()
+        job_estimate = estimate(redis, simulate_request(), "simulate")
+        job = SimpleNamespace(
+            id="job",
+            connection=redis,
+            meta={"estimate": job_estimate},
+            started_at=utcnow() - timedelta(seconds=10),
+        )
+
+        record_runtime(job)
+        first_rate = float(redis.hget(RATES_KEY, "simulate"))
+        assert first_rate == pytest.approx(10 / job_estimate["work"], rel=0.1)
+        assert estimate(redis, simulate_request(), "simulate")[
+            "runtime_seconds"
+        ] == pytest.approx(10, rel=0.1)
+
+        job.started_at = utcnow() - timedelta(seconds=20)
+        record_runtime(job)
+        assert float(redis.hget(RATES_KEY, "simulate")) == pytest.approx(
+            first_rate * 1.2, rel=0.1
+        )
+
+
+class TestAdmit:
+    def test_rejects_jobs_over_the_memory_budget(self, sidarthe):
+        with pytest.raises(HTTPException) as e:
+            admit(
+                FakeStrictRedis(),
+                simulate_request(logging_step_size=0.001, end=3650),
+                "simulate",
+            )
+        assert e.value.status_code == 422
+        assert "memory" in e.value.detail
+
+    def test_chunked_samples_only_count_once_against_memory(self, sidarthe):
+        request = simulate_request(num_samples=10**6)
+        job_estimate = estimate(FakeStrictRedis(), request, "simulate")
+        assert job_estimate["peak_memory_bytes"] < settings.MAX_JOB_MEMORY_BYTES
+
+        with pytest.raises(HTTPException) as e:
+            admit(FakeStrictRedis(), request, "simulate")
+        assert "run for" in e.value.detail
+
+    def test_summary_of_chunked_samples_counts_against_memory(
+        self, sidarthe, monkeypatch
+    ):
+        request = simulate_request(num_samples=10**6)
+        job_estimate = estimate(FakeStrictRedis(), request, "simulate")
+        sketch_size = settings.SUMMARY_SKETCH_SIZE
+        monkeypatch.setattr(cost_model.settings, "SUMMARY_SKETCH_SIZE", 10**6)
+
+        with pytest.raises(HTTPException) as e:
+            admit(FakeStrictRedis(), request, "simulate")
+        assert "memory" in e.value.detail
+        assert (
+            estimate(FakeStrictRedis(), request, "simulate")["peak_memory_bytes"]
+            - job_estimate["peak_memory_bytes"]
+            == 90 * sidarthe * (10**6 - sketch_size) * 8
+        )
+
+    def test_downgrades_jobs_over_the_runtime_budget(self, sidarthe, monkeypatch):
+        redis = FakeStrictRedis()
+        redis.hset(RATES_KEY, "simulate", 1.0)
+        request = simulate_request()
+
+        with pytest.raises(HTTPException):
+            admit(redis, request, "simulate")
+
+        monkeypatch.setattr(cost_model.settings, "ADMISSION_POLICY", "downgrade")
+        job_estimate = admit(redis, request, "simulate")
+        assert job_estimate["downgraded"]
+        assert route(redis, request, "simulate", job_estimate)[0] == ("low")
+
+    def test_long_jobs_get_a_long_enough_timeout(self, sidarthe):
+        redis = FakeStrictRedis()
+        # About 10 hours, over the simulate timeout but within the budget
+        redis.hset(RATES_KEY, "simulate", 10 * 60 * 60 / (100 * 90 * sidarthe))
+        request = simulate_request()
+
+        job_estimate = admit(redis, request, "simulate")
+        _, timeout = route(redis, request, "simulate", job_estimate)
+
+        assert job_estimate["runtime_seconds"] > settings.JOB_TIMEOUTS["simulate"]
+        assert timeout >= job_estimate["runtime_seconds"]
+        assert timeout <= settings.MAX_JOB_RUNTIME
+
+    def test_large_models_are_routed_by_their_work(self, sidarthe):
+        redis = FakeStrictRedis()
+        request = simulate_request(num_samples=300)
+        job_estimate = admit(redis, request, "simulate")
+
+        assert request.estimated_cost() <= settings.QUEUE_HIGH_MAX_COST
+        assert route(redis, request, "simulate")[0] == "high"
+        assert route(redis, request, "simulate", job_estimate)[0] == "default"
+
+    def test_unreachable_models_get_the_default_size(self, requests_mock):
+        requests_mock.get(
+            f"{TDS_URL}/model-configurations/sidarthe/model", exc=ConnectTimeout
+        )
+        job_estimate = admit(FakeStrictRedis(), simulate_request(), "simulate")
+        assert job_estimate["work"] == 100 * 90 * settings.DEFAULT_MODEL_VARIABLES
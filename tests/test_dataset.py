@@ -0,0 +1,45 @@
+import pandas as pd
+
+from service.utils import tds
+from service.utils.cache import DiskCache
+
+TDS_URL = "http://tds"
+DATASET = "tstep,S,I,R\n1.0,0.9,0.1,0.0\n2.0,0.8,0.15,0.05\n"
+
+
+def fetch(dataset_id="d1"):
+    dataset = {
+        "id": dataset_id,
+        "filename": "data.csv",
+        "mappings": {"tstep": "timestamp", "S": "Susceptible"},
+    }
+    return pd.read_csv(tds.fetch_dataset(dataset, "dataset-job"))
+
+
+def test_dataset_is_downloaded_once(monkeypatch, tmp_path, requests_mock):
+    monkeypatch.setattr(tds, "TDS_URL", TDS_URL)
+    monkeypatch.setattr(
+        tds, "dataset_cache", DiskCache(str(tmp_path / "datasets"), 10**6)
+    )
+    requests_mock.get(
+        f"{TDS_URL}/datasets/d1/download-url?filename=data.csv",
+        json={"url": "http://storage/data.csv"},
+    )
+
+    def download(request, context):
+        if request.headers.get("If-None-Match") == "v1":
+            context.status_code = 304
+            return ""
+        context.headers["ETag"] = "v1"
+        return DATASET
+
+    storage = requests_mock.get("http://storage/data.csv", text=download)
+
+    first = fetch()
+    assert list(first.columns) == ["Timestamp", "Susceptible"]
+    assert first["Susceptible"].tolist() == [0.9, 0.8]
+
+    second = fetch()
+    assert storage.call_count == 2
+    assert storage.last_request.headers["If-None-Match"] == "v1"
+    pd.testing.assert_frame_equal(first, second)
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from service.utils import tds
+from service.utils.cache import DiskCache
+from service.utils.tds import loads_float, normalize_model, shim_float
+
+
+@pytest.mark.example_dir("simulate")
+def test_decoded_floats_match_shim(example_context):
+    config_id = example_context["request"]["model_config_id"]
+    content = example_context["fetch"](config_id + ".json")
+
+    shimmed = normalize_model(json.loads(content))
+    decoded = normalize_model(loads_float(content), shimmed=True)
+
+    assert decoded == shimmed
+    assert json.dumps(decoded) == json.dumps(shimmed)
+
+
+def test_shim_float():
+    obj = {"a": 1, "b": [2, {"c": 3, "d": True}], "e": "1", "f": None, "g": 1.5}
+    assert shim_float(obj) == {
+        "a": 1.0,
+        "b": [2.0, {"c": 3.0, "d": True}],
+        "e": "1",
+        "f": None,
+        "g": 1.5,
+    }
+    assert type(obj["b"][0]) is float
+    assert shim_float(2) == 2.0 and shim_float(None) is None
+
+
+def test_shim_float_on_deep_documents():
+    deep = leaf = {"value": 1}
+    for _ in range(5000):
+        deep = {"nested": [deep]}
+
+    shim_float(deep)
+
+    assert type(leaf["value"]) is float
+
+
+def test_model_errors_are_not_cached(monkeypatch, tmp_path, requests_mock):
+    monkeypatch.setattr(tds, "TDS_URL", "http://tds")
+    monkeypatch.setattr(
+        tds, "model_cache", DiskCache(str(tmp_path / "models"), 10**6)
+    )
+    model_url = "http://tds/model-configurations/config/model"
+    requests_mock.get(model_url, status_code=503, json={"error": "unavailable"})
+
+    with pytest.raises(HTTPException):
+        tds.fetch_model("config", "model-job")
+    assert tds.model_cache.read_json("validator:config") is None
+
+    requests_mock.get(model_url, json={"header": {"name": "SIR"}, "x": 1})
+    with open(tds.fetch_model("config", "model-job")) as file:
+        assert json.load(file) == {"header": {"name": "SIR"}, "x": 1.0}
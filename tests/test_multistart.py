@@ -0,0 +1,57 @@
+import numpy as np
+
+from service.utils import multistart
+from service.utils.multistart import best_start, run_multistart, start_kwargs
+
+
+def optimize_kwargs(**kwargs):
+    return {
+        "initial_guess_interventions": [0.02],
+        "bounds_interventions": [[0.0], [0.08]],
+        "progress_hook": lambda current_results: None,
+        **kwargs,
+    }
+
+
+def test_starts_after_the_first_guess_within_bounds():
+    kwargs = optimize_kwargs()
+    assert start_kwargs(kwargs, 0, seed=1) is kwargs
+
+    guesses = [
+        start_kwargs(kwargs, index, seed)["initial_guess_interventions"]
+        for index, seed in enumerate([1, 2, 3])
+    ]
+    assert guesses[1] != guesses[2]
+    assert all(0 <= guess[0] <= 0.08 for guess in guesses[1:])
+    assert start_kwargs(kwargs, 1, seed=2) == start_kwargs(kwargs, 1, seed=2)
+
+    unbounded = optimize_kwargs(bounds_interventions=[[None], [0.08]])
+    assert start_kwargs(unbounded, 1, seed=2) is unbounded
+
+
+def test_best_start_has_the_lowest_objective():
+    outputs = [
+        {"OptResults": {"fun": 2.0}},
+        {"OptResults": {"fun": 1.0}},
+        {"OptResults": {"fun": 1.0}},
+        {"OptResults": {"fun": float("nan")}},
+        {},
+    ]
+    assert best_start(outputs) == 1
+
+
+def test_run_multistart_counts_evaluations(monkeypatch):
+    monkeypatch.setattr(multistart.settings, "OPTIMIZE_PROCESSES", 1)
+    calls = []
+
+    def optimize(initial_guess_interventions, progress_hook, **kwargs):
+        calls.append(initial_guess_interventions)
+        progress_hook(np.array(initial_guess_interventions))
+        return {"OptResults": {"fun": abs(initial_guess_interventions[0] - 0.05)}}
+
+    hook_calls = []
+    kwargs = optimize_kwargs(progress_hook=hook_calls.append)
+    output = run_multistart(optimize, kwargs, seeds=[1, 2, 3])
+
+    assert len(calls) == len(hook_calls) == 3
+    assert output["OptResults"]["fun"] == min(abs(guess[0] - 0.05) for guess in calls)
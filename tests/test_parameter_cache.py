@@ -0,0 +1,49 @@
+import dill
+import pytest
+
+from service.utils import tds
+from service.utils.cache import DiskCache, LRUCache
+
+TDS_URL = "http://tds"
+
+
+@pytest.fixture
+def calibration(monkeypatch, tmp_path, requests_mock):
+    monkeypatch.setattr(tds, "TDS_URL", TDS_URL)
+    monkeypatch.setattr(tds, "inferred_parameters", LRUCache(2))
+    monkeypatch.setattr(
+        tds, "parameters_cache", DiskCache(str(tmp_path / "parameters"), 10**6)
+    )
+    download_url = f"{TDS_URL}/simulations/calibration/download-url?filename="
+    requests_mock.get(download_url + "parameters.safetensors", status_code=404)
+    requests_mock.get(
+        download_url + "parameters.dill", json={"url": "http://storage/calibration"}
+    )
+    return requests_mock.get(
+        "http://storage/calibration", content=dill.dumps({"beta": 0.5})
+    )
+
+
+def test_parameters_are_downloaded_once(calibration):
+    first = tds.fetch_inferred_parameters("calibration", "job-1")
+    second = tds.fetch_inferred_parameters("calibration", "job-2")
+
+    assert first == {"beta": 0.5}
+    assert second is first
+    assert calibration.call_count == 1
+
+
+def test_evicted_parameters_are_loaded_from_disk(calibration):
+    tds.fetch_inferred_parameters("calibration", "job-1")
+    tds.inferred_parameters.pop("calibration")
+
+    assert tds.fetch_inferred_parameters("calibration", "job-2") == {"beta": 0.5}
+    assert calibration.call_count == 1
+
+
+def test_previous_guides_are_copies(calibration):
+    shared = tds.fetch_inferred_parameters("calibration", "job-1")
+    guide = tds.fetch_previous_guide("calibration", "job-2")
+
+    assert guide == shared and guide is not shared
+    assert calibration.call_count == 1
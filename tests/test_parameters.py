@@ -0,0 +1,150 @@
+import numpy as np
+import pyro
+import pytest
+import torch
+from pyciemss.interfaces import calibrate, sample
+from pyro import distributions as dist
+from pyro import poutine
+from pyro.infer import SVI, Trace_ELBO
+from pyro.infer.autoguide import (
+    AutoDelta,
+    AutoGuideList,
+    AutoLowRankMultivariateNormal,
+)
+
+from service.utils import parameters
+from service.utils.parameters import dump_guide, dump_tensors, load_guide, load_tensors
+
+CALIBRATE_INPUT = "tests/examples/calibrate/input"
+
+
+def test_tensor_roundtrip(tmp_path):
+    tensors = {
+        "loc": np.arange(6, dtype=np.float32).reshape(2, 3),
+        "scale": np.array(0.5),
+        "steps": np.array([1, 2, 3], dtype=np.int64),
+        "empty": np.zeros((0, 2), dtype=np.float64),
+    }
+    path = tmp_path / "parameters.safetensors"
+    path.write_bytes(dump_tensors(tensors, {"guide": "AutoNormal"}))
+
+    loaded, metadata = load_tensors(path)
+
+    assert metadata == {"guide": "AutoNormal"}
+    assert list(loaded) == list(tensors)
+    for name, array in tensors.items():
+        np.testing.assert_array_equal(loaded[name], array)
+        assert loaded[name].dtype == array.dtype
+    # Writes stay in memory
+    loaded["loc"][0, 0] = 100
+    np.testing.assert_array_equal(load_tensors(path)[0]["loc"], tensors["loc"])
+
+
+def model(data):
+    beta = pyro.sample("beta", dist.Uniform(0.1, 0.9))
+    gamma = pyro.sample("gamma", dist.LogNormal(0.0, 1.0))
+    pyro.sample("obs", dist.Normal(beta + gamma, 0.1), obs=data)
+
+
+def test_guide_roundtrip(tmp_path):
+    pyro.clear_param_store()
+    guide = AutoLowRankMultivariateNormal(model)
+    svi = SVI(model, guide, pyro.optim.Adam({"lr": 0.05}), Trace_ELBO())
+    for _ in range(20):
+        svi.step(torch.tensor(1.5))
+    path = tmp_path / "parameters.safetensors"
+    path.write_bytes(dump_guide(guide))
+
+    pyro.clear_param_store()
+    loaded = load_guide(path)
+
+    for name, value in guide.median().items():
+        torch.testing.assert_close(loaded.median()[name], value)
+    pyro.set_rng_seed(0)
+    expected = guide()
+    pyro.set_rng_seed(0)
+    for name, value in loaded().items():
+        torch.testing.assert_close(value, expected[name])
+
+
+def test_guide_list_roundtrip(tmp_path):
+    # Laid out like the guides of pyciemss calibrations
+    pyro.clear_param_store()
+    guide = AutoGuideList(model)
+    guide.append(AutoDelta(poutine.block(model, expose=["gamma"])))
+    normal = AutoLowRankMultivariateNormal(poutine.block(model, hide=["gamma"]))
+    normal._setup_prototype(torch.tensor(1.5))
+    guide.append(normal)
+    svi = SVI(model, guide, pyro.optim.Adam({"lr": 0.05}), Trace_ELBO())
+    for _ in range(20):
+        svi.step(torch.tensor(1.5))
+    path = tmp_path / "parameters.safetensors"
+    path.write_bytes(dump_guide(guide))
+
+    pyro.clear_param_store()
+    loaded = load_guide(path)
+
+    assert [type(part) for part in loaded] == [type(part) for part in guide]
+    assert set(loaded.state_dict()) == set(guide.state_dict())
+    for name, value in guide.median().items():
+        torch.testing.assert_close(loaded.median()[name], value)
+    pyro.set_rng_seed(0)
+    expected = guide()
+    pyro.set_rng_seed(0)
+    for name, value in loaded().items():
+        torch.testing.assert_close(value, expected[name])
+
+
+def test_loaded_guides_use_the_mapped_file(tmp_path, monkeypatch):
+    pyro.clear_param_store()
+    guide = AutoLowRankMultivariateNormal(model)
+    guide(torch.tensor(1.5))
+    path = tmp_path / "parameters.safetensors"
+    path.write_bytes(dump_guide(guide))
+    mapped = {}
+
+    def load(path):
+        tensors, metadata = load_tensors(path)
+        mapped.update(tensors)
+        return tensors, metadata
+
+    monkeypatch.setattr(parameters, "load_tensors", load)
+    loaded = load_guide(path)
+
+    for name, value in loaded.named_parameters():
+        assert value.data_ptr() == mapped[name].ctypes.data
+    # Training only changes the copy in memory
+    pyro.clear_param_store()
+    svi = SVI(model, loaded, pyro.optim.Adam({"lr": 0.05}), Trace_ELBO())
+    svi.step(torch.tensor(1.5))
+    for name, value in guide.state_dict().items():
+        np.testing.assert_array_equal(load_tensors(path)[0][name], value.numpy())
+
+
+@pytest.fixture(scope="module")
+def calibration():
+    model_path = f"{CALIBRATE_INPUT}/0da53e71-52c4-49fd-b957-2219af712fdd.json"
+    output = calibrate(
+        model_path,
+        f"{CALIBRATE_INPUT}/test.csv",
+        data_mapping={"tstep": "Timestamp", "S": "Susceptible"},
+        num_iterations=5,
+    )
+    return model_path, output["inferred_parameters"]
+
+
+def test_calibration_roundtrip(calibration, tmp_path):
+    model_path, guide = calibration
+    path = tmp_path / "parameters.safetensors"
+    path.write_bytes(dump_guide(guide))
+
+    loaded = load_guide(path)
+
+    for name, value in guide.median().items():
+        torch.testing.assert_close(loaded.median()[name], value)
+    result = sample(model_path, 10, 1.0, num_samples=5, inferred_parameters=loaded)
+    assert result["data"]["sample_id"].nunique() == 5
+
+
+def test_unsupported_guides_are_skipped():
+    assert dump_guide({"beta": 0.5}) is None
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+
+import pika
+import pytest
+
+from service.utils.rabbitmq import ProgressPublisher
+
+
+class FakeChannel:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def basic_publish(self, exchange, routing_key, body):
+        if self.broker.failures:
+            self.broker.failures -= 1
+            raise pika.exceptions.AMQPConnectionError("connection lost")
+        self.broker.messages.append(json.loads(body))
+
+
+class FakeBroker:
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.failures = 0
+        self.heartbeats = threading.Event()
+        self.broker_io = threading.Event()
+        self.broker_io.set()
+        self.closed_by = []
+
+    def __call__(self, _params):
+        self.connections += 1
+        broker = self
+
+        class Connection:
+            is_open = True
+
+            def channel(self):
+                return FakeChannel(broker)
+
+            def process_data_events(self, time_limit=0):
+                broker.heartbeats.set()
+                broker.broker_io.wait()
+
+            def close(self):
+                self.is_open = False
+                broker.closed_by.append(threading.current_thread())
+
+        return Connection()
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = FakeBroker()
+    monkeypatch.setattr(pika, "BlockingConnection", broker)
+    return broker
+
+
+class TestProgressPublisher:
+    def test_coalesces_and_flushes_latest(self, broker):
+        publisher = ProgressPublisher("job", max_per_second=2)
+        for progress in range(100):
+            publisher.publish({"progress": progress})
+        publisher.close()
+
+        assert broker.connections == 1
+        assert broker.messages[-1] == {"progress": 99}
+        assert publisher.published == len(broker.messages)
+        assert publisher.coalesced >= 90
+
+    def test_limits_the_rate_of_steady_publishes(self, broker):
+        publisher = ProgressPublisher("job", max_per_second=5)
+        started = time.monotonic()
+        for progress in range(100):
+            publisher.publish({"progress": progress})
+            time.sleep(0.01)
+        elapsed = time.monotonic() - started
+        sent = publisher.published
+        publisher.close()
+
+        assert sent <= elapsed * 5 + 2
+        assert broker.messages[-1] == {"progress": 99}
+
+    def test_publishes_every_k_calls(self, broker):
+        publisher = ProgressPublisher("job", max_per_second=10000, every=10)
+        for progress in range(95):
+            publisher.publish({"progress": progress})
+        publisher.close()
+
+        assert publisher.skipped == 85
+        assert broker.messages[-1] == {"progress": 94}
+
+    def test_reconnects_after_failure(self, broker):
+        broker.failures = 1
+        publisher = ProgressPublisher("job", max_per_second=10000)
+        publisher.publish({"progress": 1})
+        while not publisher.dropped:
+            time.sleep(0.01)
+        publisher.publish({"progress": 2})
+        publisher.close()
+
+        assert publisher.dropped == 1
+        assert broker.connections == 2
+        assert broker.messages == [{"progress": 2}]
+
+    def test_publish_does_not_wait_on_heartbeats(self, broker):
+        broker.broker_io.clear()
+        publisher = ProgressPublisher("job", max_per_second=10000)
+        assert broker.heartbeats.wait(timeout=5)
+
+        publishing = threading.Thread(target=publisher.publish, args=[{"progress": 1}])
+        publishing.start()
+        publishing.join(timeout=0.5)
+        waited = publishing.is_alive()
+
+        broker.broker_io.set()
+        assert not waited
+        publisher.close()
+        assert broker.messages == [{"progress": 1}]
+
+    def test_connection_is_closed_by_its_thread(self, broker):
+        publisher = ProgressPublisher("job")
+        publisher.publish({"progress": 1})
+        publisher.close()
+
+        assert broker.closed_by == [publisher.thread]
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from service.utils.tds import _grouped_result_summary, get_result_summary
+
+
+def make_result(num_timepoints=12, num_samples=25, seed=0):
+    rng = np.random.default_rng(seed)
+    timepoint_id, sample_id = np.meshgrid(
+        np.arange(num_timepoints), np.arange(num_samples)
+    )
+    return pd.DataFrame(
+        {
+            "timepoint_id": timepoint_id.ravel(),
+            "sample_id": sample_id.ravel(),
+            "timepoint_unknown": timepoint_id.ravel() * 0.5,
+            "persistent_beta_param": rng.random(timepoint_id.size),
+            "S_state": rng.normal(100, 10, timepoint_id.size),
+            "I_observable": rng.integers(0, 50, timepoint_id.size),
+        }
+    )
+
+
+@pytest.mark.parametrize("quantiles", [(), (0.05, 0.25, 0.75, 0.95)])
+def test_matches_groupby(quantiles):
+    data_result = make_result()
+
+    expected = _grouped_result_summary(data_result, quantiles)
+    actual = get_result_summary(data_result, quantiles)
+
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_missing_values_match_groupby():
+    data_result = make_result()
+    data_result.loc[::7, "S_state"] = np.nan
+
+    expected = _grouped_result_summary(data_result, (0.1,))
+    actual = get_result_summary(data_result, (0.1,))
+
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_ragged_results_fall_back_to_groupby():
+    data_result = make_result().iloc[:-3]
+
+    expected = _grouped_result_summary(data_result)
+    actual = get_result_summary(data_result)
+
+    pd.testing.assert_frame_equal(actual, expected)
@@ -0,0 +1,52 @@
+from fakeredis import FakeStrictRedis
+
+from service.models import Optimize, Simulate, SimulateBatch
+from service.settings import settings
+from service.utils.scheduling import route, track_active_job
+
+
+def simulate_request(**kwargs):
+    return Simulate(
+        model_config_id="sidarthe",
+        timespan={"start": 0, "end": 90},
+        extra={"num_samples": 100},
+        **kwargs,
+    )
+
+
+class TestRoute:
+    def test_routes_by_cost(self):
+        redis = FakeStrictRedis()
+        optimize = Optimize(
+            model_config_id="sidarthe",
+            optimize_interventions=[],
+            qoi=[],
+            extra={},
+        )
+
+        assert route(redis, simulate_request(), "simulate") == (
+            "high",
+            settings.JOB_TIMEOUTS["simulate"],
+        )
+        assert route(redis, optimize, "optimize") == (
+            "low",
+            settings.JOB_TIMEOUTS["optimize"],
+        )
+
+    def test_batch_timeout_scales_with_runs(self):
+        batch = SimulateBatch(
+            model_config_id="sidarthe",
+            policy_intervention_ids=[None, "a", "a", "b"],
+            extra={},
+        )
+        _, timeout = route(FakeStrictRedis(), batch, "simulate")
+        assert timeout == 3 * settings.JOB_TIMEOUTS["simulate"]
+
+    def test_fair_share_demotes_busy_users(self):
+        redis = FakeStrictRedis()
+        request = simulate_request(user_id="busy")
+        for job_id in range(settings.USER_FAIR_SHARE):
+            track_active_job(redis, "busy", str(job_id))
+
+        assert route(redis, request, "simulate")[0] == "default"
+        assert route(redis, simulate_request(user_id="idle"), "simulate")[0] == "high"
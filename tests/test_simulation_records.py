@@ -0,0 +1,121 @@
+import pytest
+
+from service.utils import tds
+from service.utils.cache import LRUCache
+
+TDS_URL = "http://tds"
+SIMULATION_URL = f"{TDS_URL}/simulations/job"
+
+
+@pytest.fixture
+def simulation(monkeypatch, requests_mock):
+    monkeypatch.setattr(tds, "TDS_URL", TDS_URL)
+    monkeypatch.setattr(tds, "simulation_records", LRUCache(10))
+    stored = {"record": {"id": "job", "status": "queued"}, "version": 1}
+
+    def get(request, context):
+        context.headers["ETag"] = f'"{stored["version"]}"'
+        return stored["record"]
+
+    def put(request, context):
+        if request.headers.get("If-Match") != f'"{stored["version"]}"':
+            context.status_code = 412
+            return {}
+        stored["record"] = request.json()
+        stored["version"] += 1
+        context.headers["ETag"] = f'"{stored["version"]}"'
+        return stored["record"]
+
+    stored["get"] = requests_mock.get(SIMULATION_URL, json=get)
+    stored["put"] = requests_mock.put(SIMULATION_URL, json=put)
+    return stored
+
+
+def test_status_updates_cost_one_request(simulation):
+    tds.update_tds_status("job", "running", start=True)
+    tds.update_tds_status("job", "complete", result_files=["result.csv"], finish=True)
+
+    assert simulation["get"].call_count == 1
+    assert simulation["put"].call_count == 2
+    record = simulation["record"]
+    assert record["status"] == "complete"
+    assert record["result_files"] == ["result.csv"]
+    assert "start_time" in record and "completed_time" in record
+    # Finished jobs aren't kept
+    assert tds.simulation_records.get("job") is None
+
+
+def test_cancel_wins_over_completion(simulation):
+    tds.update_tds_status("job", "running", start=True)
+    # The API cancels the job while the worker is finishing it
+    simulation["record"] = {**simulation["record"], "status": "cancelled"}
+    simulation["version"] += 1
+
+    assert tds.update_tds_status("job", "complete", finish=True) is None
+
+    assert simulation["record"]["status"] == "cancelled"
+    assert simulation["put"].call_count == 2
+
+
+def test_cancel(simulation):
+    tds.cancel_tds_job("job")
+
+    assert simulation["record"]["status"] == "cancelled"
+    assert simulation["put"].last_request.headers["If-Match"] == '"1"'
+
+
+def test_cancel_wins_without_etag(monkeypatch, requests_mock):
+    monkeypatch.setattr(tds, "TDS_URL", TDS_URL)
+    monkeypatch.setattr(tds, "simulation_records", LRUCache(10))
+    stored = {"record": {"id": "job", "status": "queued"}}
+
+    def put(request, context):
+        stored["record"] = request.json()
+        return stored["record"]
+
+    get = requests_mock.get(SIMULATION_URL, json=lambda *_: stored["record"])
+    put = requests_mock.put(SIMULATION_URL, json=put)
+
+    tds.update_tds_status("job", "running", start=True)
+    # Nothing to make the next PUT conditional on, so nothing is kept
+    assert tds.simulation_records.get("job") is None
+    stored["record"] = {**stored["record"], "status": "cancelled"}
+
+    assert tds.update_tds_status("job", "complete", finish=True) is None
+
+    assert stored["record"]["status"] == "cancelled"
+    assert get.call_count == 2
+    assert put.call_count == 1
+
+
+def test_artifacts_are_uploaded_as_they_are_serialized(monkeypatch):
+    events = []
+    monkeypatch.setattr(
+        tds,
+        "upload_file",
+        lambda job_id, handle, content: events.append(("upload", job_id, handle)),
+    )
+
+    def files():
+        for handle in ["calibration.json", "visualization.json"]:
+            events.append(("serialize", handle))
+            yield handle, b"{}"
+
+    handles = tds.upload_artifacts(["a", "b"], files())
+
+    assert handles == ["calibration.json", "visualization.json"]
+    assert events[0] == ("serialize", "calibration.json")
+    assert sorted(events[1:3]) == [
+        ("upload", "a", "calibration.json"),
+        ("upload", "b", "calibration.json"),
+    ]
+    assert events[3] == ("serialize", "visualization.json")
+
+
+def test_serialized_artifacts():
+    output = {"calibration": {"iterations_run": 5}, "visual": {"marks": []}}
+
+    files = dict(tds.serialize_files(output, "job"))
+
+    assert list(files) == ["calibration.json", "visualization.json"]
+    assert files["calibration.json"] == b'{\n  "iterations_run": 5\n}'